@@ -0,0 +1,4 @@
+"""
+ Reproducible benchmarks for the greedy query reduction pipeline
+
+"""
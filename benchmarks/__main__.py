@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark the greedy pipeline stage by stage on synthetic tracks
+
+Example
+-------
+python -m benchmarks --scenarios 1e3 1e4 --output benchmark.json
+"""
+import json
+import time
+import platform
+import argparse
+import multiprocessing
+
+from .run import SCENARIOS, run_scenario, git_commit
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument(
+    "--scenarios",
+    nargs="+",
+    default=["1e3", "1e4"],
+    choices=list(SCENARIOS),
+    help="scenarios to run, default 1e3 1e4",
+)
+parser.add_argument(
+    "--output", "-o", default="benchmark.json", help="json file for the results"
+)
+parser.add_argument("--temporal-buffer", "-t", type=float, default=900)
+parser.add_argument("--distance-buffer", "-d", type=float, default=100)
+parser.add_argument("--coef", "-c", type=float, default=0)
+parser.add_argument("--seed", type=int, default=0)
+parser.add_argument(
+    "--index", choices=["rtree", "grid"], default="rtree", help="greedy's spatial index"
+)
+parser.add_argument(
+    "--engine",
+    choices=["greedy", "rounds"],
+    default="greedy",
+    help="greedy loop to time, rounds is also compared with greedy's result",
+)
+parser.add_argument(
+    "--sample-interval", type=float, default=10.0, help="seconds between points"
+)
+parser.add_argument("--speed", type=float, default=5.0, help="meters per second")
+parser.add_argument(
+    "--spread", type=float, default=50_000.0, help="half width of the area in meters"
+)
+parser.add_argument(
+    "--clusters", type=int, default=4, help="number of dense areas tracks start in"
+)
+parser.add_argument(
+    "--cluster-fraction",
+    type=float,
+    default=0.5,
+    help="fraction of tracks starting in a dense area",
+)
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    # a fresh process per scenario so the peak memory is the scenario's own
+    context = multiprocessing.get_context("spawn")
+    scenarios = []
+    for name in args.scenarios:
+        workload = dict(
+            SCENARIOS[name],
+            sample_interval=args.sample_interval,
+            speed=args.speed,
+            spread=args.spread,
+            clusters=args.clusters,
+            cluster_fraction=args.cluster_fraction,
+            seed=args.seed,
+        )
+        with context.Pool(1) as pool:
+            result = pool.apply(
+                run_scenario,
+                (
+                    name,
+                    workload,
+                    args.temporal_buffer,
+                    args.distance_buffer,
+                    args.coef,
+                    args.index,
+                    args.engine,
+                ),
+            )
+        print(
+            f"{name}: {result['points']} points -> {result['queries']} queries, "
+            + ", ".join(f"{k} {v:.3f}s" for k, v in result["stages"].items())
+        )
+        if result["quality"] is not None:
+            quality = result["quality"]
+            print(
+                f"{name}: greedy {quality['greedy_queries']} queries, "
+                f"volume ratio {quality['volume_ratio']:.4f}"
+            )
+        scenarios.append(result)
+
+    report = {
+        "commit": git_commit(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {
+            "temporal_buffer": args.temporal_buffer,
+            "distance_buffer": args.distance_buffer,
+            "coef": args.coef,
+            "index": args.index,
+            "engine": args.engine,
+        },
+        "scenarios": scenarios,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+ Stage by stage timing of the greedy pipeline on one synthetic workload
+
+"""
+import os
+import time
+import tempfile
+import subprocess
+from contextlib import contextmanager
+
+import numpy as np
+
+from final_project.ingest import read_points
+from final_project.algorithms.generator import projected_output_from_bounds, write_kml
+from final_project.algorithms.greedy import greedy, create_index
+from final_project.algorithms.prism import PrismArray
+from final_project.algorithms.profiling import Profiler, peak_rss_mb
+from final_project.algorithms.projection import transform
+from final_project.algorithms.rounds import round_greedy
+from final_project.algorithms.utils import overlapping_pairs
+from final_project.algorithms.utils import padded_boxes, combined_boxes, delta_cs
+from final_project.algorithms.utils import df_for_greedy, box_volumes
+
+from .synthetic import synthetic_tracks
+
+# points per track and sampling keep the density per point about the same
+SCENARIOS = {
+    "1e3": {"points": 1_000, "entities": 10},
+    "1e4": {"points": 10_000, "entities": 100},
+    "1e5": {"points": 100_000, "entities": 1_000},
+    "1e6": {"points": 1_000_000, "entities": 10_000},
+}
+
+
+def run_scenario(
+    name,
+    workload,
+    temporal_buffer,
+    distance_buffer,
+    coef,
+    index="rtree",
+    engine="greedy",
+):
+    """runs every stage of the pipeline once and times each one
+
+    :param name: scenario name
+    :type name: str
+    :param workload: keyword arguments for synthetic_tracks
+    :type workload: Dict
+    :param temporal_buffer: time buffer in seconds
+    :type temporal_buffer: Float
+    :param distance_buffer: distance buffer in meters
+    :type distance_buffer: Float
+    :param coef: algorithm coefficient
+    :type coef: Float
+    :param index: spatial index greedy uses, "rtree" or "grid"
+    :type index: str
+    :param engine: "greedy", or "rounds" (rounds.round_greedy), which is also
+        compared with greedy's result
+    :type engine: str
+    ...
+    :return: scenario results
+    :rtype: Dict
+    """
+    stages = {}
+
+    @contextmanager
+    def stage(stage_name):
+        start = time.perf_counter()
+        yield
+        stages[stage_name] = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "points.csv")
+        synthetic_tracks(**workload).to_csv(path, index=False)
+
+        with stage("ingestion"):
+            points = read_points(path, lat=0, lon=1, time=2, name=3)
+
+        with stage("projection"):
+            xs, ys = transform(
+                "epsg:4326", "epsg:3857", points.longitude, points.latitude
+            )
+
+        with stage("prism_creation"):
+            prisms = PrismArray(
+                x=xs,
+                y=ys,
+                timestamp=points.timestamp,
+                x_buffer=distance_buffer,
+                y_buffer=distance_buffer,
+                temporal_buffer=temporal_buffer,
+                lon=points.longitude,
+                lat=points.latitude,
+                names=points.name,
+            )
+            df = df_for_greedy(prisms)
+
+        bounds = prisms.bounds
+        padded = padded_boxes(bounds, coef=coef)
+        with stage("index_build"):
+            rtree_index = create_index(bounds, index=index)
+
+        with stage("candidate_generation"):
+            box_1, box_2 = overlapping_pairs(bounds, padded, rtree_index)
+            merged = combined_boxes(bounds[box_1], bounds[box_2])
+            delta_cs(bounds[box_1], bounds[box_2], merged, coef=coef)
+
+        # greedy repeats the index build and candidate generation internally,
+        # its profile separates the loop itself
+        profiler = Profiler()
+        if engine == "rounds":
+            results = round_greedy(df, coef, index=index, profiler=profiler)
+        else:
+            results = greedy(df, coef, profiler=profiler, index=index)
+        stages["greedy_loop"] = profiler.phases.get("greedy_loop", {}).get("wall", 0.0)
+
+        with stage("output"):
+            result_bounds = [tuple(b) for b in results.bounds]
+            df_res, _ = projected_output_from_bounds(result_bounds, kml=False)
+            write_kml(os.path.join(tmp, "out.kml"), df_res.to_numpy())
+            df_res.to_csv(os.path.join(tmp, "out.csv"), index=False)
+
+    # the rounds engine's result next to the exact greedy's, outside the stages
+    quality = None
+    if engine == "rounds":
+        start = time.perf_counter()
+        exact = greedy(df, coef, index=index)
+        quality = {
+            "queries": int(len(results)),
+            "greedy_queries": int(len(exact)),
+            "total_volume": float(_total_volume(results)),
+            "greedy_total_volume": float(_total_volume(exact)),
+            "greedy_runtime": time.perf_counter() - start,
+        }
+        quality["volume_ratio"] = quality["total_volume"] / max(
+            quality["greedy_total_volume"], 1e-12
+        )
+
+    return {
+        "name": name,
+        "points": len(points),
+        "workload": workload,
+        "index": index,
+        "engine": engine,
+        "candidate_pairs": int(len(box_1)),
+        "queries": int(len(results)),
+        "reduction_ratio": len(results) / max(len(points), 1),
+        "stages": stages,
+        "total": sum(stages.values()),
+        "greedy_profile": profiler.to_dict(),
+        "quality": quality,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def _total_volume(results):
+    """summed volume of the result boxes, m^2 s"""
+    bounds = np.array(results.bounds.tolist(), dtype=np.float64).reshape(-1, 6)
+    return box_volumes(bounds).sum()
+
+
+def git_commit():
+    """commit the benchmark ran on, None outside of a git checkout"""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+ Synthetic spatio-temporal workloads, tracks of moving entities
+
+"""
+import numpy as np
+import pandas as pd
+
+METERS_PER_DEGREE = 111_320.0
+
+
+def synthetic_tracks(
+    points,
+    entities=None,
+    sample_interval=10.0,
+    speed=5.0,
+    spread=50_000.0,
+    clusters=4,
+    cluster_fraction=0.5,
+    cluster_radius=2_000.0,
+    duration=6 * 3600.0,
+    origin=(38.85, -77.04),
+    start_time=1615596484.0,
+    seed=0,
+):
+    """Generates tracks of entities moving with a random walk heading, in the same
+    lat, lon, timestamp, name layout the CLI reads
+
+    :param points: total number of points
+    :type points: Int
+    :param entities: number of tracks, defaults to one per 100 points
+    :type entities: Int
+    :param sample_interval: seconds between points of one track (1 / sampling rate)
+    :type sample_interval: Float
+    :param speed: entity speed in meters per second
+    :type speed: Float
+    :param spread: half width in meters of the area the tracks start in
+    :type spread: Float
+    :param clusters: number of dense areas (airports) tracks can start around
+    :type clusters: Int
+    :param cluster_fraction: fraction of tracks starting in a dense area
+    :type cluster_fraction: Float
+    :param cluster_radius: standard deviation in meters of a dense area
+    :type cluster_radius: Float
+    :param duration: seconds over which the tracks start
+    :type duration: Float
+    :param origin: (lat, lon) of the center of the area
+    :type origin: Tuple
+    :param start_time: epoch seconds of the first point
+    :type start_time: Float
+    :param seed: random seed, the same arguments always give the same points
+    :type seed: Int
+    ...
+    :return: dataframe with latitude, longitude, timestamp, name columns
+    :rtype: pandas.DataFrame
+    """
+    rng = np.random.default_rng(seed)
+    entities = entities or max(points // 100, 1)
+
+    # split the points over the tracks
+    lengths = np.full(entities, points // entities)
+    lengths[: points % entities] += 1
+    track = np.repeat(np.arange(entities), lengths)
+    step = np.arange(points) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+    # starting positions, some around the cluster centers, the rest uniform
+    centers = rng.uniform(-spread, spread, size=(max(clusters, 1), 2))
+    clustered = rng.random(entities) < (cluster_fraction if clusters else 0.0)
+    start = rng.uniform(-spread, spread, size=(entities, 2))
+    start[clustered] = centers[
+        rng.integers(0, len(centers), clustered.sum())
+    ] + rng.normal(0, cluster_radius, size=(clustered.sum(), 2))
+
+    # random walk heading, integrated per track
+    heading = rng.uniform(0, 2 * np.pi, entities)[track] + _track_cumsum(
+        rng.normal(0, 0.05, points), lengths
+    )
+    dx = speed * sample_interval * np.cos(heading)
+    dy = speed * sample_interval * np.sin(heading)
+    x = start[track, 0] + _track_cumsum(dx, lengths) - dx
+    y = start[track, 1] + _track_cumsum(dy, lengths) - dy
+
+    t0 = start_time + rng.uniform(0, duration, entities)
+    timestamps = t0[track] + step * sample_interval
+
+    lat0, lon0 = origin
+    return pd.DataFrame(
+        {
+            "latitude": lat0 + y / METERS_PER_DEGREE,
+            "longitude": lon0
+            + x / (METERS_PER_DEGREE * np.cos(np.radians(lat0))),
+            "timestamp": np.round(timestamps),
+            "name": np.char.add("N", track.astype(str)),
+        }
+    )
+
+
+def _track_cumsum(values, lengths):
+    """cumulative sum restarting at the first point of every track"""
+    total = np.cumsum(values)
+    offsets = np.concatenate([[0.0], total])[np.cumsum(lengths) - lengths]
+    return total - np.repeat(offsets, lengths)
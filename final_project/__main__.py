@@ -3,11 +3,22 @@ import sys
 import logging
 import argparse
 import datetime
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
+import numpy as np
 import pandas as pd
 
-from .algorithms.generator import prisms_projected_output, create_prisms_by_ll
+from .algorithms.generator import projected_output_from_bounds, create_prisms_by_ll
+from .algorithms.generator import write_kml, write_placemarks
+from .algorithms.generator import KML_HEADER, KML_FOOTER
 from .algorithms.greedy import Greedy
+from .algorithms.history import MergeHistory
+from .algorithms.profiling import Profiler, get_profiler
+from .algorithms.sweep import sweep
+from .algorithms.windows import windowed_greedy
+from .cache import ResultCache, cache_key, DEFAULT_CACHE_DIR
+from .ingest import read_points, sort_points
 
 DESC = """
 Cronos Greedy Algorithm Script
@@ -24,8 +35,8 @@ parser.add_argument(
     "--file-path",
     "-f",
     required=True,
-    help="location of the csv or excel file containing the columns lat, \
-            long, timestamp, names",
+    help="location of the csv (optionally gzip), parquet, arrow or excel file \
+            containing the columns lat, long, timestamp, names",
 )
 parser.add_argument(
     "--lat",
@@ -51,6 +62,12 @@ parser.add_argument(
     type=int,
     help="location of the name col in the excel or csv, for reference 0 is column A in excel",
 )
+parser.add_argument(
+    "--chunksize",
+    type=int,
+    default=1_000_000,
+    help="number of input rows read at once",
+)
 parser.add_argument(
     "--job-name",
     "-n",
@@ -68,22 +85,145 @@ parser.add_argument(
     "--coef",
     "-c",
     type=int,
-    default=0,
-    help="algorithm coefficient, default 0",
+    nargs="+",
+    default=[0],
+    help="algorithm coefficient, default 0, several with --sweep",
 )
 parser.add_argument(
     "--temporal-buffer",
     "-t",
     type=int,
-    default=30 * 60,  # 30 mins
-    help="time buffer in seconds",
+    nargs="+",
+    default=[30 * 60],  # 30 mins
+    help="time buffer in seconds, several with --sweep",
 )
 parser.add_argument(
     "--distance-buffer",
     "-d",
     type=int,
-    default=100,  # 100 meters
-    help="distance buffer in meters",
+    nargs="+",
+    default=[100],  # 100 meters
+    help="distance buffer in meters, several with --sweep",
+)
+parser.add_argument(
+    "--rtree-leaf-capacity",
+    type=int,
+    default=None,
+    help="max boxes per rtree leaf node, libspatialindex default if not set",
+)
+parser.add_argument(
+    "--rtree-fill-factor",
+    type=float,
+    default=None,
+    help="fraction of each rtree node filled when bulk loading",
+)
+parser.add_argument(
+    "--presort",
+    action="store_true",
+    help="feed boxes to the rtree bulk loader in sort-tile-recursive order",
+)
+parser.add_argument(
+    "--index",
+    choices=["rtree", "grid"],
+    default="rtree",
+    help="spatial index of the boxes, the grid deletes merged boxes in O(1), default rtree",
+)
+parser.add_argument(
+    "--engine",
+    choices=["greedy", "rounds"],
+    default="greedy",
+    help="rounds merges a whole matching of pairs per round, far fewer iterations \
+            and a result close to greedy's, default greedy",
+)
+parser.add_argument(
+    "--top-k",
+    type=int,
+    default=None,
+    help="hold only the k best merge candidates per box, bounds the memory in dense areas",
+)
+parser.add_argument(
+    "--compact-candidates",
+    action="store_true",
+    help="hold the initial merge candidates in a numpy record array",
+)
+parser.add_argument(
+    "--group-by-name",
+    action="store_true",
+    help="only merge points of the same name (track), every track is compressed first",
+)
+parser.add_argument(
+    "--min-overlap",
+    type=float,
+    default=0.5,
+    help="fraction of a prism that must overlap the prisms before it in its track \
+            to be collapsed into them with --group-by-name, default 0.5",
+)
+parser.add_argument(
+    "--workers",
+    "-w",
+    type=int,
+    default=None,
+    help="run independent groups of boxes in this many processes, default 1, with \
+            --sweep the combinations, default the number of cpus",
+)
+parser.add_argument(
+    "--time-budget",
+    type=float,
+    default=None,
+    help="seconds for the greedy loop, when they run out the merges done so far are \
+            written",
+)
+parser.add_argument(
+    "--max-merges",
+    type=int,
+    default=None,
+    help="stop the greedy loop after this many merges (per worker task)",
+)
+parser.add_argument(
+    "--profile",
+    default=None,
+    help="write phase timings, peak memory and greedy counters to this json file",
+)
+parser.add_argument(
+    "--sweep",
+    action="store_true",
+    help="run every combination of the --coef, -t and -d values on the file loaded \
+            once, writes a csv per combination and a job_name_sweep.csv summary",
+)
+parser.add_argument(
+    "--window",
+    type=float,
+    default=None,
+    help="process the file in time windows of this many seconds, sorted on disk \
+            first, so only a window has to fit in memory, results are written as \
+            each window completes, the result cache is not used",
+)
+parser.add_argument(
+    "--sort-dir",
+    default=None,
+    help="directory for the sorted runs of --window, the system temp dir by default",
+)
+parser.add_argument(
+    "--history",
+    default=None,
+    help="record every merge to this .npz file, see algorithms.history.MergeHistory \
+            to replay it for a query budget",
+)
+parser.add_argument(
+    "--no-cache",
+    action="store_true",
+    help="always run the algorithm, neither read nor write the result cache",
+)
+parser.add_argument(
+    "--cache-dir",
+    default=DEFAULT_CACHE_DIR,
+    help=f"directory of the result cache, default {DEFAULT_CACHE_DIR}",
+)
+parser.add_argument(
+    "--cache-size",
+    type=float,
+    default=1024,
+    help="size limit of the result cache in MB, least recently used results are evicted",
 )
 parser.add_argument(
     "--report",
@@ -98,69 +238,326 @@ parser.add_argument(
     help="output path for the file, will save as output_path/job_name.csv",
 )
 
-if __name__ == "__main__":
 
-    args = parser.parse_args()
-    logging.basicConfig(format="%(levelname)s:%(message)s", level=logging.INFO)
+def greedy_options(args):
+    """the keyword arguments of Greedy.run that args sets, the same for a job
+    and every combination of a sweep
+
+    :param args: parsed command line arguments
+    :type args: argparse.Namespace
+    ...
+    :return: keyword arguments for Greedy.run
+    :rtype: Dict
+    """
+    return {
+        "rtree_properties": {
+            "presort": args.presort,
+            "leaf_capacity": args.rtree_leaf_capacity,
+            "fill_factor": args.rtree_fill_factor,
+        },
+        "top_k": args.top_k,
+        "compact": args.compact_candidates,
+        "group_by_name": args.group_by_name,
+        "min_overlap": args.min_overlap,
+        "index": args.index,
+        "time_budget": args.time_budget,
+        "max_merges": args.max_merges,
+        "engine": args.engine,
+    }
 
-    # Load the configuration
-    if not os.path.exists(args.file_path):
-        print("Invalid file: %s" % args.file_path)
-        sys.exit(-1)
 
-    # read data into pandas df, try reading csv, otherwise excel
-    logging.info("Loading data from file: %s" % args.file_path)
-    try:
-        df = pd.read_csv(args.file_path)
-    except:
-        df = pd.read_excel(args.file_path)
-
-    logging.info("Configuring lat, long, timestamp, name mappings")
-    df = df.iloc[:, [args.lat, args.lon, args.time, args.name]]
-    df.columns = ["latitude", "longitude", "timestamp", "name"]
-
-    # remove nans
-    df = df.dropna()  # drops rows with nans
-    df = df.reset_index(drop=True)  # reset index
-
-    # this will need to be re-worked probably
-    if df["timestamp"].dtype == object and isinstance(df.iloc[0]["timestamp"], str):
-        df["timestamp"] = df.timestamp.apply(
-            lambda date: datetime.datetime.strptime(date, "%Y-%m-%dT%H:%M:%S.%fZ")
+def run_job(points, args, profiler):
+    """greedy on the points with the parameters of args, or the cached results
+
+    :param points: dataframe with latitude, longitude, timestamp, name columns
+    :type points: pandas.DataFrame
+    :param args: parsed command line arguments
+    :type args: argparse.Namespace
+    :param profiler: records phase timings
+    :type profiler: profiling.Profiler
+    ...
+    :return: (N,6) lat/lon bounds of the queries
+    :rtype: numpy.ndarray
+    """
+    # the same points and parameters give the same queries, only the job
+    # metadata below differs between runs
+    cache, key, ll_bounds = None, None, None
+    if not args.no_cache and not args.history:
+        with profiler.phase("cache_lookup"):
+            cache = ResultCache(args.cache_dir, int(args.cache_size * 2**20))
+            key = cache_key(
+                points,
+                {
+                    "temporal_buffer": args.temporal_buffer[0],
+                    "distance_buffer": args.distance_buffer[0],
+                    "coef": args.coef[0],
+                    "engine": args.engine,
+                    "group_by_name": args.group_by_name,
+                    "min_overlap": args.min_overlap if args.group_by_name else None,
+                },
+            )
+            ll_bounds = cache.get(key)
+        if ll_bounds is not None:
+            logging.info(f"Using cached results {key}")
+
+    if ll_bounds is None:
+        logging.info("Generating prisms")
+        in_prisms = create_prisms_by_ll(
+            points.longitude,
+            points.latitude,
+            points.timestamp,
+            points.name,
+            temporal_buffer=args.temporal_buffer[0],
+            x_buffer=args.distance_buffer[0],
+            y_buffer=args.distance_buffer[0],
+            profiler=profiler,
         )
-        timestamps = list(df.timestamp)
-        df["timestamp"] = [t.timestamp() for t in timestamps]
-
-    logging.info("Generating prisms")
-    in_prisms = create_prisms_by_ll(
-        df.longitude,
-        df.latitude,
-        df.timestamp,
-        df.name,
-        temporal_buffer=args.temporal_buffer,
-        x_buffer=args.distance_buffer,
-        y_buffer=args.distance_buffer,
-    )
 
-    logging.info("Run Greedy Alg")
-    greedy = Greedy()
-    out_prisms = greedy.run(in_prisms, args.coef)
+        logging.info("Run Greedy Alg")
+        greedy = Greedy()
+        history = MergeHistory() if args.history else None
+        greedy.run(
+            in_prisms,
+            args.coef[0],
+            workers=args.workers,
+            build_prisms=False,
+            profiler=profiler,
+            history=history,
+            **greedy_options(args),
+        )
+        if history is not None:
+            logging.info(f"Saving merge history to {args.history}")
+            history.save(args.history)
+
+        logging.info("Projecting results")
+        df_res, _ = projected_output_from_bounds(
+            greedy.out_bounds, kml=False, profiler=profiler
+        )
+        ll_bounds = df_res.to_numpy(dtype=np.float64)
+        # a run cut short by a budget is not the job's result
+        limited = args.time_budget is not None or args.max_merges is not None
+        if cache is not None and not limited:
+            cache.put(key, ll_bounds)
 
-    logging.info("Generating kml & csv")
-    df_res, kml = prisms_projected_output(out_prisms)
+    return ll_bounds
 
-    df_res["tmin"] = df_res.tmin.apply(
-        lambda date: datetime.datetime.fromtimestamp(date)
+
+def run_sweep(points, args, profiler):
+    """every combination of the coef and buffer values of args, writes a csv
+    per combination and a summary csv
+
+    :param points: dataframe with latitude, longitude, timestamp, name columns
+    :type points: pandas.DataFrame
+    :param args: parsed command line arguments
+    :type args: argparse.Namespace
+    :param profiler: records phase timings
+    :type profiler: profiling.Profiler
+    """
+    summary, results = sweep(
+        points.longitude,
+        points.latitude,
+        points.timestamp,
+        points.name,
+        args.coef,
+        args.temporal_buffer,
+        args.distance_buffer,
+        workers=args.workers,
+        profiler=profiler,
+        options=greedy_options(args),
     )
-    df_res["tmax"] = df_res.tmax.apply(
-        lambda date: datetime.datetime.fromtimestamp(date)
+
+    files = []
+    for row, ll_bounds in zip(summary.itertuples(), results):
+        job_name = "_".join(
+            [
+                args.job_name,
+                f"c{row.coef}",
+                f"t{row.temporal_buffer}",
+                f"d{row.distance_buffer}",
+            ]
+        )
+        write_results(ll_bounds, job_name, args, kml=False, profiler=profiler)
+        files.append(job_name + ".csv")
+    summary["file"] = files
+
+    path = os.path.join(args.output_path, args.job_name + "_sweep.csv")
+    logging.info(f"Saving sweep summary to {path}")
+    logging.info("\n" + summary.to_string(index=False))
+    summary.to_csv(path, index=False)
+
+
+def write_results(ll_bounds, job_name, args, kml=True, profiler=None):
+    """stamps the job metadata on the queries and writes the csv and kml
+
+    :param ll_bounds: (N,6) lat/lon bounds of the queries
+    :type ll_bounds: numpy.ndarray
+    :param job_name: name of the output files
+    :type job_name: str
+    :param args: parsed command line arguments
+    :type args: argparse.Namespace
+    :param kml: also write the kml
+    :type kml: Bool
+    :param profiler: records the write_output phase
+    :type profiler: profiling.Profiler
+    """
+    profiler = get_profiler(profiler)
+    logging.info(f"Generating {'kml & ' if kml else ''}csv")
+    df_res = results_frame(ll_bounds, job_name, args)
+
+    # the kml is streamed placemark by placemark while the csv is written
+    logging.info(f"Saving files to {args.output_path}")
+    with profiler.phase("write_output"), ThreadPoolExecutor(max_workers=2) as pool:
+        writes = [
+            pool.submit(
+                df_res.to_csv,
+                os.path.join(args.output_path, job_name + ".csv"),
+                index=False,
+            ),
+        ]
+        if kml:
+            writes.append(
+                pool.submit(
+                    write_kml,
+                    os.path.join(args.output_path, job_name + ".kml"),
+                    ll_bounds,
+                )
+            )
+        for write in writes:
+            write.result()
+
+
+def results_frame(ll_bounds, job_name, args):
+    """the queries with the job metadata, as the csv has them
+
+    :param ll_bounds: (N,6) lat/lon bounds of the queries
+    :type ll_bounds: numpy.ndarray
+    :param job_name: name of the job
+    :type job_name: str
+    :param args: parsed command line arguments
+    :type args: argparse.Namespace
+    ...
+    :return: dataframe of the csv rows
+    :rtype: pandas.DataFrame
+    """
+    df_res = pd.DataFrame(
+        ll_bounds, columns=["xmin", "ymin", "tmin", "xmax", "ymax", "tmax"]
     )
+
+    # tmin/tmax in UTC, the same times the kml timespans use
+    df_res["tmin"] = pd.to_datetime(df_res.tmin, unit="s").dt.round("us")
+    df_res["tmax"] = pd.to_datetime(df_res.tmax, unit="s").dt.round("us")
     df_res["status"] = "created"
     df_res["update_time"] = datetime.datetime.now()
     df_res["justification"] = args.justification
-    df_res["job_name"] = args.job_name
+    df_res["job_name"] = job_name
     df_res["url"] = None
+    return df_res
 
-    logging.info(f"Saving files to {args.output_path}")
-    kml.save(os.path.join(args.output_path, args.job_name + ".kml"))
-    df_res.to_csv(os.path.join(args.output_path, args.job_name + ".csv"), index=False)
+
+def run_windows(args, profiler):
+    """greedy on the file a time window at a time, out of core, see
+    algorithms.windows.windowed_greedy. The file is sorted by timestamp on disk
+    and the queries of every window are appended to the csv and kml as soon as
+    they are final
+
+    :param args: parsed command line arguments
+    :type args: argparse.Namespace
+    :param profiler: records phase timings
+    :type profiler: profiling.Profiler
+    """
+    logging.info("The result cache is not used with --window")
+    with tempfile.TemporaryDirectory(dir=args.sort_dir) as directory:
+        logging.info(f"Sorting {args.file_path} by timestamp into {directory}")
+        with profiler.phase("external_sort"):
+            runs = sort_points(
+                args.file_path,
+                lat=args.lat,
+                lon=args.lon,
+                time=args.time,
+                name=args.name,
+                directory=directory,
+                chunksize=args.chunksize,
+            )
+        logging.info(f"{len(runs)} points sorted into {len(runs.runs)} runs")
+
+        path = os.path.join(args.output_path, args.job_name)
+        logging.info(f"Saving files to {args.output_path} window by window")
+        with open(path + ".csv", "w", newline="") as csv_file, open(
+            path + ".kml", "w", encoding="utf-8"
+        ) as kml_file:
+            kml_file.write(KML_HEADER)
+            header = True
+            for ll_bounds in windowed_greedy(
+                (points for _, points in runs.windows(args.window)),
+                args.temporal_buffer[0],
+                args.distance_buffer[0],
+                coef=args.coef[0],
+                index=args.index,
+                rtree_properties=greedy_options(args)["rtree_properties"],
+                profiler=profiler,
+            ):
+                with profiler.phase("write_output"):
+                    results_frame(ll_bounds, args.job_name, args).to_csv(
+                        csv_file, header=header, index=False
+                    )
+                    write_placemarks(kml_file, ll_bounds)
+                header = False
+            kml_file.write(KML_FOOTER)
+
+
+if __name__ == "__main__":
+
+    args = parser.parse_args()
+    values = [args.coef, args.temporal_buffer, args.distance_buffer]
+    if not args.sweep and any(len(v) > 1 for v in values):
+        parser.error("several --coef, -t or -d values need --sweep")
+    if args.sweep and args.history:
+        parser.error("--history records one job, not a --sweep")
+    if args.window is not None:
+        unsupported = {
+            "--sweep": args.sweep,
+            "--history": args.history,
+            "--group-by-name": args.group_by_name,
+            "--engine rounds": args.engine != "greedy",
+            "--workers": args.workers is not None and args.workers > 1,
+            "--top-k": args.top_k is not None,
+            "--compact-candidates": args.compact_candidates,
+            "--time-budget": args.time_budget is not None,
+            "--max-merges": args.max_merges is not None,
+        }
+        flags = [flag for flag, value in unsupported.items() if value]
+        if flags:
+            parser.error(f"--window does not support {', '.join(flags)}")
+    logging.basicConfig(format="%(levelname)s:%(message)s", level=logging.INFO)
+
+    # Load the configuration
+    if not os.path.exists(args.file_path):
+        print("Invalid file: %s" % args.file_path)
+        sys.exit(-1)
+
+    profiler = get_profiler(Profiler() if args.profile else None)
+
+    if args.window is not None:
+        run_windows(args, profiler)
+    else:
+        # read only the lat, long, timestamp, name columns, timestamps as epoch seconds
+        logging.info("Loading data from file: %s" % args.file_path)
+        with profiler.phase("ingestion"):
+            df = read_points(
+                args.file_path,
+                lat=args.lat,
+                lon=args.lon,
+                time=args.time,
+                name=args.name,
+                chunksize=args.chunksize,
+            )
+
+        if args.sweep:
+            run_sweep(df, args, profiler)
+        else:
+            ll_bounds = run_job(df, args, profiler)
+            write_results(ll_bounds, args.job_name, args, profiler=profiler)
+
+    if args.profile:
+        logging.info(f"Saving profile to {args.profile}")
+        profiler.dump(args.profile)
@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import heapq
+
+import numpy as np
+
+# a compact candidate, 33 bytes instead of a tuple of python objects
+CANDIDATE_DTYPE = np.dtype(
+    [
+        ("delta_c", np.float64),
+        ("seq", np.int64),
+        ("box_1", np.int64),
+        ("box_2", np.int64),
+        ("refill", np.bool_),
+    ]
+)
+
+
+class CandidateQueue:
+    """Priority queue of merge candidates keyed on delta_c
+
+    Candidates are never removed when one of their boxes is merged, instead they
+    are discarded lazily when they reach the top of the heap and one of their
+    boxes is no longer active, stale counts how many were discarded.
+
+    With k set only the k best candidates of each box are queued, box_1 of a
+    candidate is the box it belongs to. The rest are replaced by one refill entry
+    at the best delta_c left out, when it reaches the top refill(box_1_uuid) is
+    called for all of the box's candidates again and the next k best are queued,
+    so the boxes are merged in the same order with memory linear in the boxes.
+
+    With compact set the candidates added before the first pop, the initial
+    overlap join and by far the largest part, are kept as a sorted NumPy record
+    array (CANDIDATE_DTYPE) instead of a heap of tuples.
+
+    :param active: container of the unique_ids that are currently active boxes
+    :type active: Container[int]
+    :param k: max candidates queued per box, None keeps every candidate
+    :type k: Int
+    :param refill: called with a box_1_uuid, returns (delta_cs, box_2_uuids) of
+        every candidate of that box, required if k is set
+    :type refill: Callable
+    :param compact: keep the initial candidates in a record array
+    :type compact: Bool
+    """
+
+    def __init__(self, active, k=None, refill=None, compact=False):
+        if k is not None and (k < 1 or refill is None):
+            raise ValueError("k must be at least 1 and needs a refill function")
+        self.active = active
+        self.k = k
+        self.refill = refill
+        self.compact = compact
+        self._pending = []
+        self._started = False
+        self._heap = []
+        self._records = None
+        self._cursor = 0
+        self._seq = 0
+        self.stale = 0
+        self.refills = 0
+
+    def __len__(self):
+        pending = sum(len(batch[0]) for batch in self._pending)
+        records = 0 if self._records is None else len(self._records) - self._cursor
+        return pending + len(self._heap) + records
+
+    def push(self, delta_c, box_1_uuid, box_2_uuid):
+        """add a candidate to the queue
+
+        :param delta_c: delta_c of merging the two boxes
+        :type delta_c: Float
+        :param box_1_uuid: unique_id of the first box
+        :type box_1_uuid: Int
+        :param box_2_uuid: unique_id of the second box
+        :type box_2_uuid: Int
+        """
+        self.extend([delta_c], [box_1_uuid], [box_2_uuid])
+
+    def extend(self, delta_cs, box_1_uuids, box_2_uuids):
+        """add a batch of candidates to the queue, batches added before the first
+        peek or pop are built into the heap (or record array) in one go
+
+        :param delta_cs: delta_c values
+        :type delta_cs: numpy.ndarray
+        :param box_1_uuids: unique_ids of the first boxes
+        :type box_1_uuids: numpy.ndarray
+        :param box_2_uuids: unique_ids of the second boxes
+        :type box_2_uuids: numpy.ndarray
+        """
+        delta_cs = np.asarray(delta_cs, dtype=np.float64).reshape(-1)
+        box_1_uuids = np.asarray(box_1_uuids, dtype=np.int64).reshape(-1)
+        box_2_uuids = np.asarray(box_2_uuids, dtype=np.int64).reshape(-1)
+        refill = np.zeros(len(delta_cs), dtype=bool)
+        if self.k is not None:
+            delta_cs, box_1_uuids, box_2_uuids, refill = self._top_k(
+                delta_cs, box_1_uuids, box_2_uuids
+            )
+
+        # the sequence number breaks delta_c ties in insertion order
+        seqs = np.arange(self._seq, self._seq + len(delta_cs), dtype=np.int64)
+        self._seq += len(delta_cs)
+
+        batch = (delta_cs, seqs, box_1_uuids, box_2_uuids, refill)
+        if not self._started:
+            self._pending.append(batch)
+            return
+        for entry in self._entries(*batch):
+            heapq.heappush(self._heap, entry)
+
+    def _start(self):
+        """builds the heap, or the record array if compact, from the pending
+        batches, O(C) instead of a push per candidate"""
+        self._started = True
+        if not self._pending:
+            return
+        batch = [np.concatenate(arrays) for arrays in zip(*self._pending)]
+        self._pending = []
+
+        if not self.compact:
+            self._heap = self._entries(*batch)
+            heapq.heapify(self._heap)
+            return
+
+        records = np.empty(len(batch[0]), dtype=CANDIDATE_DTYPE)
+        for name, values in zip(CANDIDATE_DTYPE.names, batch):
+            records[name] = values
+        # seq is already ascending, a stable sort on delta_c keeps ties in order
+        self._records = records[np.argsort(records["delta_c"], kind="stable")]
+        if len(self._records) == 0:
+            self._records = None
+
+    @staticmethod
+    def _entries(delta_cs, seqs, box_1_uuids, box_2_uuids, refill):
+        """heap tuples, refill entries have None as box_2"""
+        box_2_list = box_2_uuids.tolist()
+        for i in np.flatnonzero(refill).tolist():
+            box_2_list[i] = None
+        return list(
+            zip(delta_cs.tolist(), seqs.tolist(), box_1_uuids.tolist(), box_2_list)
+        )
+
+    def _top_k(self, delta_cs, box_1_uuids, box_2_uuids):
+        """the k best candidates of every box_1 in their original order, plus a
+        refill entry at the best delta_c left out for boxes with more than k"""
+        count = len(delta_cs)
+        if count <= self.k:
+            return delta_cs, box_1_uuids, box_2_uuids, np.zeros(count, dtype=bool)
+
+        order = np.lexsort((delta_cs, box_1_uuids))
+        owners = box_1_uuids[order]
+        starts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])
+        rank = np.arange(count) - np.repeat(starts, np.diff(np.r_[starts, count]))
+
+        keep = np.zeros(count, dtype=bool)
+        keep[order[rank < self.k]] = True
+        cutoff = order[rank == self.k]
+
+        refill = np.zeros(keep.sum() + len(cutoff), dtype=bool)
+        refill[keep.sum() :] = True
+        return (
+            np.concatenate([delta_cs[keep], delta_cs[cutoff]]),
+            np.concatenate([box_1_uuids[keep], box_1_uuids[cutoff]]),
+            np.concatenate([box_2_uuids[keep], box_2_uuids[cutoff]]),
+            refill,
+        )
+
+    def is_stale(self, entry):
+        """a candidate is stale once either of its boxes has been merged"""
+        return entry[2] not in self.active or (
+            entry[3] is not None and entry[3] not in self.active
+        )
+
+    def _head(self):
+        """smallest entry of the heap and the record array, and where it is"""
+        if not self._started:
+            self._start()
+        entry, source = None, None
+        if self._records is not None:
+            record = self._records[self._cursor]
+            entry = (
+                float(record["delta_c"]),
+                int(record["seq"]),
+                int(record["box_1"]),
+                None if record["refill"] else int(record["box_2"]),
+            )
+            source = "records"
+        if self._heap and (entry is None or self._heap[0][:2] < entry[:2]):
+            entry, source = self._heap[0], "heap"
+        return entry, source
+
+    def _drop(self, source):
+        """removes the head entry of source"""
+        if source == "heap":
+            heapq.heappop(self._heap)
+            return
+        self._cursor += 1
+        if self._cursor == len(self._records):
+            self._records, self._cursor = None, 0
+
+    def _refill(self, cutoff, box_1_uuid):
+        """queues the next k best candidates of a box, every candidate below the
+        cutoff was queued already"""
+        self.refills += 1
+        delta_cs, box_2_uuids = self.refill(box_1_uuid)
+        delta_cs = np.asarray(delta_cs, dtype=np.float64)
+        keep = delta_cs >= cutoff
+        self.extend(
+            delta_cs[keep],
+            np.full(keep.sum(), box_1_uuid, dtype=np.int64),
+            np.asarray(box_2_uuids, dtype=np.int64)[keep],
+        )
+
+    def peek(self, max_delta=None):
+        """returns the best valid candidate without removing it, None if empty
+
+        :param max_delta: also None if the best delta_c is above max_delta
+        :type max_delta: Float
+        ...
+        :return: (delta_c, box_1_uuid, box_2_uuid) with the smallest delta_c
+        :rtype: Tuple
+        """
+        while True:
+            entry, source = self._head()
+            if entry is None or (max_delta is not None and entry[0] > max_delta):
+                return None
+            if self.is_stale(entry):
+                self._drop(source)
+                self.stale += 1
+            elif entry[3] is None:
+                self._drop(source)
+                self._refill(entry[0], entry[2])
+            else:
+                return entry[0], entry[2], entry[3]
+
+    def pop(self, max_delta=None):
+        """removes and returns the best valid candidate, None if empty
+
+        :param max_delta: also None if the best delta_c is above max_delta
+        :type max_delta: Float
+        ...
+        :return: (delta_c, box_1_uuid, box_2_uuid) with the smallest delta_c
+        :rtype: Tuple
+        """
+        candidate = self.peek(max_delta)
+        if candidate is not None:
+            self._drop(self._head()[1])
+        return candidate
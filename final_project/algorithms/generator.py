@@ -1,15 +1,18 @@
+import os
 import simplekml
 import datetime, pytz
+import numpy as np
 import pandas as pd
-from pyproj import Proj, Transformer
 
-from .prism import Prism
+from .prism import PrismArray
+from .profiling import get_profiler
+from .projection import transform
 
 
 def prisms_projected_output(prisms, in_crs="epsg:3857"):
     """prisms list of bounds
 
-    :param prisms: list of prisms
+    :param prisms: list of prisms or a PrismArray
     :type prisms: List[prism.Prism]
     :param in_crs: input crs
     :type in_crs: str
@@ -17,15 +20,41 @@ def prisms_projected_output(prisms, in_crs="epsg:3857"):
     :returns: df, simple kml
     """
 
-    bounds = ll_bounds_from_prisms(prisms, in_crs)
-    df = pd.DataFrame.from_records(
-        bounds, columns=["xmin", "ymin", "tmin", "xmax", "ymax", "tmax"]
-    )
+    return projected_output_from_bounds(PrismArray.from_prisms(prisms).bounds, in_crs)
+
+
+def projected_output_from_bounds(
+    bounds, in_crs="epsg:3857", kml=True, profiler=None
+):
+    """output dataframe and kml straight from an array of projected bounds,
+    without building any prism objects
+
+    :param bounds: (N,6) array of (xmin, ymin, tmin, xmax, ymax, tmax)
+    :type bounds: numpy.ndarray
+    :param in_crs: input crs
+    :type in_crs: str
+    :param kml: build the simple kml, None is returned in its place if False
+    :type kml: bool
+    :param profiler: records the output_projection and kml_build phases
+    :type profiler: profiling.Profiler
+    ...
+    :returns: df, simple kml
+    """
+    profiler = get_profiler(profiler)
+    with profiler.phase("output_projection"):
+        bounds = ll_bounds(bounds, in_crs)
+        df = pd.DataFrame(
+            bounds, columns=["xmin", "ymin", "tmin", "xmax", "ymax", "tmax"]
+        )
 
-    kml = simplekml.Kml()
+    if not kml:
+        return df, None
 
-    for b in bounds:
-        insert_prism(kml, b)
+    with profiler.phase("kml_build"):
+        kml = simplekml.Kml()
+
+        for b in bounds.tolist():
+            insert_prism(kml, b)
 
     return df, kml
 
@@ -39,6 +68,7 @@ def create_prisms_by_ll(
     x_buffer,
     y_buffer,
     out_crs="epsg:3857",
+    profiler=None,
 ):
     """create a list of prisms given a list of lon/lat/timestampes/names, etc
 
@@ -58,77 +88,72 @@ def create_prisms_by_ll(
     :type y_buffer: Float
     :param out_crs: the projection to use
     :type out_crs: Str
+    :param profiler: records the projection and prism_creation phases
+    :type profiler: profiling.Profiler
     ...
-    :return: list of prism objects
-    :rtype: List[prism.Prism]
+    :return: the prisms as columns, iterating gives prism objects
+    :rtype: prism.PrismArray
 
     """
-    transformer = Transformer.from_proj(
-        Proj("epsg:4326"), Proj(out_crs), always_xy=True
-    )
-    Xs, Ys = transformer.transform(lons, lats)
-    data = list(zip(lons, lats, Xs, Ys, timestamps, names))
-    prisms = [
-        Prism(
-            lon=lon,
-            lat=lat,
-            x=x,
-            y=y,
-            crs=out_crs,
-            timestamp=ts,
-            name=name,
+    profiler = get_profiler(profiler)
+    with profiler.phase("projection"):
+        lons = np.asarray(lons, dtype=np.float64)
+        lats = np.asarray(lats, dtype=np.float64)
+        Xs, Ys = transform("epsg:4326", out_crs, lons, lats)
+    with profiler.phase("prism_creation"):
+        return PrismArray(
+            x=Xs,
+            y=Ys,
+            timestamp=timestamps,
             x_buffer=x_buffer,
             y_buffer=y_buffer,
             temporal_buffer=temporal_buffer,
+            lon=lons,
+            lat=lats,
+            names=names,
+            crs=out_crs,
         )
-        for lon, lat, x, y, ts, name in data
-    ]
-    return prisms
 
 
-def create_prisms_by_proj(bounds, names, in_crs="epsg:3857"):
-    """create a list of prisms given a set of bounds, names, and the input_crs
+def create_prisms_by_proj(bounds, names, in_crs="epsg:3857", uuids=None):
+    """create prisms given a set of bounds, names, and the input_crs
 
-    :param bounds: (xmin, ymin, tmin, xmax, ymax, tmax)
-    :type bounds: Tuple
+    :param bounds: (N,6) array of (xmin, ymin, tmin, xmax, ymax, tmax)
+    :type bounds: numpy.ndarray
     :param names: list of names
     :type names: List[Str]
+    :param uuids: unique ids for the prisms, new ids are reserved if None
+    :type uuids: List[Int]
     ...
-    :return: list of prism objects
-    :rtype: List[prism.Prism]
+    :return: the prisms as columns, iterating gives prism objects
+    :rtype: prism.PrismArray
 
     """
 
-    transformer = Transformer.from_proj(Proj(in_crs), Proj("epsg:4326"), always_xy=True)
-    df = pd.DataFrame(bounds, columns=["xmin", "ymin", "tmin", "xmax", "ymax", "tmax"])
-    df["x"] = (df["xmax"] + df["xmin"]) / 2.0
-    df["y"] = (df["ymax"] + df["ymin"]) / 2.0
-    df["t"] = (df["tmax"] + df["tmin"]) / 2.0
-    df["name"] = names
-    df["lon"], df["lat"] = transformer.transform(df["x"], df["y"])
-    prisms = []
-    for index, row in df.iterrows():
-        prism = Prism(
-            lat=row["lat"],
-            lon=row["lon"],
-            x=row["x"],
-            y=row["y"],
-            crs=in_crs,
-            timestamp=row["t"],
-            name=row["name"],
-            x_buffer=(row["x"] - row["xmin"]),
-            y_buffer=(row["y"] - row["ymin"]),
-            temporal_buffer=(row["t"] - row["tmin"]),
-        )
+    bounds = np.asarray(bounds, dtype=np.float64).reshape(-1, 6)
+    centers = (bounds[:, 3:] + bounds[:, :3]) / 2.0
+    buffers = centers - bounds[:, :3]
+    lons, lats = transform(in_crs, "epsg:4326", centers[:, 0], centers[:, 1])
 
-        prisms.append(prism)
-    return prisms
+    return PrismArray(
+        x=centers[:, 0],
+        y=centers[:, 1],
+        timestamp=centers[:, 2],
+        x_buffer=buffers[:, 0],
+        y_buffer=buffers[:, 1],
+        temporal_buffer=buffers[:, 2],
+        lon=lons,
+        lat=lats,
+        names=names,
+        uuid=uuids,
+        crs=in_crs,
+    )
 
 
 def ll_bounds_from_prisms(prisms, in_crs="epsg:3857"):
     """prisms list of bounds
 
-    :param prisms: list of prisms
+    :param prisms: list of prisms or a PrismArray
     :type prisms: List[prism.Prism]
     :param in_crs: input crs
     :type in_crs: str
@@ -136,31 +161,34 @@ def ll_bounds_from_prisms(prisms, in_crs="epsg:3857"):
     :returns: list of bounds [(xmin, ymin tmin, xmax, ymax, tmax)]
     :rtype: List[Tuple]
     """
+    bounds = ll_bounds(PrismArray.from_prisms(prisms).bounds, in_crs)
+    return [tuple(b) for b in bounds.tolist()]
 
-    projected_bounds = [prism.bounds for prism in prisms]
 
-    df_results = pd.DataFrame.from_records(
-        projected_bounds, columns=["xmin", "ymin", "tmin", "xmax", "ymax", "tmax"]
-    )
+def ll_bounds(bounds, in_crs="epsg:3857"):
+    """projected bounds to lon/lat bounds, the min and max corners of every box
+    go through a single transform call
 
-    transformer = Transformer.from_proj(Proj(in_crs), Proj("epsg:4326"), always_xy=True)
+    :param bounds: (N,6) array of (xmin, ymin, tmin, xmax, ymax, tmax)
+    :type bounds: numpy.ndarray
+    :param in_crs: input crs
+    :type in_crs: str
+    ...
+    :returns: (N,6) array of (lon-min, lat-min, time-min, lon-max, lat-max, time-max)
+    :rtype: numpy.ndarray
+    """
+    bounds = np.asarray(bounds, dtype=np.float64).reshape(-1, 6)
+    count = len(bounds)
 
-    df_results["latmin"], df_results["lonmin"] = transformer.transform(
-        df_results.xmin, df_results.ymin
-    )
-    df_results["latmax"], df_results["lonmax"] = transformer.transform(
-        df_results.xmax, df_results.ymax
+    lons, lats = transform(
+        in_crs,
+        "epsg:4326",
+        np.concatenate([bounds[:, 0], bounds[:, 3]]),
+        np.concatenate([bounds[:, 1], bounds[:, 4]]),
     )
 
-    return list(
-        zip(
-            df_results.latmin,
-            df_results.lonmin,
-            df_results.tmin,
-            df_results.latmax,
-            df_results.lonmax,
-            df_results.tmax,
-        )
+    return np.column_stack(
+        [lons[:count], lats[:count], bounds[:, 2], lons[count:], lats[count:], bounds[:, 5]]
     )
 
 
@@ -169,6 +197,102 @@ def datestr(timestamp):
     return datetime.datetime.fromtimestamp(timestamp, pytz.utc).isoformat()
 
 
+def datestrs(timestamps):
+    """vectorized datestr, same isoformat strings for an array of timestamps"""
+    micros = np.round(np.asarray(timestamps, dtype=np.float64) * 1e6).astype(np.int64)
+    dates = micros.astype("datetime64[us]")
+    strings = np.where(
+        micros % 1_000_000 == 0,
+        np.datetime_as_string(dates, unit="s"),
+        np.datetime_as_string(dates, unit="us"),
+    )
+    return np.char.add(strings.astype(str), "+00:00")
+
+
+KML_HEADER = """<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2" xmlns:gx="http://www.google.com/kml/ext/2.2">
+    <Document>
+        <Style id="query-volume">
+            <PolyStyle>
+                <color>9900ff00</color>
+                <colorMode>normal</colorMode>
+                <fill>1</fill>
+                <outline>1</outline>
+            </PolyStyle>
+        </Style>
+"""
+
+KML_PLACEMARK = """        <Placemark>
+            <name>query volume</name>
+            <TimeSpan>
+                <begin>{begin}</begin>
+                <end>{end}</end>
+            </TimeSpan>
+            <styleUrl>#query-volume</styleUrl>
+            <Polygon>
+                <outerBoundaryIs>
+                    <LinearRing>
+                        <coordinates>{lon0},{lat0},0.0 {lon0},{lat1},0.0 {lon1},{lat1},0.0 {lon1},{lat0},0.0 {lon0},{lat0},0.0</coordinates>
+                    </LinearRing>
+                </outerBoundaryIs>
+            </Polygon>
+        </Placemark>
+"""
+
+KML_FOOTER = """    </Document>
+</kml>
+"""
+
+
+def write_kml(file, bounds, chunk_size=10_000):
+    """Streams the query volumes to a kml file placemark by placemark, the same
+    document insert_prism builds with simplekml but never held in memory, all
+    placemarks share one style
+
+    :param file: path or text file handle to write to
+    :type file: str
+    :param bounds: (N,6) array of (lon-min, lat-min, time-min, lon-max, lat-max, time-max)
+    :type bounds: numpy.ndarray
+    :param chunk_size: number of placemarks formatted per write
+    :type chunk_size: Int
+    """
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, "w", encoding="utf-8") as handle:
+            return write_kml(handle, bounds, chunk_size=chunk_size)
+
+    file.write(KML_HEADER)
+    write_placemarks(file, bounds, chunk_size=chunk_size)
+    file.write(KML_FOOTER)
+
+
+def write_placemarks(file, bounds, chunk_size=10_000):
+    """writes the placemarks of write_kml without the header and footer, so a
+    kml can be written a batch of queries at a time
+
+    :param file: text file handle to write to
+    :type file: io.TextIOBase
+    :param bounds: (N,6) array of (lon-min, lat-min, time-min, lon-max, lat-max, time-max)
+    :type bounds: numpy.ndarray
+    :param chunk_size: number of placemarks formatted per write
+    :type chunk_size: Int
+    """
+    bounds = np.asarray(bounds, dtype=np.float64).reshape(-1, 6)
+    for start in range(0, len(bounds), chunk_size):
+        chunk = bounds[start : start + chunk_size]
+        begins = datestrs(chunk[:, 2]).tolist()
+        ends = datestrs(chunk[:, 5]).tolist()
+        file.write(
+            "".join(
+                KML_PLACEMARK.format(
+                    lon0=lon0, lat0=lat0, lon1=lon1, lat1=lat1, begin=begin, end=end
+                )
+                for (lon0, lat0, _, lon1, lat1, _), begin, end in zip(
+                    chunk.tolist(), begins, ends
+                )
+            )
+        )
+
+
 def insert_prism(kml, bounds_tuple):
     """
     :param kml: a simplekml.Kml
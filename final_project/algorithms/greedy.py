@@ -1,17 +1,32 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import os
+import time
 import logging
 import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
 import pandas as pd
 
 from .algorithm import Algorithm
-from .prism import Prism
-from .utils import overlapping_boxes, new_boxes, create_rtree, combined_box
-from .utils import delta_c, padded_box, box_volume, df_for_greedy, create_uuid_int64
+from .candidates import CandidateQueue
+from .prism import PrismArray
+from .profiling import Profiler, get_profiler
+from .tracks import compress_tracks
+from .store import BoxStore
+from .grid import create_grid
+from .utils import create_rtree, overlapping_pairs, combined_boxes, delta_cs
+from .utils import iter_overlapping_pairs, boxes_intersect
+from .utils import padded_boxes, connected_components
+from .utils import df_for_greedy, IdAllocator, reserve_uuid_int64
 from .generator import create_prisms_by_proj
 
 logger = logging.getLogger(__name__)
 
+# seconds between the progress logs of the greedy loop
+PROGRESS_INTERVAL = 10.0
+
 
 class Greedy(Algorithm):
     """Class for running greedy apporach on a list of prisms to optimize
@@ -19,8 +34,8 @@ class Greedy(Algorithm):
 
     :param out_prisms: list of prism objects for the optimized space
     :type out_prisms: List[prism.Prism]
-    :param in_prism: list of prism objects for the original space
-    :type in_prisms: List[prism.Prism]
+    :param in_prism: prism objects for the original space
+    :type in_prisms: List[prism.Prism] or prism.PrismArray
     :param: boxes_inside: List of dictionaries with internal boxes (for plotting)
     :type: boxes_inside: List[Dict]
     """
@@ -28,48 +43,211 @@ class Greedy(Algorithm):
     def __init__(self):
         super().__init__("Greedy")
         self.out_prisms = None
+        self.out_bounds = None
+        self.out_uuids = None
         self.boxes_inside = None
         self.in_prisms = None
-
-    def run(self, in_prisms, coef):
+        self._reset_lookups()
+
+    def _reset_lookups(self):
+        """drops the cached lookups, they are rebuilt lazily after each run"""
+        self._in_prisms_array = None
+        self._positions = None
+        self._inside_uuids = None
+        self._inside_bounds = None
+        self._inside_table = None
+
+    def run(
+        self,
+        in_prisms,
+        coef,
+        rtree_properties=None,
+        workers=None,
+        build_prisms=True,
+        profiler=None,
+        top_k=None,
+        compact=False,
+        group_by_name=False,
+        min_overlap=0.5,
+        index="rtree",
+        history=None,
+        time_budget=None,
+        max_merges=None,
+        engine="greedy",
+    ):
         """Takes in a list of prisms, and outputs an optimized list of prisms
 
-        :param in_prisms: list of prisms
-        :type in_prisms: List[prism.Prism]
+        :param in_prisms: list of prisms or a PrismArray
+        :type in_prisms: List[prism.Prism] or prism.PrismArray
         :param coef: algorithm coeficient for padding
         :type coef: Float
+        :param rtree_properties: keyword arguments for utils.create_rtree
+        :type rtree_properties: Dict
+        :param workers: run independent components in this many processes
+        :type workers: Int
+        :param build_prisms: if False only out_bounds is set, out_prisms is None
+        :type build_prisms: Bool
+        :param profiler: records phase timings and counters of the run
+        :type profiler: profiling.Profiler
+        :param top_k: keep only the k best merge candidates per box, see greedy
+        :type top_k: Int
+        :param compact: keep the initial merge candidates in a record array
+        :type compact: Bool
+        :param group_by_name: only merge prisms of the same name (track), every
+            track is compressed first, see tracks.compress_tracks
+        :type group_by_name: Bool
+        :param min_overlap: overlap for a prism to join the run before it when
+            compressing tracks
+        :type min_overlap: Float
+        :param index: spatial index of the boxes, "rtree" or "grid", see greedy
+        :type index: str
+        :param history: records the merge sequence of a serial run, see greedy
+        :type history: history.MergeHistory
+        :param time_budget: seconds for greedy, when they run out the merges
+            done so far are the result
+        :type time_budget: Float
+        :param max_merges: stop greedy after this many merges (per worker task)
+        :type max_merges: Int
+        :param engine: "greedy" merges one pair at a time, "rounds" merges a
+            matching of pairs per round, see rounds.round_greedy
+        :type engine: str
         ...
-        :return list of out_prisms
-        :rtype: List[prism.Prism]
+        :return out_prisms
+        :rtype: prism.PrismArray
         """
 
+        if history is not None and (group_by_name or (workers and workers > 1)):
+            raise ValueError("a merge history needs one serial run of greedy")
+        if engine not in ("greedy", "rounds"):
+            raise ValueError(f"unknown engine {engine!r}, use 'greedy' or 'rounds'")
+        if engine == "rounds" and (
+            group_by_name
+            or (workers and workers > 1)
+            or history is not None
+            or time_budget is not None
+            or max_merges is not None
+            or top_k is not None
+            or compact
+        ):
+            raise ValueError(
+                "the rounds engine has no groups, workers, history, limits or "
+                "candidate bounds"
+            )
+
         # save as an attribute for below properties
         self.in_prisms = in_prisms
+        self._reset_lookups()
+        profiler = get_profiler(profiler)
 
         # convert list of prisms to dataframe
-        df = df_for_greedy(self.in_prisms)
+        if group_by_name:
+            with profiler.phase("track_compression"):
+                df = compress_tracks(self.in_prisms, coef=coef, min_overlap=min_overlap)
+            logger.info(f"tracks compressed to {len(df)} boxes")
+            profiler.count("compressed_boxes", len(df))
+        else:
+            with profiler.phase("prepare"):
+                df = df_for_greedy(self.in_prisms)
 
         # run greedy alg (outputs a df with bounds/unique_id)
-        df_results = greedy(df, coef)
+        if group_by_name:
+            df_results = grouped_greedy(
+                df,
+                coef,
+                workers=workers,
+                rtree_properties=rtree_properties,
+                profiler=profiler,
+                top_k=top_k,
+                compact=compact,
+                index=index,
+                time_budget=time_budget,
+                max_merges=max_merges,
+            )
+        elif engine == "rounds":
+            from .rounds import round_greedy
+
+            df_results = round_greedy(
+                df,
+                coef,
+                index=index,
+                rtree_properties=rtree_properties,
+                profiler=profiler,
+            )
+        elif workers and workers > 1:
+            df_results = partitioned_greedy(
+                df,
+                coef,
+                workers=workers,
+                rtree_properties=rtree_properties,
+                profiler=profiler,
+                top_k=top_k,
+                compact=compact,
+                index=index,
+                time_budget=time_budget,
+                max_merges=max_merges,
+            )
+        else:
+            df_results = greedy(
+                df,
+                coef,
+                rtree_properties=rtree_properties,
+                profiler=profiler,
+                top_k=top_k,
+                compact=compact,
+                index=index,
+                history=history,
+                time_budget=time_budget,
+                max_merges=max_merges,
+            )
 
-        # convert results dataframe back into prisms
-        self.out_prisms = create_prisms_by_proj(
-            list(df_results.bounds), list(df_results.name), in_crs="epsg:3857"
-        )
+        self.out_bounds = np.array(df_results.bounds.tolist(), dtype=np.float64)
+        self.out_bounds = self.out_bounds.reshape(-1, 6)
+        self.out_uuids = df_results.unique_id.to_numpy(dtype=np.int64)
         self.boxes_inside = list(df_results.boxes_inside)
 
+        # convert results dataframe back into prisms
+        self.out_prisms = None
+        if build_prisms:
+            with profiler.phase("result_prisms"):
+                self.out_prisms = create_prisms_by_proj(
+                    self.out_bounds,
+                    list(df_results.name),
+                    in_crs="epsg:3857",
+                    uuids=self.out_uuids,
+                )
+
         return self.out_prisms
 
     @property
     def inside_uuids(self):
         """Returns a dictionary of result_prism uuids as the key, and input_prism id's as a list of the values
-        {result_prism_uuid: [original_prism_uuids]}
+        {result_prism_uuid: [original_prism_uuids]}, built once per run
 
         :return: dict of result prisms inside uuids
         :rtype: dict
         """
-        uuid_list = [prism.uuid for prism in self.out_prisms]
-        return dict(zip(uuid_list, self.boxes_inside))
+        if self._inside_uuids is None:
+            self._inside_uuids = dict(zip(self.out_uuids.tolist(), self.boxes_inside))
+        return self._inside_uuids
+
+    @property
+    def inside_table(self):
+        """Flat (merged_id, inner_id) table pairing every result prism with the
+        input prisms inside it, results that were not merged pair with themselves.
+        Ready to be written to disk with to_csv or to_parquet
+
+        :return: dataframe with merged_id and inner_id columns
+        :rtype: pandas.DataFrame
+        """
+        if self._inside_table is None:
+            merged, inner = self._inside_positions()
+            self._inside_table = pd.DataFrame(
+                {
+                    "merged_id": self.out_uuids[merged],
+                    "inner_id": self._in_array().uuid[inner],
+                }
+            )
+        return self._inside_table
 
     @property
     def inside_bounds(self):
@@ -78,180 +256,746 @@ class Greedy(Algorithm):
         :return: dict of result prisms inside bounds
         :rtype: dict
         """
+        if self._inside_bounds is not None:
+            return self._inside_bounds
+
+        merged, inner = self._inside_positions()
+        in_bounds = self._in_array().bounds
+        splits = np.searchsorted(merged, np.arange(len(self.out_uuids) + 1))
+
         new_list = []
-        for key, value in self.inside_uuids.items():
+        for position, (key, value) in enumerate(self.inside_uuids.items()):
+            merged_box = tuple(self.out_bounds[position].tolist())
             if value == []:
-                merged_box = [
-                    prism.bounds for prism in self.out_prisms if prism.uuid == key
-                ][0]
                 d = {
                     "merged_uuid": key,
                     "inner_bounds_uuid": None,
                     "merged_bounds": merged_box,
                     "inner_bounds": None,
                 }
-
-                new_list.append(d)
             else:
-                merged_box = [
-                    prism.bounds for prism in self.out_prisms if prism.uuid == key
-                ][0]
-                inner_bounds = [
-                    prism.bounds for prism in self.in_prisms if prism.uuid in value
-                ]
-
+                inside = inner[splits[position] : splits[position + 1]]
                 d = {
                     "merged_uuid": key,
                     "inner_bounds_uuid": value,
                     "merged_bounds": merged_box,
-                    "inner_bounds": inner_bounds,
+                    "inner_bounds": [tuple(b) for b in in_bounds[inside].tolist()],
                 }
+            new_list.append(d)
 
-                new_list.append(d)
+        self._inside_bounds = new_list
         return new_list
 
+    def _in_array(self):
+        """the input prisms as a PrismArray"""
+        if self._in_prisms_array is None:
+            self._in_prisms_array = PrismArray.from_prisms(self.in_prisms)
+        return self._in_prisms_array
+
+    def _inside_positions(self):
+        """(result position, input position) of every input prism inside a merged
+        result, sorted by result then input position, found with one sorted
+        uuid lookup instead of list scans"""
+        if self._positions is not None:
+            return self._positions
+
+        in_uuids = self._in_array().uuid
+        if len(in_uuids) == 0:
+            self._positions = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+            return self._positions
+        order = np.argsort(in_uuids, kind="stable")
+        sorted_uuids = in_uuids[order]
+
+        sizes = [len(inside) for inside in self.boxes_inside]
+        merged = np.repeat(np.arange(len(sizes)), sizes)
+        inner_ids = np.fromiter(
+            itertools.chain.from_iterable(self.boxes_inside),
+            dtype=np.int64,
+            count=sum(sizes),
+        )
+
+        # boxes_inside also holds the ids of intermediate merged boxes, skip them
+        found = np.searchsorted(sorted_uuids, inner_ids).clip(max=len(order) - 1)
+        hit = sorted_uuids[found] == inner_ids
+        merged, inner = merged[hit], order[found[hit]]
 
-def greedy(df, coef=0):
+        # results that were never merged are their own input prism
+        unmerged = np.flatnonzero(np.array(sizes) == 0)
+        found = np.searchsorted(sorted_uuids, self.out_uuids[unmerged]).clip(
+            max=len(order) - 1
+        )
+        hit = sorted_uuids[found] == self.out_uuids[unmerged]
+        merged = np.concatenate([merged, unmerged[hit]])
+        inner = np.concatenate([inner, order[found[hit]]])
+
+        keys = np.lexsort((inner, merged))
+        self._positions = merged[keys], inner[keys]
+        return self._positions
+
+
+def greedy(
+    df,
+    coef=0,
+    rtree_properties=None,
+    profiler=None,
+    top_k=None,
+    compact=False,
+    index="rtree",
+    history=None,
+    time_budget=None,
+    max_merges=None,
+):
     """Greedy algorithm for merging boxes in 3d space
 
-    :param df: pandas Dataframe, with columns unique_id, bounds, bounds is a tuple (xmin, ymin, tmin, xmax, ymax, tmax)
+    Every overlapping pair is a merge candidate, in dense areas there are many
+    per box. With top_k only the k best candidates of each box are held and the
+    rest are found again in the rtree when a box runs out, the merges are the
+    same (up to ties in delta_c) but the memory stays linear in the boxes.
+
+    :param df: pandas Dataframe, with columns unique_id, bounds, bounds is a tuple (xmin, ymin, tmin, xmax, ymax, tmax), unique_id must be >= 0
     :type df: pandas.DataFrame
     :param coef: algorithm coeficient for padding
     :type coef: Float
+    :param rtree_properties: keyword arguments for utils.create_rtree
+    :type rtree_properties: Dict
+    :param profiler: records phase timings and counters of the run
+    :type profiler: profiling.Profiler
+    :param top_k: max merge candidates held per box, None holds all of them
+    :type top_k: Int
+    :param compact: keep the initial merge candidates in a NumPy record array
+    :type compact: Bool
+    :param index: spatial index of the boxes, "rtree" or "grid" (grid.GridIndex)
+    :type index: str
+    :param history: records the input boxes and every merge, merging on past
+        delta_c 0 up to history.max_delta once the result is taken
+    :type history: history.MergeHistory
+    :param time_budget: seconds for the whole call, the merges done when it runs
+        out are the result
+    :type time_budget: Float
+    :param max_merges: stop after this many merges, with the result so far
+    :type max_merges: Int
     ...
     :return: pandas Dataframe with new (improved) query space
     :rtype: pandas.DataFrame
     """
+    profiler = get_profiler(profiler)
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
     df_master = df.copy()
     total_points = len(df_master)
 
-    # if we have an empty dataframe throw an error
-    if df_master.empty:
-        return []
-
-    # if we only have 1 value in dataframe, return that as the query list
+    # if we have less than 2 boxes there is nothing to merge
     if len(df_master) < 2:
-        return [df_master.iloc[0].to_dict()]
+        if history is not None:
+            history.start(df_master)
+        return df_master
 
-    # remove duplicates & append a column that contains boxes in boxes
-    df_master = df_master.drop_duplicates(subset=["bounds"])
+    # remove duplicates
+    with profiler.phase("deduplicate"):
+        df_master = df_master.drop_duplicates(subset=["bounds"])
     logger.info(f"{total_points - len(df_master)} duplicates")
-
-    # calculate the padded boxes, returns the original bounds if coef = 0
-    df_master["padded_boxes"] = df_master.apply(
-        lambda x: padded_box(x.bounds, coef=coef), axis=1
-    )
-
-    # create rtree
-    logger.info("creating Rtree")
-    rtree_index = create_rtree(df_master)
-
-    # find overlapping boxes
-    logger.info("finding overlapping boxes")
-    df_master["overlap_boxes"] = df_master.apply(
-        lambda x: overlapping_boxes(x.padded_boxes, x.unique_id, rtree_index),
-        axis=1,
-    )
-
-    # calculates all of the overlapping boxes new boxes
-    logger.info("calculating overlapping boxes")
-    df_master["new_boxes"] = df_master.apply(
-        lambda x: new_boxes(x.bounds, x.unique_id, x.overlap_boxes, coef=coef),
-        axis=1,
-    )
-
-    # get all overlapping boxes as new dataframe (this gets big)
-    new_boxes_list = df_master.new_boxes.tolist()
-    flat_list = list(itertools.chain(*new_boxes_list))
-    df_newboxes = pd.DataFrame(flat_list)
-
-    # if we have no overlapping boxes, we are done
-    if df_newboxes.empty:
-        df_master = df_master.drop(
-            ["overlap_boxes", "new_boxes", "padded_boxes"], axis=1
+    profiler.count("duplicates", total_points - len(df_master))
+    if history is not None:
+        history.start(df_master)
+
+    with profiler.phase("store_build"):
+        # calculate the padded boxes, returns the original bounds if coef = 0
+        bounds = np.array(df_master.bounds.tolist(), dtype=np.float64)
+        bounds = bounds.reshape(-1, 6)
+        padded = padded_boxes(bounds, coef=coef)
+        unique_ids = df_master.unique_id.to_numpy(dtype=np.int64)
+
+        # move the active boxes into the array backed store, merges never copy a frame
+        store = BoxStore(len(df_master))
+        slots = store.add_many(
+            unique_ids,
+            bounds,
+            padded,
+            boxes_inside=df_master.boxes_inside,
+            names=df_master.name,
         )
-        return df_master
 
-    # sort by smallest delta_c
-    logger.info("sort by delta C")
-    df_newboxes = df_newboxes.sort_values(by=["delta_c"])
+    # create the index, its ids are store slots so hits index the store directly
+    logger.info(f"creating {index} index")
+    with profiler.phase("index_build"):
+        start = time.perf_counter()
+        rtree_index = create_index(bounds, slots, index, rtree_properties)
+        logger.info(f"{index} index built in {time.perf_counter() - start:.3f}s")
+
+    with profiler.phase("candidate_generation"):
+        refill = None
+        if top_k is not None:
+            refill = _candidate_refill(store, rtree_index, coef, bounds, padded)
+        candidates = CandidateQueue(store, k=top_k, refill=refill, compact=compact)
+
+        # find every overlapping pair once, as store slots, and push them into
+        # a heap keyed on delta_c, the bounded modes take smaller chunks
+        logger.info("finding overlapping boxes")
+        start = time.perf_counter()
+        chunk_size = 65536 if top_k is None and not compact else 8192
+        pairs = 0
+        for box_1, box_2 in iter_overlapping_pairs(
+            bounds, padded, rtree_index, chunk_size=chunk_size
+        ):
+            merged = combined_boxes(bounds[box_1], bounds[box_2])
+            deltas = delta_cs(bounds[box_1], bounds[box_2], merged, coef=coef)
+            if top_k is None:
+                candidates.extend(deltas, unique_ids[box_1], unique_ids[box_2])
+            else:
+                # a pair belongs to the younger box, the one a refill finds it from
+                candidates.extend(deltas, unique_ids[box_2], unique_ids[box_1])
+            pairs += len(box_1)
+        elapsed = time.perf_counter() - start
+        logger.info(f"{pairs} overlapping pairs found in {elapsed:.3f}s")
+        profiler.count("rtree_queries", len(bounds))
+        profiler.count("candidate_pairs", pairs)
+
+    # merged boxes get run local ids counting down from -1, they only become
+    # global unique ids if they survive to the results
+    merge_ids = IdAllocator(start=-1, step=-1)
 
     logger.info("begin the Greedy loop")
-    # loop through until no more overlappin boxes give us
-    while len(df_master) > 0:
+    with profiler.phase("greedy_loop"):
+        merges, new_pairs, converged = merge_loop(
+            store,
+            rtree_index,
+            candidates,
+            coef,
+            merge_ids,
+            profiler=profiler,
+            history=history,
+            deadline=deadline,
+            max_merges=max_merges,
+        )
 
-        # if we have a candidate to merge
-        if df_newboxes.iloc[0].delta_c <= 0:
+    profiler.sample("candidate_set_size", merges, len(candidates))
+    profiler.count("merges", merges)
+    profiler.count("rtree_queries", merges + candidates.refills)
+    profiler.count("refills", candidates.refills)
+    profiler.count("candidate_pairs", new_pairs)
+    profiler.count("stale_skipped", candidates.stale)
+    if converged:
+        logger.info(
+            f"No more overlapping boxes: {len(store)} queries in new search space"
+        )
+    else:
+        logger.info(f"Stopped early: {len(store)} queries in new search space")
+        profiler.count("stopped_early")
+
+    with profiler.phase("results"):
+        df_results = _assign_global_ids(store.to_frame(), merges)
+
+    if not converged:
+        return df_results
+    if history is not None and (history.max_delta is None or history.max_delta > 0):
+        with profiler.phase("history"):
+            merge_loop(
+                store,
+                rtree_index,
+                candidates,
+                coef,
+                merge_ids,
+                max_delta=history.max_delta,
+                history=history,
+            )
+        logger.info(f"{len(history)} merges recorded")
+    return df_results
+
+
+def merge_loop(
+    store,
+    spatial_index,
+    candidates,
+    coef,
+    new_id,
+    profiler=None,
+    max_delta=0,
+    history=None,
+    deadline=None,
+    max_merges=None,
+    progress_interval=PROGRESS_INTERVAL,
+):
+    """The greedy loop, merges the two boxes of the best candidate until no
+    candidate has a delta_c <= max_delta, every merged box queries the index
+    for its own candidates
+
+    The loop can also stop at a deadline or after max_merges, the active boxes
+    are a valid (less merged) result after every merge. Progress is logged
+    every progress_interval seconds.
+
+    :param store: the active boxes
+    :type store: store.BoxStore
+    :param spatial_index: index of the active boxes' bounds by store slot
+    :type spatial_index: rtree.index.Index or grid.GridIndex
+    :param candidates: merge candidates of the active boxes
+    :type candidates: candidates.CandidateQueue
+    :param coef: algorithm coeficient for padding
+    :type coef: Float
+    :param new_id: called for the unique_id of every merged box
+    :type new_id: Callable
+    :param profiler: samples the candidate set size
+    :type profiler: profiling.Profiler
+    :param max_delta: stop once the best delta_c is above this, None merges
+        until no boxes overlap
+    :type max_delta: Float
+    :param history: records every merge
+    :type history: history.MergeHistory
+    :param deadline: time.perf_counter() to stop at
+    :type deadline: Float
+    :param max_merges: stop after this many merges
+    :type max_merges: Int
+    :param progress_interval: seconds between progress logs
+    :type progress_interval: Float
+    ...
+    :return: (merges, candidate pairs pushed for the merged boxes, whether no
+        candidate was left, False if stopped by the deadline or max_merges)
+    :rtype: Tuple(Int, Int, Bool)
+    """
+    profiler = get_profiler(profiler)
+    merges, new_pairs = 0, 0
+    start = last_report = time.perf_counter()
+    profiler.sample("candidate_set_size", 0, len(candidates))
+    # loop through until no more overlapping boxes give us an improvement
+    while True:
+
+        now = time.perf_counter()
+        if (deadline is not None and now >= deadline) or (
+            max_merges is not None and merges >= max_merges
+        ):
+            logger.info(f"stopping early after {merges} merges")
+            return merges, new_pairs, False
+        if now - last_report >= progress_interval:
+            logger.info(
+                f"{merges} merges ({merges / (now - start):.0f}/s), "
+                f"{len(candidates)} candidates queued, {len(store)} queries"
+            )
+            last_report = now
+
+        # the best candidate left (most negative), stale pairs are dropped here
+        candidate = candidates.pop(max_delta=max_delta)
 
-            # the first box in the df will be what we work with (most negative)
-            merged_box = df_newboxes.iloc[0]
+        # otherwise no good more overlaps exist, and we are done
+        if candidate is None:
+            break
 
-            # remove the two merged boxes from rtree
-            df_delete = df_master.loc[
-                (df_master.unique_id == int(merged_box.box_1_uuid))
-                | (df_master.unique_id == int(merged_box.box_2_uuid))
+        delta, box_1_uuid, box_2_uuid = candidate
+        slot_1, slot_2 = store.slot(box_1_uuid), store.slot(box_2_uuid)
+        new_bounds = combined_boxes(store.bounds[slot_1], store.bounds[slot_2])
+        boxes_inside = (
+            store.boxes_inside[slot_1]
+            + store.boxes_inside[slot_2]
+            + [box_1_uuid, box_2_uuid]
+        )
+        # a merge within one track keeps the track's name
+        name = store.names[slot_1]
+        if name != store.names[slot_2]:
+            name = None
+
+        # remove the two merged boxes from the index and the store
+        for slot, uuid in ((slot_1, box_1_uuid), (slot_2, box_2_uuid)):
+            spatial_index.delete(slot, store.bounds[slot].tolist())
+            store.remove(uuid)
+
+        # append the new box to the store and the index
+        unique_id = new_id()
+        if history is not None:
+            history.record(box_1_uuid, box_2_uuid, unique_id, delta)
+        new_padded = padded_boxes(new_bounds, coef=coef)
+        slot = store.add(
+            unique_id,
+            new_bounds[0],
+            new_padded[0],
+            boxes_inside=boxes_inside,
+            name=name,
+        )
+        spatial_index.insert(slot, new_bounds[0].tolist())
+
+        # push the new box's overlaps, each costs O(log C)
+        hits = [
+            hit
+            for hit in spatial_index.intersection(new_padded[0].tolist())
+            if hit != slot
+        ]
+        if hits:
+            hit_bounds = store.bounds[hits]
+            merged = combined_boxes(new_bounds, hit_bounds)
+            deltas = delta_cs(new_bounds, hit_bounds, merged, coef=coef)
+            candidates.extend(deltas, [unique_id] * len(hits), store.unique_ids[hits])
+            new_pairs += len(hits)
+
+        # the size of the heap, stale entries included, over time
+        merges += 1
+        if profiler.enabled and merges % profiler.sample_interval == 0:
+            profiler.sample("candidate_set_size", merges, len(candidates))
+
+    return merges, new_pairs, True
+
+
+def create_index(bounds, ids=None, index="rtree", rtree_properties=None):
+    """spatial index of the boxes, an rtree or a grid.GridIndex
+
+    The grid deletes in O(1) where the rtree condenses its nodes, which makes it
+    the faster index for greedy when the input boxes are about the same size.
+
+    :param bounds: (N,6) array of (xmin, ymin, tmin, xmax, ymax, tmax)
+    :type bounds: numpy.ndarray
+    :param ids: ids of the boxes, the row positions by default
+    :type ids: numpy.ndarray
+    :param index: "rtree" or "grid"
+    :type index: str
+    :param rtree_properties: keyword arguments for utils.create_rtree
+    :type rtree_properties: Dict
+    ...
+    :return: index with insert, delete, intersection and intersection_v
+    :rtype: rtree.index.Index or grid.GridIndex
+    """
+    if index == "grid":
+        return create_grid(bounds, ids=ids)
+    if index == "rtree":
+        return create_rtree(bounds, ids=ids, **(rtree_properties or {}))
+    raise ValueError(f"unknown index {index}, expected rtree or grid")
+
+
+def _candidate_refill(store, rtree_index, coef, bounds, padded):
+    """refill function of a top-k CandidateQueue, returns every candidate a box
+    owns: the older boxes its padded box overlaps, like the query made when the
+    box was merged, and for input boxes also the older input boxes whose padded
+    box overlaps it, like overlapping_pairs"""
+    initial_count = len(bounds)
+    initial_pad = np.maximum(
+        bounds[:, :3] - padded[:, :3], padded[:, 3:] - bounds[:, 3:]
+    ).max(axis=0)
+
+    def refill(unique_id):
+        slot = store.slot(unique_id)
+        order = store.order[slot]
+        box = store.bounds[slot]
+        initial = order < initial_count
+        if initial:
+            query = np.concatenate([box[:3] - initial_pad, box[3:] + initial_pad])
+        else:
+            query = store.padded[slot]
+
+        hits = np.fromiter(rtree_index.intersection(query.tolist()), dtype=np.int64)
+        hits = hits[store.order[hits] < order]
+        if initial:
+            hits = hits[
+                boxes_intersect(store.padded[slot], store.bounds[hits])
+                | boxes_intersect(store.padded[hits], box)
             ]
-            rtree_index.delete(
-                int(df_delete.iloc[0].unique_id), df_delete.iloc[0].bounds
-            )
-            rtree_index.delete(
-                int(df_delete.iloc[1].unique_id), df_delete.iloc[1].bounds
-            )
+        # same argument order as when the pair was first found, so the delta_c
+        # is bit for bit the one compared with the refill cutoff
+        pair = (store.bounds[hits], box) if initial else (box, store.bounds[hits])
+        merged = combined_boxes(*pair)
+        return delta_cs(*pair, merged, coef=coef), store.unique_ids[hits]
+
+    return refill
+
+
+def _assign_global_ids(df_results, merges):
+    """swaps the run local (negative) ids of merged boxes in unique_id and
+    boxes_inside for global unique ids, reserved in one block"""
+    if not merges:
+        return df_results
+    global_ids = reserve_uuid_int64(merges).tolist()
+
+    def lookup(unique_id):
+        return global_ids[-unique_id - 1] if unique_id < 0 else unique_id
+
+    df_results["unique_id"] = [lookup(i) for i in df_results.unique_id.tolist()]
+    df_results["boxes_inside"] = [
+        [lookup(i) for i in inside] for inside in df_results.boxes_inside
+    ]
+    return df_results
+
+
+def partitioned_greedy(
+    df,
+    coef=0,
+    workers=None,
+    rtree_properties=None,
+    profiler=None,
+    top_k=None,
+    compact=False,
+    index="rtree",
+    time_budget=None,
+    max_merges=None,
+):
+    """Runs greedy on the connected components of the overlap graph in a
+    process pool, boxes that never overlap (directly or through a chain) are
+    independent problems
+
+    A merged box can grow into a box of another component, so the results are
+    checked for overlaps across tasks and any tasks that touch are joined and
+    run again, which keeps the output identical to a serial greedy run.
 
-            # remove merged boxes from df_master
-            remove = [int(merged_box.box_1_uuid), int(merged_box.box_2_uuid)]
-            df_master = df_master[~df_master.unique_id.isin(remove)]
-
-            # append the new box to the rtree
-            rtree_index.insert(merged_box.unique_id, merged_box.bounds)
-
-            # append the new box to df_master
-            new_box = {
-                "unique_id": merged_box.unique_id,
-                "bounds": merged_box.bounds,
-                "padded_boxes": padded_box(merged_box.bounds, coef=coef),
-                "boxes_inside": df_delete.iloc[0].boxes_inside
-                + df_delete.iloc[1].boxes_inside
-                + [merged_box.box_1_uuid, merged_box.box_2_uuid],
+    :param df: pandas Dataframe, with columns unique_id, bounds, bounds is a tuple (xmin, ymin, tmin, xmax, ymax, tmax)
+    :type df: pandas.DataFrame
+    :param coef: algorithm coeficient for padding
+    :type coef: Float
+    :param workers: number of worker processes, defaults to the number of cpus
+    :type workers: Int
+    :param rtree_properties: keyword arguments for utils.create_rtree
+    :type rtree_properties: Dict
+    :param profiler: records phase timings and counters, summed over the workers
+    :type profiler: profiling.Profiler
+    :param top_k: max merge candidates held per box, see greedy
+    :type top_k: Int
+    :param compact: keep the initial merge candidates in a record array
+    :type compact: Bool
+    :param index: spatial index of the boxes, "rtree" or "grid"
+    :type index: str
+    :param time_budget: seconds for the whole call, see greedy
+    :type time_budget: Float
+    :param max_merges: max merges of each greedy run, see greedy
+    :type max_merges: Int
+    ...
+    :return: pandas Dataframe with new (improved) query space
+    :rtype: pandas.DataFrame
+    """
+    profiler = get_profiler(profiler)
+    deadline = None if time_budget is None else time.time() + time_budget
+    workers = workers or os.cpu_count()
+    df_master = df.drop_duplicates(subset=["bounds"]).reset_index(drop=True)
+    if len(df_master) < 2:
+        return df_master
+
+    with profiler.phase("partition"):
+        bounds = np.array(df_master.bounds.tolist(), dtype=np.float64)
+        bounds = bounds.reshape(-1, 6)
+        padded = padded_boxes(bounds, coef=coef)
+        rtree_index = create_index(bounds, None, index, rtree_properties)
+        box_1, box_2 = overlapping_pairs(bounds, padded, rtree_index)
+        labels = connected_components(len(bounds), box_1, box_2)
+        _, labels, sizes = np.unique(labels, return_inverse=True, return_counts=True)
+    logger.info(f"{len(sizes)} independent components, largest has {sizes.max()}")
+
+    # a padded box only shrinks as it grows, so the padding of the inputs bounds
+    # the padding of anything merged from them
+    pad = np.maximum(bounds[:, :3] - padded[:, :3], padded[:, 3:] - bounds[:, 3:])
+
+    tasks = _pack_components(labels, sizes, workers)
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while tasks:
+            # largest first so the long tasks are not left for the end
+            tasks.sort(key=len, reverse=True)
+            futures = {
+                pool.submit(
+                    _profiled_greedy,
+                    df_master.iloc[task],
+                    coef,
+                    profiler.sample_interval if profiler.enabled else None,
+                    rtree_properties=rtree_properties,
+                    top_k=top_k,
+                    compact=compact,
+                    index=index,
+                    deadline=deadline,
+                    max_merges=max_merges,
+                ): tuple(task.tolist())
+                for task in tasks
             }
-            new_box["overlap_boxes"] = overlapping_boxes(
-                new_box["padded_boxes"], new_box["unique_id"], rtree_index
+            for future in as_completed(futures):
+                results[futures[future]], profile = future.result()
+                if profile is not None:
+                    profiler.update(profile)
+
+            # out of time the tasks are kept as they are, a rerun would start
+            # over from the inputs
+            if _remaining(deadline) == 0:
+                break
+            with profiler.phase("conflict_check"):
+                tasks = _conflicting_tasks(results, pad)
+            if tasks:
+                logger.info(f"rerunning {len(tasks)} tasks that grew into each other")
+
+    df_results = pd.concat(list(results.values()), ignore_index=True)
+    logger.info(f"{len(df_results)} queries in new search space")
+    return df_results
+
+
+def grouped_greedy(
+    df,
+    coef=0,
+    workers=None,
+    rtree_properties=None,
+    profiler=None,
+    top_k=None,
+    compact=False,
+    index="rtree",
+    time_budget=None,
+    max_merges=None,
+):
+    """Runs greedy on the boxes of every name (track) on their own, boxes of
+    different names are never merged. The tracks are independent problems,
+    packed into tasks for a process pool if workers > 1
+
+    :param df: pandas Dataframe, with columns unique_id, bounds, name, boxes_inside
+    :type df: pandas.DataFrame
+    :param coef: algorithm coeficient for padding
+    :type coef: Float
+    :param workers: number of worker processes, 1 or None runs in this process
+    :type workers: Int
+    :param rtree_properties: keyword arguments for utils.create_rtree
+    :type rtree_properties: Dict
+    :param profiler: records phase timings and counters, summed over the tracks
+    :type profiler: profiling.Profiler
+    :param top_k: max merge candidates held per box, see greedy
+    :type top_k: Int
+    :param compact: keep the initial merge candidates in a record array
+    :type compact: Bool
+    :param index: spatial index of the boxes, "rtree" or "grid"
+    :type index: str
+    :param time_budget: seconds for the whole call, see greedy
+    :type time_budget: Float
+    :param max_merges: max merges of each greedy run, see greedy
+    :type max_merges: Int
+    ...
+    :return: pandas Dataframe with new (improved) query space
+    :rtype: pandas.DataFrame
+    """
+    profiler = get_profiler(profiler)
+    df_master = df.reset_index(drop=True)
+    if len(df_master) == 0:
+        return df_master
+    options = {
+        "rtree_properties": rtree_properties,
+        "top_k": top_k,
+        "compact": compact,
+        "index": index,
+        "deadline": None if time_budget is None else time.time() + time_budget,
+        "max_merges": max_merges,
+    }
+
+    # boxes without a name are one group of their own
+    labels, names = pd.factorize(df_master.name)
+    labels = np.where(labels < 0, len(names), labels)
+    sizes = np.bincount(labels)
+    logger.info(f"{len(sizes)} tracks, the largest has {sizes.max()} boxes")
+
+    if not workers or workers <= 1:
+        df_results, profile = _profiled_greedy_groups(
+            df_master,
+            labels,
+            coef,
+            profiler.sample_interval if profiler.enabled else None,
+            **options,
+        )
+        if profile is not None:
+            profiler.update(profile)
+        return df_results
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(
+                _profiled_greedy_groups,
+                df_master.iloc[task],
+                labels[task],
+                coef,
+                profiler.sample_interval if profiler.enabled else None,
+                **options,
             )
-            new_box["new_boxes"] = new_boxes(
-                new_box["bounds"],
-                new_box["unique_id"],
-                new_box["overlap_boxes"],
-                coef=coef,
+            for task in _pack_components(labels, sizes, workers)
+        ]
+        for future in as_completed(futures):
+            df_results, profile = future.result()
+            results.append(df_results)
+            if profile is not None:
+                profiler.update(profile)
+
+    df_results = pd.concat(results, ignore_index=True)
+    logger.info(f"{len(df_results)} queries in new search space")
+    return df_results
+
+
+def _profiled_greedy_groups(df, labels, coef, sample_interval, deadline=None, **kwargs):
+    """greedy on every group of df in turn, see _profiled_greedy"""
+    profiler = None if sample_interval is None else Profiler(sample_interval)
+    order = np.argsort(labels, kind="stable")
+    splits = np.flatnonzero(np.diff(labels[order])) + 1
+    df_results = pd.concat(
+        [
+            greedy(
+                df.iloc[group],
+                coef,
+                profiler=profiler,
+                time_budget=_remaining(deadline),
+                **kwargs,
             )
+            for group in np.split(order, splits)
+        ],
+        ignore_index=True,
+    )
+    return df_results, None if profiler is None else profiler.to_dict()
 
-            df2 = pd.DataFrame([new_box])
-            df_master = df_master.append(df2, ignore_index=True)
-
-            # remove all boxes from df_newboxes that have the merged uuids
-            df_newboxes = df_newboxes[~df_newboxes.box_1_uuid.isin(remove)]
-            df_newboxes = df_newboxes[~df_newboxes.box_2_uuid.isin(remove)]
 
-            # append the new box to df_newboxes if it overlaps with anything
-            new_boxes_list = df2.new_boxes.tolist()
-            if new_boxes_list:
-                flat_list = list(itertools.chain(*new_boxes_list))
-                df_newboxes_from_df2 = pd.DataFrame(flat_list)
-                df_newboxes = df_newboxes.append(
-                    df_newboxes_from_df2, ignore_index=True
-                )
-                df_newboxes = df_newboxes.sort_values(by=["delta_c"])
+def _remaining(deadline):
+    """seconds left until a time.time() deadline, None without one"""
+    if deadline is None:
+        return None
+    return max(deadline - time.time(), 0.0)
 
-            # if we have no overlapping boxes, we are done
-            if df_newboxes.empty:
-                break
 
-        # otherwise no good moreoverlaps exist, and we return the final df_master
-        else:
-            break
+def _profiled_greedy(df, coef, sample_interval, deadline=None, **kwargs):
+    """greedy in a worker process, returns the results and the worker's
+    profile (if sample_interval is set) so the parent can add it to its own.
+    The deadline is a time.time() shared by the workers"""
+    profiler = None if sample_interval is None else Profiler(sample_interval)
+    df_results = greedy(
+        df, coef, profiler=profiler, time_budget=_remaining(deadline), **kwargs
+    )
+    return df_results, None if profiler is None else profiler.to_dict()
+
+
+def _pack_components(labels, sizes, workers):
+    """groups components into roughly equal tasks, a few per worker"""
+    target = max(sizes.max(), int(np.ceil(sizes.sum() / (workers * 4))))
+    order = np.argsort(labels, kind="stable")
+    members = np.split(order, np.cumsum(sizes)[:-1])
+
+    tasks, current = [], []
+    for component in np.argsort(-sizes, kind="stable").tolist():
+        if current and len(current) + sizes[component] > target:
+            tasks.append(np.sort(np.concatenate(current)))
+            current = []
+        current.append(members[component])
+    tasks.append(np.sort(np.concatenate(current)))
+    return tasks
+
+
+def _conflicting_tasks(results, pad):
+    """finds finished tasks whose results could still merge with each other,
+    removes them from results and returns them joined as new tasks"""
+    keys = list(results)
+    task_bounds, task_pads, owner = [], [], []
+    for number, key in enumerate(keys):
+        result_bounds = np.array(
+            results[key].bounds.tolist(), dtype=np.float64
+        ).reshape(-1, 6)
+        task_bounds.append(result_bounds)
+        task_pads.append(
+            np.broadcast_to(pad[list(key)].max(axis=0), (len(result_bounds), 3))
+        )
+        owner.append(np.full(len(result_bounds), number))
+    task_bounds = np.concatenate(task_bounds)
+    task_pads = np.concatenate(task_pads)
+    owner = np.concatenate(owner)
 
-    logger.info(
-        f"No more overlapping boxes: {len(df_master)} queries in new search space"
+    expanded = np.hstack(
+        [task_bounds[:, :3] - task_pads, task_bounds[:, 3:] + task_pads]
     )
-    df_master = df_master.drop(["overlap_boxes", "new_boxes", "padded_boxes"], axis=1)
+    box_1, box_2 = overlapping_pairs(expanded, expanded, create_rtree(expanded))
+    crossing = owner[box_1] != owner[box_2]
+    if not crossing.any():
+        return []
 
-    return df_master
+    labels = connected_components(
+        len(keys), owner[box_1][crossing], owner[box_2][crossing]
+    )
+    joined = {}
+    counts = np.bincount(labels, minlength=len(keys))
+    for number, key in enumerate(keys):
+        if counts[labels[number]] > 1:
+            joined.setdefault(labels[number], []).extend(key)
+            del results[key]
+    return [np.sort(np.array(task)) for task in joined.values()]
@@ -0,0 +1,321 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import math
+import itertools
+
+import numpy as np
+
+from .utils import _as_bounds
+
+
+class GridIndex:
+    """Uniform 3-d grid hash with the insert, delete, intersection and
+    intersection_v surface of rtree.index.Index that greedy uses
+
+    Boxes no larger than a cell are anchored to the cell of their min corner,
+    so a query only looks at the cells its box covers plus one cell below on
+    each axis. The boxes bulk loaded with bulk_load live in sorted NumPy arrays
+    (queried with searchsorted, deleted by clearing a flag), boxes inserted
+    later go into a dict of cells on the smallest level of a grid of doubling
+    cell sizes they fit in, and boxes larger than max_level go to an overflow
+    list checked on every query. Touching boxes overlap, as in the rtree.
+
+    Ids must be non-negative integers, every id can be in the index once.
+
+    :param cell_size: (x, y, t) size of a cell, the extent of the input prisms
+    :type cell_size: Tuple[Float]
+    :param origin: (x, y, t) corner of cell (0, 0, 0)
+    :type origin: Tuple[Float]
+    :param max_level: boxes over cell_size * 2 ** max_level go to the overflow
+    :type max_level: Int
+    """
+
+    def __init__(self, cell_size, origin=(0.0, 0.0, 0.0), max_level=16):
+        self.cell_size = np.asarray(cell_size, dtype=np.float64).reshape(3)
+        if not (self.cell_size > 0).all():
+            raise ValueError(f"cell_size must be positive: {self.cell_size}")
+        self.origin = np.asarray(origin, dtype=np.float64).reshape(3)
+        self.max_level = max_level
+
+        # bulk loaded tier, sorted by cell key
+        self._shape = np.zeros(3, dtype=np.int64)
+        self._keys = np.empty(0, dtype=np.int64)
+        self._ids = np.empty(0, dtype=np.int64)
+        self._static_bounds = np.empty((0, 6), dtype=np.float64)
+        self._static_alive = np.empty(0, dtype=bool)
+        self._static_position = np.empty(0, dtype=np.int64)
+
+        # inserted tier, level -> {cell: set of ids}
+        self._levels = {}
+        self._where = {}
+        self._bounds = {}
+        self._overflow = set()
+
+    def __len__(self):
+        return int(self._static_alive.sum()) + len(self._where)
+
+    def _cells(self, bounds, size):
+        """(lo, hi) cell ranges on each axis anchoring boxes that can overlap bounds"""
+        lo = np.floor((bounds[..., :3] - self.origin) / size).astype(np.int64) - 1
+        hi = np.floor((bounds[..., 3:] - self.origin) / size).astype(np.int64)
+        return lo, hi
+
+    def bulk_load(self, ids, bounds):
+        """loads boxes into the sorted tier in one go, only on an empty index,
+        boxes larger than a cell are inserted one by one instead
+
+        :param ids: (N,) non-negative ids
+        :type ids: numpy.ndarray
+        :param bounds: (N,6) array of (xmin, ymin, tmin, xmax, ymax, tmax)
+        :type bounds: numpy.ndarray
+        """
+        if len(self):
+            raise ValueError("bulk_load needs an empty index")
+        ids = np.asarray(ids, dtype=np.int64)
+        bounds = _as_bounds(bounds)
+
+        fits = np.all(bounds[:, 3:] - bounds[:, :3] <= self.cell_size, axis=1)
+        for i in np.flatnonzero(~fits).tolist():
+            self.insert(int(ids[i]), bounds[i])
+        ids, bounds = ids[fits], bounds[fits]
+        if len(ids) == 0:
+            return
+
+        anchors = np.floor((bounds[:, :3] - self.origin) / self.cell_size)
+        anchors = anchors.astype(np.int64)
+        if (anchors < 0).any():
+            raise ValueError("origin must be below every bulk loaded box")
+        self._shape = anchors.max(axis=0) + 1
+        keys = self._key(anchors[:, 0], anchors[:, 1], anchors[:, 2])
+
+        order = np.argsort(keys, kind="stable")
+        self._keys = keys[order]
+        self._ids = ids[order]
+        self._static_bounds = bounds[order]
+        self._static_alive = np.ones(len(order), dtype=bool)
+        self._static_position = np.full(ids.max() + 1, -1, dtype=np.int64)
+        self._static_position[self._ids] = np.arange(len(order))
+
+    def _key(self, ax, ay, at):
+        """cell key, the t cells of one (x, y) column are consecutive keys"""
+        return (ax * self._shape[1] + ay) * self._shape[2] + at
+
+    def _level(self, bounds):
+        """smallest level whose cells hold the box, None for the overflow"""
+        extent = max(((bounds[3:] - bounds[:3]) / self.cell_size).tolist())
+        level = 0 if extent <= 1 else math.ceil(math.log2(extent))
+        return level if level <= self.max_level else None
+
+    def insert(self, id, coordinates, obj=None):
+        """adds a box
+
+        :param id: non-negative id
+        :type id: Int
+        :param coordinates: (xmin, ymin, tmin, xmax, ymax, tmax)
+        :type coordinates: Tuple
+        :param obj: ignored, for the rtree signature
+        """
+        bounds = np.asarray(coordinates, dtype=np.float64).reshape(6)
+        level = self._level(bounds)
+        cell = None
+        if level is None:
+            self._overflow.add(id)
+        else:
+            size = self.cell_size * 2 ** level
+            cell = np.floor((bounds[:3] - self.origin) / size).astype(int)
+            cell = tuple(cell.tolist())
+            self._levels.setdefault(level, {}).setdefault(cell, set()).add(id)
+        self._where[id] = (level, cell)
+        self._bounds[id] = tuple(bounds.tolist())
+
+    def delete(self, id, coordinates):
+        """removes a box, O(1)
+
+        :param id: id of the box
+        :type id: Int
+        :param coordinates: ignored, for the rtree signature
+        :type coordinates: Tuple
+        """
+        if id in self._where:
+            level, cell = self._where.pop(id)
+            del self._bounds[id]
+            if level is None:
+                self._overflow.discard(id)
+                return
+            cells = self._levels[level]
+            cells[cell].discard(id)
+            if not cells[cell]:
+                del cells[cell]
+            return
+
+        position = self._static_position[id] if id < len(self._static_position) else -1
+        if position < 0 or not self._static_alive[position]:
+            raise KeyError(id)
+        self._static_alive[position] = False
+
+    def intersection(self, coordinates):
+        """ids of the boxes overlapping a box
+
+        :param coordinates: (xmin, ymin, tmin, xmax, ymax, tmax)
+        :type coordinates: Tuple
+        ...
+        :return: ids
+        :rtype: List[Int]
+        """
+        query = np.asarray(coordinates, dtype=np.float64).reshape(6)
+        hits = self._static_hits(query).tolist()
+        if self._where:
+            hits.extend(self._inserted_hits(query))
+        return hits
+
+    def intersection_v(self, mins, maxs):
+        """bulk intersection, the sorted tier is queried for all boxes at once
+
+        :param mins: (N,3) min corners of the query boxes
+        :type mins: numpy.ndarray
+        :param maxs: (N,3) max corners of the query boxes
+        :type maxs: numpy.ndarray
+        ...
+        :return: (ids, counts), the ids of all hits by query and the hits per query
+        :rtype: Tuple(numpy.ndarray, numpy.ndarray)
+        """
+        queries = np.hstack([np.asarray(mins), np.asarray(maxs)]).astype(np.float64)
+        owners, hits = [], []
+        if len(self._keys):
+            lo, hi = self._cells(queries, self.cell_size)
+            lo = np.maximum(lo, 0)
+            hi = np.minimum(hi, self._shape - 1)
+            span = np.where((hi >= lo).all(axis=1)[:, None], hi - lo + 1, 0)
+
+            # one pass per (x, y) column offset, the t cells are a key range
+            for dx, dy in itertools.product(
+                range(span[:, 0].max(initial=0)), range(span[:, 1].max(initial=0))
+            ):
+                query = np.flatnonzero((dx < span[:, 0]) & (dy < span[:, 1]))
+                column = self._key(lo[query, 0] + dx, lo[query, 1] + dy, 0)
+                positions, counts = _key_ranges(
+                    self._keys, column + lo[query, 2], column + hi[query, 2]
+                )
+                owner = np.repeat(query, counts)
+                keep = self._static_alive[positions] & _overlaps(
+                    self._static_bounds[positions], queries[owner]
+                )
+                owners.append(owner[keep])
+                hits.append(self._ids[positions[keep]])
+
+        if self._where:
+            for i, query in enumerate(queries):
+                inserted = self._inserted_hits(query)
+                owners.append(np.full(len(inserted), i, dtype=np.int64))
+                hits.append(np.array(inserted, dtype=np.int64))
+
+        if not owners:
+            return np.empty(0, dtype=np.int64), np.zeros(len(queries), dtype=np.int64)
+        owners, hits = np.concatenate(owners), np.concatenate(hits)
+        order = np.argsort(owners, kind="stable")
+        return hits[order], np.bincount(owners, minlength=len(queries))
+
+    def _static_hits(self, query):
+        """ids in the sorted tier overlapping one query box"""
+        if not len(self._keys):
+            return self._ids
+        lo, hi = self._cells(query, self.cell_size)
+        lo = np.maximum(lo, 0)
+        hi = np.minimum(hi, self._shape - 1)
+        if (hi < lo).any():
+            return np.empty(0, dtype=np.int64)
+
+        columns = (hi[0] - lo[0] + 1) * (hi[1] - lo[1] + 1)
+        if columns > len(self._keys):
+            # a query over more columns than boxes, look at every box instead
+            positions = np.arange(len(self._keys))
+        else:
+            ax, ay = np.meshgrid(
+                np.arange(lo[0], hi[0] + 1), np.arange(lo[1], hi[1] + 1), indexing="ij"
+            )
+            column = self._key(ax.ravel(), ay.ravel(), 0)
+            positions, _ = _key_ranges(self._keys, column + lo[2], column + hi[2])
+
+        keep = self._static_alive[positions] & _overlaps(
+            self._static_bounds[positions], query
+        )
+        return self._ids[positions[keep]]
+
+    def _inserted_hits(self, query):
+        """ids in the inserted tier and the overflow overlapping one query box"""
+        candidates = set(self._overflow)
+        for level, cells in self._levels.items():
+            if not cells:
+                continue
+            lo, hi = self._cells(query, self.cell_size * 2 ** level)
+            lo, hi = lo.tolist(), hi.tolist()
+            count = (hi[0] - lo[0] + 1) * (hi[1] - lo[1] + 1) * (hi[2] - lo[2] + 1)
+            if count <= len(cells):
+                for cell in itertools.product(
+                    *(range(lo[axis], hi[axis] + 1) for axis in range(3))
+                ):
+                    candidates.update(cells.get(cell, ()))
+            else:
+                for cell, ids in cells.items():
+                    if all(lo[axis] <= cell[axis] <= hi[axis] for axis in range(3)):
+                        candidates.update(ids)
+
+        x0, y0, t0, x1, y1, t1 = query.tolist()
+        hits = []
+        for id in candidates:
+            a0, b0, c0, a1, b1, c1 = self._bounds[id]
+            if a0 <= x1 and x0 <= a1 and b0 <= y1 and y0 <= b1:
+                if c0 <= t1 and t0 <= c1:
+                    hits.append(id)
+        return hits
+
+
+def _key_ranges(keys, starts, ends):
+    """positions of the sorted keys in every [start, end] range, and how many
+    each range has"""
+    first = np.searchsorted(keys, starts, side="left")
+    last = np.searchsorted(keys, ends, side="right")
+    counts = last - first
+    positions = np.repeat(first - np.cumsum(counts) + counts, counts) + np.arange(
+        counts.sum()
+    )
+    return positions, counts
+
+
+def _overlaps(boxes, queries):
+    """row by row overlap test, touching counts"""
+    return np.all(boxes[..., :3] <= queries[..., 3:], axis=-1) & np.all(
+        queries[..., :3] <= boxes[..., 3:], axis=-1
+    )
+
+
+def create_grid(df, ids=None, cell_size=None, max_level=16):
+    """Builds a GridIndex, a drop in for create_rtree when the boxes are about
+    the same size, as the prisms from create_prisms_by_ll are
+
+    :param df: DataFrame with a bounds column of (xmin, ymin, tmin, xmax, ymax, tmax) tuples, or an (N,6) array of bounds
+    :type df: pandas.DataFrame or numpy.ndarray
+    :param ids: ids of the boxes, the row positions by default
+    :type ids: numpy.ndarray
+    :param cell_size: (x, y, t) size of a cell, the largest box extent by default
+    :type cell_size: Tuple[Float]
+    :param max_level: boxes over cell_size * 2 ** max_level go to the overflow
+    :type max_level: Int
+    ...
+    :return: the grid index
+    :rtype: GridIndex
+    """
+    bounds = df if isinstance(df, np.ndarray) else np.array(df.bounds.tolist())
+    bounds = _as_bounds(bounds)
+    ids = np.arange(len(bounds)) if ids is None else np.asarray(ids, dtype=np.int64)
+
+    if cell_size is None:
+        extents = bounds[:, 3:] - bounds[:, :3]
+        cell_size = extents.max(axis=0, initial=0.0)
+        # a flat axis still needs a cell size
+        cell_size = np.where(cell_size > 0, cell_size, 1.0)
+    origin = bounds[:, :3].min(axis=0) if len(bounds) else (0.0, 0.0, 0.0)
+
+    grid = GridIndex(cell_size, origin=origin, max_level=max_level)
+    grid.bulk_load(ids, bounds)
+    return grid
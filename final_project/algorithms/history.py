@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+
+from .store import frame_to_arrays, frame_from_arrays
+
+# one merge of the history, merged boxes have run local (negative) ids
+MERGE_DTYPE = np.dtype(
+    [
+        ("box_1", np.int64),
+        ("box_2", np.int64),
+        ("merged", np.int64),
+        ("delta_c", np.float64),
+    ]
+)
+
+
+class MergeHistory:
+    """Merge sequence (dendrogram) of a greedy run, replayable to any prefix
+
+    Pass one to greedy to record the input boxes and every merge in order.
+    greedy stops at the first delta_c above 0, with a history it carries on
+    merging up to max_delta so replay can also reach fewer queries than greedy.
+    replay rebuilds the result for a query budget or a delta_c threshold from a
+    prefix of the merges, without running greedy again.
+
+    :param max_delta: record merges until the best delta_c is above this, None
+        records until no boxes overlap
+    :type max_delta: Float
+    """
+
+    def __init__(self, max_delta=None):
+        self.max_delta = max_delta
+        self.leaves = None
+        self._merges = []
+        self._array = np.empty(0, dtype=MERGE_DTYPE)
+
+    def __len__(self):
+        return len(self._array) + len(self._merges)
+
+    @property
+    def merges(self):
+        """(M,) array of MERGE_DTYPE in merge order"""
+        if self._merges:
+            recorded = np.array(self._merges, dtype=MERGE_DTYPE)
+            self._array = np.concatenate([self._array, recorded])
+            self._merges = []
+        return self._array
+
+    def start(self, df):
+        """records the input boxes, called by greedy before merging
+
+        :param df: dataframe with bounds, name, unique_id and boxes_inside columns
+        :type df: pandas.DataFrame
+        """
+        self.leaves = df[["bounds", "name", "unique_id", "boxes_inside"]]
+        self.leaves = self.leaves.reset_index(drop=True)
+        self._merges = []
+        self._array = np.empty(0, dtype=MERGE_DTYPE)
+
+    def record(self, box_1, box_2, merged, delta_c):
+        """appends a merge, called by the greedy loop"""
+        self._merges.append((box_1, box_2, merged, delta_c))
+
+    def save(self, path):
+        """writes the input boxes and merges to a compressed .npz file
+
+        :param path: path of the .npz file
+        :type path: str
+        """
+        np.savez_compressed(
+            path,
+            merges=self.merges,
+            max_delta=np.array(np.nan if self.max_delta is None else self.max_delta),
+            **frame_to_arrays(self.leaves),
+        )
+
+    @classmethod
+    def load(cls, path):
+        """reads a history written by save
+
+        :param path: path of the .npz file
+        :type path: str
+        ...
+        :return: the history
+        :rtype: MergeHistory
+        """
+        with np.load(path, allow_pickle=False) as data:
+            max_delta = float(data["max_delta"])
+            history = cls(None if np.isnan(max_delta) else max_delta)
+            history.leaves = frame_from_arrays(data)
+            history._array = data["merges"]
+        return history
+
+    def prefix(self, max_queries=None, max_delta=0):
+        """number of merges replay applies, the merges up to the first one with
+        a delta_c above max_delta, or the fewest that leave at most max_queries
+
+        :param max_queries: query budget, replaces max_delta if set
+        :type max_queries: Int
+        :param max_delta: delta_c threshold, 0 is greedy's own result
+        :type max_delta: Float
+        ...
+        :return: number of merges
+        :rtype: Int
+        """
+        merges = self.merges
+        if max_queries is not None:
+            return int(min(max(len(self.leaves) - max_queries, 0), len(merges)))
+        above = np.flatnonzero(merges["delta_c"] > max_delta)
+        return int(above[0]) if len(above) else len(merges)
+
+    def replay(self, max_queries=None, max_delta=0):
+        """the result of the first prefix(max_queries, max_delta) merges, in the
+        same form greedy returns. With max_queries below what the history
+        reaches, the result of every recorded merge
+
+        :param max_queries: query budget, replaces max_delta if set
+        :type max_queries: Int
+        :param max_delta: delta_c threshold, 0 is greedy's own result
+        :type max_delta: Float
+        ...
+        :return: pandas Dataframe with the query space after the merges
+        :rtype: pandas.DataFrame
+        """
+        from .greedy import _assign_global_ids
+
+        count = self.prefix(max_queries=max_queries, max_delta=max_delta)
+
+        # unique_id -> [bounds, name, boxes_inside], dicts keep the insertion
+        # order so the rows come out in the order greedy's store has them
+        boxes = {
+            unique_id: [list(bounds), name, list(inside)]
+            for bounds, name, unique_id, inside in zip(
+                self.leaves.bounds,
+                self.leaves.name,
+                self.leaves.unique_id.tolist(),
+                self.leaves.boxes_inside,
+            )
+        }
+        for box_1, box_2, merged, _ in self.merges[:count].tolist():
+            bounds_1, name_1, inside_1 = boxes.pop(box_1)
+            bounds_2, name_2, inside_2 = boxes.pop(box_2)
+            boxes[merged] = [
+                [min(a, b) for a, b in zip(bounds_1[:3], bounds_2[:3])]
+                + [max(a, b) for a, b in zip(bounds_1[3:], bounds_2[3:])],
+                name_1 if name_1 == name_2 else None,
+                inside_1 + inside_2 + [box_1, box_2],
+            ]
+
+        df_results = pd.DataFrame(
+            {
+                "bounds": [tuple(box[0]) for box in boxes.values()],
+                "name": [box[1] for box in boxes.values()],
+                "unique_id": list(boxes),
+                "boxes_inside": [box[2] for box in boxes.values()],
+            }
+        )
+        return _assign_global_ids(df_results, count)
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+import logging
+
+import numpy as np
+import pandas as pd
+
+from .candidates import CandidateQueue
+from .greedy import create_index, merge_loop
+from .profiling import get_profiler
+from .store import BoxStore, frame_to_arrays, frame_from_arrays
+from .utils import _bulk_intersection, boxes_intersect, combined_boxes, delta_cs
+from .utils import padded_boxes, df_for_greedy, create_uuid_int64
+
+logger = logging.getLogger(__name__)
+
+
+class IncrementalGreedy:
+    """Greedy state that new prisms are merged into as they arrive
+
+    The state is the active boxes of the previous updates, which greedy has
+    already merged as far as it goes, their boxes_inside and the spatial index.
+    update only adds the new prisms and their candidates, so merging resumes
+    from the neighbourhood of the new boxes instead of the whole history.
+
+    With retention set, boxes whose tmax is more than retention seconds before
+    the latest tmax seen are evicted after every update and returned as final,
+    which keeps the state bounded on a feed that only grows. Boxes can still be
+    merged with prisms up to 2 * temporal_buffer (plus padding) after them, so
+    retention should be larger than that.
+
+    :param coef: algorithm coeficient for padding
+    :type coef: Float
+    :param index: spatial index of the boxes, "rtree" or "grid"
+    :type index: str
+    :param retention: seconds of boxes kept before the latest tmax, None keeps all
+    :type retention: Float
+    :param rtree_properties: keyword arguments for utils.create_rtree
+    :type rtree_properties: Dict
+    """
+
+    def __init__(self, coef=0, index="rtree", retention=None, rtree_properties=None):
+        self.coef = coef
+        self.index = index
+        self.retention = retention
+        self.rtree_properties = rtree_properties
+        self.latest = -np.inf
+        self.store = BoxStore(1024)
+        self.spatial_index = None
+
+    def __len__(self):
+        return len(self.store)
+
+    def results(self):
+        """the active boxes, as greedy returns them
+
+        :return: dataframe with bounds, name, unique_id and boxes_inside columns
+        :rtype: pandas.DataFrame
+        """
+        return self.store.to_frame()
+
+    def update(self, in_prisms, profiler=None):
+        """inserts new prisms and merges them into the state
+
+        :param in_prisms: list of prisms, a PrismArray, or a dataframe for greedy
+        :type in_prisms: List[prism.Prism] or prism.PrismArray or pandas.DataFrame
+        :param profiler: records phase timings and counters of the update
+        :type profiler: profiling.Profiler
+        ...
+        :return: the boxes evicted by the retention horizon
+        :rtype: pandas.DataFrame
+        """
+        profiler = get_profiler(profiler)
+        df = in_prisms
+        if not isinstance(df, pd.DataFrame):
+            df = df_for_greedy(in_prisms)
+        df = df.drop_duplicates(subset=["bounds"])
+
+        with profiler.phase("store_build"):
+            slots = self._insert(df)
+        with profiler.phase("candidate_generation"):
+            candidates = CandidateQueue(self.store)
+            pairs = self._push_candidates(candidates, slots)
+        logger.info(f"{len(slots)} new boxes with {pairs} merge candidates")
+        profiler.count("candidate_pairs", pairs)
+
+        with profiler.phase("greedy_loop"):
+            merges, new_pairs, _ = merge_loop(
+                self.store,
+                self.spatial_index,
+                candidates,
+                self.coef,
+                create_uuid_int64,
+                profiler=profiler,
+            )
+        profiler.count("merges", merges)
+        profiler.count("candidate_pairs", new_pairs)
+        logger.info(f"{merges} merges, {len(self)} boxes in the state")
+
+        if self.retention is None:
+            return self.store.to_frame(slots=[])
+        return self.evict(self.latest - self.retention)
+
+    def evict(self, before):
+        """removes the boxes whose tmax is before a time from the state
+
+        :param before: epoch seconds
+        :type before: Float
+        ...
+        :return: the evicted boxes
+        :rtype: pandas.DataFrame
+        """
+        active = np.flatnonzero(self.store.active)
+        slots = active[self.store.bounds[active, 5] < before]
+        evicted = self.store.to_frame(slots=slots)
+        for slot in slots.tolist():
+            self.spatial_index.delete(slot, self.store.bounds[slot].tolist())
+            self.store.remove(int(self.store.unique_ids[slot]))
+        if len(slots):
+            logger.info(f"evicted {len(slots)} boxes older than {before}")
+        return evicted
+
+    def _insert(self, df):
+        """adds the boxes of a dataframe to the store and the index, no merging"""
+        bounds = np.array(df.bounds.tolist(), dtype=np.float64).reshape(-1, 6)
+        padded = padded_boxes(bounds, coef=self.coef)
+        slots = self.store.add_many(
+            df.unique_id.to_numpy(dtype=np.int64),
+            bounds,
+            padded,
+            boxes_inside=df.boxes_inside,
+            names=df.name,
+        )
+        if len(bounds):
+            self.latest = max(self.latest, bounds[:, 5].max())
+
+        # the first boxes size the grid cells
+        if self.spatial_index is None and len(bounds):
+            self.spatial_index = create_index(
+                bounds, slots, self.index, self.rtree_properties
+            )
+        elif len(bounds):
+            for slot, box in zip(slots.tolist(), bounds.tolist()):
+                self.spatial_index.insert(slot, box)
+        return slots
+
+    def _push_candidates(self, candidates, slots):
+        """pushes every pair of a new box and an older box where the padded box
+        of one overlaps the other, like the initial pairs of greedy"""
+        store = self.store
+        if len(slots) == 0:
+            return 0
+        bounds = store.bounds[slots]
+
+        # the older box's padding can reach further than the new box's own
+        active = np.flatnonzero(store.active)
+        pad = np.maximum(
+            store.bounds[active, :3] - store.padded[active, :3],
+            store.padded[active, 3:] - store.bounds[active, 3:],
+        ).max(axis=0)
+        query = np.hstack([bounds[:, :3] - pad, bounds[:, 3:] + pad])
+
+        owner, hits = _bulk_intersection(
+            self.spatial_index, query, np.arange(len(slots))
+        )
+        owner = slots[owner]
+        # a pair of two new boxes is found from both, the younger one keeps it
+        keep = store.order[hits] < store.order[owner]
+        owner, hits = owner[keep], hits[keep]
+        keep = boxes_intersect(store.padded[owner], store.bounds[hits])
+        keep |= boxes_intersect(store.padded[hits], store.bounds[owner])
+        owner, hits = owner[keep], hits[keep]
+
+        boxes_1, boxes_2 = store.bounds[hits], store.bounds[owner]
+        merged = combined_boxes(boxes_1, boxes_2)
+        deltas = delta_cs(boxes_1, boxes_2, merged, coef=self.coef)
+        candidates.extend(deltas, store.unique_ids[hits], store.unique_ids[owner])
+        return len(hits)
+
+    def save(self, path):
+        """writes the state to a compressed .npz file, the index is rebuilt on load
+
+        :param path: path of the .npz file
+        :type path: str
+        """
+        np.savez_compressed(
+            path,
+            settings=np.array(
+                json.dumps(
+                    {
+                        "coef": self.coef,
+                        "index": self.index,
+                        "retention": self.retention,
+                        "rtree_properties": self.rtree_properties,
+                        "latest": float(self.latest),
+                    }
+                )
+            ),
+            **frame_to_arrays(self.store.to_frame()),
+        )
+
+    @classmethod
+    def load(cls, path):
+        """reads a state written by save
+
+        :param path: path of the .npz file
+        :type path: str
+        ...
+        :return: the state
+        :rtype: IncrementalGreedy
+        """
+        with np.load(path, allow_pickle=False) as data:
+            settings = json.loads(str(data["settings"]))
+            df = frame_from_arrays(data)
+
+        state = cls(
+            settings["coef"],
+            settings["index"],
+            settings["retention"],
+            settings.get("rtree_properties"),
+        )
+        state._insert(df)
+        state.latest = settings["latest"]
+        return state
@@ -2,10 +2,13 @@
 # -*- coding: utf-8 -*-
 
 from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
 from stringcase import camelcase
 from dataclass_dict_convert import dataclass_dict_convert
 
-from .utils import create_uuid_int64
+from .utils import create_uuid_int64, reserve_uuid_int64
 
 
 @dataclass_dict_convert(dict_letter_case=camelcase)
@@ -111,3 +114,220 @@ class Prism:
         return (
             (self.xmax - self.xmin) * (self.ymax - self.ymin) * (self.tmax - self.tmin)
         )
+
+
+class PrismArray:
+    """
+    Struct of arrays version of a list of Prism objects, every field is a
+    contiguous NumPy column so bounds, volumes and lengths are computed for all
+    prisms at once. Indexing with an int returns a Prism view of that element,
+    indexing with a slice or array returns a PrismArray
+
+    :param x: x centerpoints
+    :type x: numpy.ndarray
+    :param y: y centerpoints
+    :type y: numpy.ndarray
+    :param timestamp: timestamps in seconds since epoch
+    :type timestamp: numpy.ndarray
+    :param x_buffer: buffer distances in meters for x
+    :type x_buffer: numpy.ndarray
+    :param y_buffer: buffer distances in meters for y
+    :type y_buffer: numpy.ndarray
+    :param temporal_buffer: time buffers in seconds
+    :type temporal_buffer: numpy.ndarray
+    :param lon: lon centerpoints
+    :type lon: numpy.ndarray
+    :param lat: lat centerpoints
+    :type lat: numpy.ndarray
+    :param names: ids of the objects
+    :type names: List[str]
+    :param uuid: unique ids, set if not specified
+    :type uuid: numpy.ndarray
+    :param crs: the crs we are in
+    :type crs: str
+    """
+
+    _columns = [
+        "x",
+        "y",
+        "timestamp",
+        "x_buffer",
+        "y_buffer",
+        "temporal_buffer",
+        "lon",
+        "lat",
+        "name_codes",
+        "uuid",
+    ]
+
+    def __init__(
+        self,
+        x,
+        y,
+        timestamp,
+        x_buffer,
+        y_buffer,
+        temporal_buffer,
+        lon=None,
+        lat=None,
+        names=None,
+        uuid=None,
+        crs="epsg:3857",
+    ):
+        self.x = np.ascontiguousarray(x, dtype=np.float64)
+        count = len(self.x)
+        self.y = np.ascontiguousarray(y, dtype=np.float64)
+        self.timestamp = np.ascontiguousarray(timestamp, dtype=np.float64)
+        self.x_buffer = self._column(x_buffer, count)
+        self.y_buffer = self._column(y_buffer, count)
+        self.temporal_buffer = self._column(temporal_buffer, count)
+        self.lon = self._column(np.nan if lon is None else lon, count)
+        self.lat = self._column(np.nan if lat is None else lat, count)
+        self.crs = crs
+
+        # names are stored once, each prism keeps a small integer code
+        if names is None:
+            names = np.full(count, None, dtype=object)
+        codes, categories = pd.factorize(np.asarray(names, dtype=object))
+        self.name_codes = codes.astype(np.int32)
+        self.name_categories = np.asarray(categories, dtype=object)
+
+        if uuid is None:
+            uuid = reserve_uuid_int64(count)
+        self.uuid = np.ascontiguousarray(uuid, dtype=np.int64)
+
+    @staticmethod
+    def _column(values, count):
+        """float column, scalars are broadcast to every prism"""
+        return np.ascontiguousarray(
+            np.broadcast_to(np.asarray(values, dtype=np.float64), (count,))
+        )
+
+    @classmethod
+    def from_prisms(cls, prisms):
+        """builds a PrismArray from a list of Prism objects
+
+        :param prisms: list of prisms
+        :type prisms: List[Prism]
+        ...
+        :return: the same prisms as columns
+        :rtype: PrismArray
+        """
+        if isinstance(prisms, cls):
+            return prisms
+        prisms = list(prisms)
+        return cls(
+            x=[prism.x for prism in prisms],
+            y=[prism.y for prism in prisms],
+            timestamp=[prism.timestamp for prism in prisms],
+            x_buffer=[prism.x_buffer for prism in prisms],
+            y_buffer=[prism.y_buffer for prism in prisms],
+            temporal_buffer=[prism.temporal_buffer for prism in prisms],
+            lon=[prism.lon for prism in prisms],
+            lat=[prism.lat for prism in prisms],
+            names=[prism.name for prism in prisms],
+            uuid=[prism.uuid for prism in prisms],
+            crs=prisms[0].crs if prisms else "epsg:3857",
+        )
+
+    def __len__(self):
+        return len(self.x)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, item):
+        if isinstance(item, (int, np.integer)):
+            return Prism(
+                lat=float(self.lat[item]),
+                lon=float(self.lon[item]),
+                x=float(self.x[item]),
+                y=float(self.y[item]),
+                timestamp=float(self.timestamp[item]),
+                name=self.name_categories[self.name_codes[item]]
+                if self.name_codes[item] >= 0
+                else None,
+                x_buffer=float(self.x_buffer[item]),
+                y_buffer=float(self.y_buffer[item]),
+                temporal_buffer=float(self.temporal_buffer[item]),
+                crs=self.crs,
+                uuid=int(self.uuid[item]),
+            )
+
+        subset = PrismArray.__new__(PrismArray)
+        for column in self._columns:
+            setattr(subset, column, getattr(self, column)[item])
+        subset.name_categories = self.name_categories
+        subset.crs = self.crs
+        return subset
+
+    @property
+    def names(self):
+        """object array of names"""
+        names = np.empty(len(self), dtype=object)
+        known = self.name_codes >= 0
+        names[known] = self.name_categories[self.name_codes[known]]
+        return names
+
+    @property
+    def xmin(self):
+        """x mins"""
+        return self.x - self.x_buffer
+
+    @property
+    def xmax(self):
+        """x maxs"""
+        return self.x + self.x_buffer
+
+    @property
+    def ymin(self):
+        """y mins"""
+        return self.y - self.y_buffer
+
+    @property
+    def ymax(self):
+        """y maxs"""
+        return self.y + self.y_buffer
+
+    @property
+    def tmin(self):
+        """min times"""
+        return self.timestamp - self.temporal_buffer
+
+    @property
+    def tmax(self):
+        """max times"""
+        return self.timestamp + self.temporal_buffer
+
+    @property
+    def bounds(self):
+        """returns (N,6) array of (xmin, ymin, tmin, xmax, ymax, tmax)"""
+        return np.column_stack(
+            [self.xmin, self.ymin, self.tmin, self.xmax, self.ymax, self.tmax]
+        )
+
+    @property
+    def length_x(self):
+        """x lengths"""
+        return self.xmax - self.xmin
+
+    @property
+    def length_y(self):
+        """y lengths"""
+        return self.ymax - self.ymin
+
+    @property
+    def length_t(self):
+        """time lengths"""
+        return self.tmax - self.tmin
+
+    @property
+    def volume(self):
+        """Returns volumes as an array"""
+        return self.length_x * self.length_y * self.length_t
+
+    @property
+    def nbytes(self):
+        """memory used by the columns in bytes"""
+        return sum(getattr(self, column).nbytes for column in self._columns)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import sys
+import json
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # not available on windows
+    resource = None
+
+
+def peak_rss_mb():
+    """peak resident memory of this process in MB, None if it cannot be read"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class Profiler:
+    """Collects per-phase timings, counters and sampled series of a run
+
+    Pass one to Greedy.run, greedy, the generator functions or the cli (with
+    --profile) and read it back with to_dict, phases that run more than once
+    are accumulated.
+
+    :param sample_interval: record the series every this many merges
+    :type sample_interval: Int
+    """
+
+    enabled = True
+
+    def __init__(self, sample_interval=1000):
+        self.sample_interval = sample_interval
+        self.phases = {}
+        self.counters = Counter()
+        self.series = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name):
+        """times the wall and cpu time of the block as the phase name
+
+        :param name: name of the phase
+        :type name: str
+        """
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield self
+        finally:
+            stats = self.phases.setdefault(
+                name, {"wall": 0.0, "cpu": 0.0, "calls": 0, "peak_rss_mb": None}
+            )
+            stats["wall"] += time.perf_counter() - wall
+            stats["cpu"] += time.process_time() - cpu
+            stats["calls"] += 1
+            stats["peak_rss_mb"] = peak_rss_mb()
+
+    def count(self, name, value=1):
+        """adds value to the counter name"""
+        self.counters[name] += int(value)
+
+    def sample(self, name, step, value):
+        """appends (step, seconds since the profiler started, value) to the series name"""
+        self.series.setdefault(name, []).append(
+            (int(step), time.perf_counter() - self._start, value)
+        )
+
+    def update(self, other):
+        """accumulates the phases and counters of another profiler's to_dict,
+        used to collect the profiles of worker processes"""
+        for name, stats in other["phases"].items():
+            mine = self.phases.setdefault(
+                name, {"wall": 0.0, "cpu": 0.0, "calls": 0, "peak_rss_mb": None}
+            )
+            for key in ["wall", "cpu", "calls"]:
+                mine[key] += stats[key]
+            peaks = [p for p in (mine["peak_rss_mb"], stats["peak_rss_mb"]) if p]
+            mine["peak_rss_mb"] = max(peaks) if peaks else None
+        self.counters.update(other["counters"])
+        for name, values in other["series"].items():
+            self.series.setdefault(name, []).extend(values)
+
+    def to_dict(self):
+        """everything recorded so far, json serializable
+
+        :return: dict with phases, counters, series and peak_rss_mb
+        :rtype: Dict
+        """
+        return {
+            "phases": {name: dict(stats) for name, stats in self.phases.items()},
+            "counters": dict(self.counters),
+            "series": {name: list(values) for name, values in self.series.items()},
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+    def dump(self, path):
+        """writes to_dict to a json file
+
+        :param path: path of the json file
+        :type path: str
+        """
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+class NullProfiler(Profiler):
+    """Profiler that records nothing, used when no profiler is passed"""
+
+    enabled = False
+
+    @contextmanager
+    def phase(self, name):
+        yield self
+
+    def count(self, name, value=1):
+        pass
+
+    def sample(self, name, step, value):
+        pass
+
+
+def get_profiler(profiler=None):
+    """the given profiler or a NullProfiler"""
+    return NullProfiler() if profiler is None else profiler
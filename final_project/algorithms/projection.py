@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from pyproj import Proj, Transformer
+
+# pyproj objects must not be used by two threads at once, every thread keeps its
+# own, and the chunks of transform check one out of _idle for as long as they run
+_local = threading.local()
+_lock = threading.Lock()
+_idle = {}
+
+# one thread pool for the chunks of every transform call, made on first use
+_pool = None
+
+
+def _clear_cache():
+    """forked children start with empty caches and no pool instead of the
+    parent's objects and threads, which do not exist in the child"""
+    global _pool, _lock
+    _local.__dict__.clear()
+    _idle.clear()
+    _lock = threading.Lock()
+    _pool = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_clear_cache)
+
+
+def get_transformer(src_crs, dst_crs, always_xy=True):
+    """cached pyproj Transformer, built once per (src_crs, dst_crs, always_xy)
+    in each thread of each process
+
+    :param src_crs: crs of the input coordinates
+    :type src_crs: str
+    :param dst_crs: crs of the output coordinates
+    :type dst_crs: str
+    :param always_xy: lon/lat (x/y) axis order for geographic crs
+    :type always_xy: bool
+    ...
+    :return: the transformer
+    :rtype: pyproj.Transformer
+    """
+    cache = getattr(_local, "transformers", None)
+    if cache is None:
+        cache = _local.transformers = {}
+
+    key = (src_crs, dst_crs, always_xy)
+    if key not in cache:
+        cache[key] = Transformer.from_proj(
+            Proj(src_crs), Proj(dst_crs), always_xy=always_xy
+        )
+    return cache[key]
+
+
+@contextmanager
+def _checkout(src_crs, dst_crs, always_xy):
+    """a transformer no other thread is using, built only if all are in use"""
+    key = (src_crs, dst_crs, always_xy)
+    with _lock:
+        idle = _idle.setdefault(key, [])
+        transformer = idle.pop() if idle else None
+    if transformer is None:
+        transformer = Transformer.from_proj(
+            Proj(src_crs), Proj(dst_crs), always_xy=always_xy
+        )
+    try:
+        yield transformer
+    finally:
+        with _lock:
+            _idle[key].append(transformer)
+
+
+def _get_pool():
+    """the shared thread pool, one thread per cpu"""
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+        return _pool
+
+
+def transform(
+    src_crs, dst_crs, xx, yy, always_xy=True, chunk_size=1_000_000, workers=None
+):
+    """transforms coordinate arrays, large arrays are split into chunks that run
+    on a thread pool (pyproj releases the GIL while transforming), the pool and
+    its transformers are kept for the next call
+
+    :param src_crs: crs of the input coordinates
+    :type src_crs: str
+    :param dst_crs: crs of the output coordinates
+    :type dst_crs: str
+    :param xx: x (or lon) coordinates
+    :type xx: numpy.ndarray
+    :param yy: y (or lat) coordinates
+    :type yy: numpy.ndarray
+    :param always_xy: lon/lat (x/y) axis order for geographic crs
+    :type always_xy: bool
+    :param chunk_size: number of coordinates per chunk
+    :type chunk_size: Int
+    :param workers: number of threads, defaults to the number of cpus
+    :type workers: Int
+    ...
+    :return: transformed (xx, yy)
+    :rtype: Tuple(numpy.ndarray, numpy.ndarray)
+    """
+    xx = np.asarray(xx, dtype=np.float64)
+    yy = np.asarray(yy, dtype=np.float64)
+
+    chunks = int(np.ceil(len(xx) / chunk_size))
+    workers = min(workers or os.cpu_count() or 1, chunks)
+    if workers <= 1:
+        return get_transformer(src_crs, dst_crs, always_xy).transform(xx, yy)
+
+    out_x = np.empty_like(xx)
+    out_y = np.empty_like(yy)
+
+    def run_chunks(starts):
+        with _checkout(src_crs, dst_crs, always_xy) as transformer:
+            for start in starts:
+                stop = start + chunk_size
+                out_x[start:stop], out_y[start:stop] = transformer.transform(
+                    xx[start:stop], yy[start:stop]
+                )
+
+    # a task per worker, so no more than workers chunks run at once
+    starts = range(0, len(xx), chunk_size)
+    tasks = [starts[i::workers] for i in range(workers)]
+    list(_get_pool().map(run_chunks, tasks))
+
+    return out_x, out_y
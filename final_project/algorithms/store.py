@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import itertools
+
+import numpy as np
+import pandas as pd
+
+
+class BoxStore:
+    """Mutable store of the active boxes in the greedy loop
+
+    Bounds, padded bounds and boxes_inside live in preallocated NumPy arrays,
+    removed slots go on a free-list and are reused by the next insert, so deleting
+    and inserting a box by unique_id are both O(1) and nothing is copied per merge.
+
+    :param capacity: number of slots to preallocate, grows if exceeded
+    :type capacity: Int
+    """
+
+    def __init__(self, capacity):
+        capacity = max(int(capacity), 1)
+        self.bounds = np.empty((capacity, 6), dtype=np.float64)
+        self.padded = np.empty((capacity, 6), dtype=np.float64)
+        self.unique_ids = np.zeros(capacity, dtype=np.int64)
+        self.names = np.empty(capacity, dtype=object)
+        self.boxes_inside = np.empty(capacity, dtype=object)
+        self.order = np.zeros(capacity, dtype=np.int64)
+        self.active = np.zeros(capacity, dtype=bool)
+        self._free = list(range(capacity - 1, -1, -1))
+        self._slots = {}
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, unique_id):
+        return unique_id in self._slots
+
+    @property
+    def capacity(self):
+        """number of allocated slots"""
+        return len(self.active)
+
+    def _grow(self):
+        """doubles the number of slots, only needed if more boxes than capacity"""
+        old = self.capacity
+        new = old * 2
+        for attr in ["bounds", "padded"]:
+            array = np.empty((new, 6), dtype=np.float64)
+            array[:old] = getattr(self, attr)
+            setattr(self, attr, array)
+        for attr in ["unique_ids", "names", "boxes_inside", "order", "active"]:
+            current = getattr(self, attr)
+            array = np.zeros(new, dtype=current.dtype)
+            array[:old] = current
+            setattr(self, attr, array)
+        self.names[old:] = None
+        self.boxes_inside[old:] = None
+        self._free.extend(range(new - 1, old - 1, -1))
+
+    def slot(self, unique_id):
+        """slot index of an active box
+
+        :param unique_id: unique_id of the box
+        :type unique_id: Int
+        ...
+        :return: slot index
+        :rtype: Int
+        """
+        return self._slots[unique_id]
+
+    def add(self, unique_id, bounds, padded, boxes_inside=None, name=None):
+        """insert a box, O(1)
+
+        :param unique_id: unique_id
+        :type unique_id: Int
+        :param bounds: (xmin, ymin, tmin, xmax, ymax, tmax)
+        :type bounds: Tuple
+        :param padded: padded bounds (xmin, ymin, tmin, xmax, ymax, tmax)
+        :type padded: Tuple
+        :param boxes_inside: unique_ids of the boxes merged into this box
+        :type boxes_inside: List[Int]
+        :param name: name of the box
+        :type name: Str
+        ...
+        :return: slot index
+        :rtype: Int
+        """
+        if not self._free:
+            self._grow()
+        slot = self._free.pop()
+        self.bounds[slot] = bounds
+        self.padded[slot] = padded
+        self.unique_ids[slot] = unique_id
+        self.names[slot] = name
+        self.boxes_inside[slot] = [] if boxes_inside is None else boxes_inside
+        self.order[slot] = next(self._counter)
+        self.active[slot] = True
+        self._slots[unique_id] = slot
+        return slot
+
+    def add_many(self, unique_ids, bounds, padded, boxes_inside=None, names=None):
+        """insert a batch of boxes, see add
+
+        :param unique_ids: (N,) unique_ids
+        :type unique_ids: numpy.ndarray
+        :param bounds: (N,6) array of bounds
+        :type bounds: numpy.ndarray
+        :param padded: (N,6) array of padded bounds
+        :type padded: numpy.ndarray
+        :param boxes_inside: list of boxes_inside lists
+        :type boxes_inside: List[List[Int]]
+        :param names: list of names
+        :type names: List[Str]
+        ...
+        :return: slot indexes
+        :rtype: numpy.ndarray
+        """
+        unique_ids = np.asarray(unique_ids, dtype=np.int64)
+        count = len(unique_ids)
+        if count == 0:
+            return np.empty(0, dtype=np.int64)
+        while len(self._free) < count:
+            self._grow()
+        slots = np.array(self._free[-count:][::-1], dtype=np.int64)
+        del self._free[len(self._free) - count :]
+
+        self.bounds[slots] = bounds
+        self.padded[slots] = padded
+        self.unique_ids[slots] = unique_ids
+        self.names[slots] = None if names is None else list(names)
+        if boxes_inside is None:
+            boxes_inside = [[] for _ in range(count)]
+        # assign one by one so numpy never tries to broadcast the lists
+        for slot, inside in zip(slots.tolist(), boxes_inside):
+            self.boxes_inside[slot] = list(inside)
+        self.order[slots] = [next(self._counter) for _ in range(count)]
+        self.active[slots] = True
+        self._slots.update(zip(unique_ids.tolist(), slots.tolist()))
+        return slots
+
+    def remove(self, unique_id):
+        """delete a box, O(1), its slot goes back on the free-list
+
+        :param unique_id: unique_id
+        :type unique_id: Int
+        ...
+        :return: the freed slot index
+        :rtype: Int
+        """
+        slot = self._slots.pop(unique_id)
+        self.active[slot] = False
+        self.names[slot] = None
+        self.boxes_inside[slot] = None
+        self._free.append(slot)
+        return slot
+
+    def get_bounds(self, unique_id):
+        """bounds of an active box as a tuple"""
+        return tuple(self.bounds[self._slots[unique_id]].tolist())
+
+    def get_boxes_inside(self, unique_id):
+        """boxes_inside list of an active box"""
+        return self.boxes_inside[self._slots[unique_id]]
+
+    def to_frame(self, slots=None):
+        """builds the results dataframe from the active boxes, in insertion order
+
+        :param slots: only these slots, all active boxes by default
+        :type slots: numpy.ndarray
+        ...
+        :return: dataframe with unique_id, bounds, name and boxes_inside columns
+        :rtype: pandas.DataFrame
+        """
+        if slots is None:
+            slots = np.flatnonzero(self.active)
+        slots = np.asarray(slots, dtype=np.int64)
+        slots = slots[np.argsort(self.order[slots], kind="stable")]
+        return pd.DataFrame(
+            {
+                "bounds": [tuple(b) for b in self.bounds[slots].tolist()],
+                "name": self.names[slots],
+                "unique_id": self.unique_ids[slots],
+                "boxes_inside": self.boxes_inside[slots],
+            }
+        )
+
+
+def frame_to_arrays(df):
+    """the columns of a greedy dataframe as flat arrays that np.savez can write
+    without pickles, boxes_inside is flattened with a count per box
+
+    :param df: dataframe with bounds, name, unique_id and boxes_inside columns
+    :type df: pandas.DataFrame
+    ...
+    :return: dict of arrays, see frame_from_arrays
+    :rtype: Dict
+    """
+    return {
+        "bounds": np.array(df.bounds.tolist(), dtype=np.float64).reshape(-1, 6),
+        "unique_ids": df.unique_id.to_numpy(dtype=np.int64),
+        "names": np.array([str(n) if n is not None else "" for n in df.name]),
+        "named": df.name.notna().to_numpy(dtype=bool),
+        "inside": np.fromiter(
+            itertools.chain.from_iterable(df.boxes_inside), dtype=np.int64
+        ),
+        "inside_counts": np.array([len(i) for i in df.boxes_inside], dtype=np.int64),
+    }
+
+
+def frame_from_arrays(arrays):
+    """rebuilds the dataframe frame_to_arrays was given
+
+    :param arrays: mapping with the arrays of frame_to_arrays, e.g. an NpzFile
+    :type arrays: Mapping
+    ...
+    :return: dataframe with bounds, name, unique_id and boxes_inside columns
+    :rtype: pandas.DataFrame
+    """
+    names = arrays["names"].astype(object)
+    names[~arrays["named"]] = None
+    counts = arrays["inside_counts"]
+    inside = []
+    if len(counts):
+        inside = np.split(arrays["inside"], np.cumsum(counts)[:-1])
+    return pd.DataFrame(
+        {
+            "bounds": [tuple(b) for b in arrays["bounds"].tolist()],
+            "name": names,
+            "unique_id": arrays["unique_ids"],
+            "boxes_inside": [i.tolist() for i in inside],
+        }
+    )
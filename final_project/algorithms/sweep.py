@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import time
+import logging
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .generator import ll_bounds
+from .greedy import Greedy
+from .prism import PrismArray
+from .profiling import get_profiler
+from .projection import transform
+from .utils import box_volumes
+
+logger = logging.getLogger(__name__)
+
+# the projected points of a sweep, set once per worker process
+_points = None
+
+
+def sweep(
+    lons,
+    lats,
+    timestamps,
+    names,
+    coefs,
+    temporal_buffers,
+    distance_buffers,
+    workers=None,
+    index="rtree",
+    profiler=None,
+    options=None,
+):
+    """Runs greedy for every combination of coef, temporal and distance buffer
+
+    The points are projected once and sent to each worker process once, every
+    combination only builds its prisms from the projected points and runs greedy.
+    Every combination runs in one process, with the same options.
+
+    :param lons: list of lons
+    :type lons: List[float]
+    :param lats: list of lats
+    :type lats: List[float]
+    :param timestamps: list of timestamps
+    :type timestamps: List[float]
+    :param names: list of names
+    :type names: List[Str]
+    :param coefs: algorithm coefficients
+    :type coefs: List[Float]
+    :param temporal_buffers: temporal buffers in seconds
+    :type temporal_buffers: List[Float]
+    :param distance_buffers: distance buffers in meters
+    :type distance_buffers: List[Float]
+    :param workers: number of worker processes, 1 runs in this process
+    :type workers: Int
+    :param index: spatial index of the boxes, "rtree" or "grid", if options has none
+    :type index: str
+    :param profiler: records the projection and sweep phases
+    :type profiler: profiling.Profiler
+    :param options: keyword arguments for Greedy.run, e.g. top_k, engine or
+        group_by_name, workers and history are not allowed
+    :type options: Dict
+    ...
+    :return: (summary, results), the summary has a row per combination with
+        coef, temporal_buffer, distance_buffer, queries, total_volume (m^2 s)
+        and runtime (s), results has the (N,6) lat/lon bounds of every row
+    :rtype: Tuple(pandas.DataFrame, List[numpy.ndarray])
+    """
+    profiler = get_profiler(profiler)
+    workers = workers or os.cpu_count()
+    options = dict(options or {})
+    options.setdefault("index", index)
+    if "workers" in options or "history" in options:
+        raise ValueError("a sweep runs every combination in one process, no history")
+    with profiler.phase("projection"):
+        lons = np.asarray(lons, dtype=np.float64)
+        lats = np.asarray(lats, dtype=np.float64)
+        xs, ys = transform("epsg:4326", "epsg:3857", lons, lats)
+    points = (xs, ys, np.asarray(timestamps, dtype=np.float64), np.asarray(names))
+
+    combinations = list(itertools.product(coefs, temporal_buffers, distance_buffers))
+    logger.info(f"sweeping {len(combinations)} combinations on {len(xs)} points")
+    with profiler.phase("sweep"):
+        if workers <= 1:
+            _init_sweep(points)
+            rows = [_sweep_task(*combination, options) for combination in combinations]
+        else:
+            with ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_sweep, initargs=(points,)
+            ) as pool:
+                futures = [
+                    pool.submit(_sweep_task, *combination, options)
+                    for combination in combinations
+                ]
+                rows = [future.result() for future in futures]
+
+    summary = pd.DataFrame([row for row, _ in rows])
+    return summary, [results for _, results in rows]
+
+
+def _init_sweep(points):
+    """keeps the projected points in the worker process"""
+    global _points
+    _points = points
+
+
+def _sweep_task(coef, temporal_buffer, distance_buffer, options):
+    """greedy on the prisms of one combination, returns its summary row and
+    the lat/lon bounds of the results"""
+    xs, ys, timestamps, names = _points
+    start = time.perf_counter()
+    prisms = PrismArray(
+        x=xs,
+        y=ys,
+        timestamp=timestamps,
+        x_buffer=distance_buffer,
+        y_buffer=distance_buffer,
+        temporal_buffer=temporal_buffer,
+        names=names,
+    )
+    greedy = Greedy()
+    greedy.run(prisms, coef, build_prisms=False, **options)
+    bounds = greedy.out_bounds
+    runtime = time.perf_counter() - start
+
+    row = {
+        "coef": coef,
+        "temporal_buffer": temporal_buffer,
+        "distance_buffer": distance_buffer,
+        "queries": len(bounds),
+        "total_volume": float(box_volumes(bounds).sum()),
+        "runtime": runtime,
+    }
+    logger.info(f"sweep {row}")
+    return row, ll_bounds(bounds, "epsg:3857")
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+
+from .prism import PrismArray
+from .utils import reserve_uuid_int64
+
+
+def compress_tracks(prisms, coef=0, min_overlap=0.5):
+    """Collapses runs of consecutive prisms of a track into their bounding prism
+
+    Every track (name) is sorted by time and a prism joins the run before it if
+    at least min_overlap of its volume is inside the run's bounding prism and
+    merging them is a merge greedy would make anyway (delta_c <= 0). On dense
+    tracks most prisms overlap their neighbours and the input to greedy shrinks
+    by an order of magnitude.
+
+    :param prisms: list of prisms or a PrismArray
+    :type prisms: List[prism.Prism] or prism.PrismArray
+    :param coef: algorithm coeficient for padding
+    :type coef: Float
+    :param min_overlap: fraction of a prism's volume that must overlap the run
+    :type min_overlap: Float
+    ...
+    :return: dataframe for greedy with bounds, name, unique_id, boxes_inside
+    :rtype: pandas.DataFrame
+    """
+    prisms = PrismArray.from_prisms(prisms)
+    if len(prisms) == 0:
+        return pd.DataFrame(columns=["bounds", "name", "unique_id", "boxes_inside"])
+
+    order = np.lexsort((prisms.timestamp, prisms.name_codes))
+    bounds = prisms.bounds[order]
+    codes = prisms.name_codes[order]
+    uuids = prisms.uuid[order]
+
+    runs = track_runs(bounds, codes, coef=coef, min_overlap=min_overlap)
+    starts = np.flatnonzero(np.r_[True, runs[1:] != runs[:-1]])
+    sizes = np.diff(np.r_[starts, len(runs)])
+
+    run_bounds = np.hstack(
+        [
+            np.minimum.reduceat(bounds[:, :3], starts, axis=0),
+            np.maximum.reduceat(bounds[:, 3:], starts, axis=0),
+        ]
+    )
+
+    # a prism on its own keeps its uuid, a collapsed run is a new box
+    unique_ids = uuids[starts].copy()
+    collapsed = np.flatnonzero(sizes > 1)
+    unique_ids[collapsed] = reserve_uuid_int64(len(collapsed))
+    members = np.split(uuids, starts[1:])
+    boxes_inside = [
+        members[run].tolist() if size > 1 else [] for run, size in enumerate(sizes)
+    ]
+
+    names = np.full(len(starts), None, dtype=object)
+    run_codes = codes[starts]
+    known = run_codes >= 0
+    names[known] = prisms.name_categories[run_codes[known]]
+
+    return pd.DataFrame(
+        {
+            "bounds": [tuple(b) for b in run_bounds.tolist()],
+            "name": names,
+            "unique_id": unique_ids,
+            "boxes_inside": boxes_inside,
+        }
+    )
+
+
+def track_runs(bounds, codes, coef=0, min_overlap=0.5):
+    """Run number of every prism, the prisms must be sorted by track then time
+
+    :param bounds: (N,6) array of (xmin, ymin, tmin, xmax, ymax, tmax)
+    :type bounds: numpy.ndarray
+    :param codes: (N,) track of every prism
+    :type codes: numpy.ndarray
+    :param coef: algorithm coeficient for padding
+    :type coef: Float
+    :param min_overlap: fraction of a prism's volume that must overlap the run
+    :type min_overlap: Float
+    ...
+    :return: (N,) run numbers, equal for the prisms of one run
+    :rtype: numpy.ndarray
+    """
+    if len(bounds) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    runs = [0] * len(bounds)
+    rows = bounds.tolist()
+    codes = codes.tolist()
+    volumes = np.prod(bounds[:, 3:] - bounds[:, :3], axis=1).tolist()
+
+    # the run's bounding prism and its volume, a plain loop since every prism
+    # depends on the run before it
+    run = 0
+    x0, y0, t0, x1, y1, t1 = rows[0]
+    run_volume = volumes[0]
+    for i in range(1, len(rows)):
+        a0, b0, c0, a1, b1, c1 = rows[i]
+        volume = volumes[i]
+        if codes[i] == codes[i - 1]:
+            overlap = (
+                max(min(x1, a1) - max(x0, a0), 0.0)
+                * max(min(y1, b1) - max(y0, b0), 0.0)
+                * max(min(t1, c1) - max(t0, c0), 0.0)
+            )
+            if overlap >= min_overlap * volume:
+                m0, n0, o0 = min(x0, a0), min(y0, b0), min(t0, c0)
+                m1, n1, o1 = max(x1, a1), max(y1, b1), max(t1, c1)
+                merged_volume = (m1 - m0) * (n1 - n0) * (o1 - o0)
+                if merged_volume - run_volume - volume - coef <= 0:
+                    x0, y0, t0, x1, y1, t1 = m0, n0, o0, m1, n1, o1
+                    run_volume = merged_volume
+                    runs[i] = run
+                    continue
+
+        run += 1
+        x0, y0, t0, x1, y1, t1 = a0, b0, c0, a1, b1, c1
+        run_volume = volume
+        runs[i] = run
+
+    return np.array(runs, dtype=np.int64)
@@ -1,7 +1,15 @@
+import os
 import uuid
+import itertools
+import threading
+import numpy as np
 from rtree import index
 import pandas as pd
 
+# rtree >= 1.1 (the release with intersection_v) can bulk load from arrays,
+# older releases read a tuple as an (id, coords, obj) stream
+RTREE_ARRAYS = hasattr(index.Index, "intersection_v")
+
 
 def overlapping_boxes(box, unique_id, rtree_index):
     """Returns a list of dicts of boxes in an rtree overlapping with box
@@ -44,51 +52,263 @@ def new_boxes(original_bounds, unique_id, list_overlapping_boxes, coef):
     :return: list of overlapping boxes
     :rtype: List(Tuple)
     """
-    new_cube_list = [
+    overlap_bounds = [overlap_box["bounds"] for overlap_box in list_overlapping_boxes]
+    merged = combined_boxes(original_bounds, overlap_bounds)
+    deltas = delta_cs(original_bounds, overlap_bounds, merged, coef=coef)
+
+    return [
         {
             "unique_id": create_uuid_int64(),
-            "bounds": combined_box(original_bounds, overlap_box["bounds"]),
+            "bounds": tuple(bounds),
             "box_1_uuid": unique_id,
             "box_2_uuid": overlap_box["unique_id"],
+            "delta_c": delta,
         }
-        for overlap_box in list_overlapping_boxes
+        for overlap_box, bounds, delta in zip(
+            list_overlapping_boxes, merged.tolist(), deltas.tolist()
+        )
     ]
 
-    for index, new_cube in enumerate(new_cube_list):
-        new_cube.update(
-            {
-                "delta_c": delta_c(
-                    original_bounds,
-                    list_overlapping_boxes[index]["bounds"],
-                    new_cube["bounds"],
-                    coef=coef,
-                )
-            }
+
+def overlapping_pairs(bounds, padded, rtree_index, chunk_size=65536):
+    """Bulk overlap join, returns every pair of boxes where the padded box of one
+    overlaps the other, each unordered pair exactly once
+
+    :param bounds: (N,6) array of (xmin, ymin, tmin, xmax, ymax, tmax)
+    :type bounds: numpy.ndarray
+    :param padded: (N,6) array of the padded bounds
+    :type padded: numpy.ndarray
+    :param rtree_index: rtree of bounds, the ids must be the row positions
+    :type rtree_index: rtree.index.Index
+    :param chunk_size: number of boxes queried per bulk rtree call
+    :type chunk_size: Int
+    ...
+    :return: (box_1, box_2) arrays of row positions with box_1 < box_2
+    :rtype: Tuple(numpy.ndarray, numpy.ndarray)
+    """
+    chunks = list(iter_overlapping_pairs(bounds, padded, rtree_index, chunk_size))
+    if not chunks:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    boxes_1, boxes_2 = zip(*chunks)
+    return np.concatenate(boxes_1), np.concatenate(boxes_2)
+
+
+def iter_overlapping_pairs(bounds, padded, rtree_index, chunk_size=65536):
+    """overlapping_pairs one chunk of queried boxes at a time, so the pairs never
+    have to be held all at once
+
+    :param bounds: (N,6) array of (xmin, ymin, tmin, xmax, ymax, tmax)
+    :type bounds: numpy.ndarray
+    :param padded: (N,6) array of the padded bounds
+    :type padded: numpy.ndarray
+    :param rtree_index: rtree of bounds, the ids must be the row positions
+    :type rtree_index: rtree.index.Index
+    :param chunk_size: number of boxes queried per bulk rtree call
+    :type chunk_size: Int
+    ...
+    :return: generator of (box_1, box_2) arrays with box_1 < box_2
+    :rtype: Iterator[Tuple(numpy.ndarray, numpy.ndarray)]
+    """
+    bounds = _as_bounds(bounds)
+    padded = _as_bounds(padded)
+
+    for start in range(0, len(padded), chunk_size):
+        query = np.arange(start, min(start + chunk_size, len(padded)))
+        box_1, box_2 = _bulk_intersection(rtree_index, padded, query)
+
+        # a pair found from the higher box is a repeat, unless the lower box's
+        # padded query misses it (padding is not symmetric when coef > 0)
+        keep = box_1 < box_2
+        backward = np.flatnonzero(box_1 > box_2)
+        keep[backward] = ~boxes_intersect(
+            padded[box_2[backward]], bounds[box_1[backward]]
         )
 
-    return new_cube_list
+        yield np.minimum(box_1[keep], box_2[keep]), np.maximum(
+            box_1[keep], box_2[keep]
+        )
+
+
+def _bulk_intersection(rtree_index, padded, query):
+    """(query position, hit id) arrays for the padded boxes at the query positions"""
+    if hasattr(rtree_index, "intersection_v"):
+        hits, counts = rtree_index.intersection_v(
+            np.ascontiguousarray(padded[query, :3]),
+            np.ascontiguousarray(padded[query, 3:]),
+        )
+        return np.repeat(query, counts.astype(np.int64)), hits.astype(np.int64)
+
+    # older rtree releases have no bulk query
+    hits = [list(rtree_index.intersection(padded[i].tolist())) for i in query]
+    counts = [len(h) for h in hits]
+    return (
+        np.repeat(query, counts),
+        np.fromiter(itertools.chain.from_iterable(hits), dtype=np.int64),
+    )
+
+
+def boxes_intersect(boxes_1, boxes_2):
+    """row by row test of whether two sets of boxes overlap, touching counts
+
+    :param boxes_1: (N,6) array of (xmin, ymin, tmin, xmax, ymax, tmax)
+    :type boxes_1: numpy.ndarray
+    :param boxes_2: (N,6) array of (xmin, ymin, tmin, xmax, ymax, tmax)
+    :type boxes_2: numpy.ndarray
+    ...
+    :return: (N,) boolean array
+    :rtype: numpy.ndarray
+    """
+    boxes_1, boxes_2 = np.broadcast_arrays(_as_bounds(boxes_1), _as_bounds(boxes_2))
+    return np.all(boxes_1[:, :3] <= boxes_2[:, 3:], axis=1) & np.all(
+        boxes_2[:, :3] <= boxes_1[:, 3:], axis=1
+    )
 
 
-def create_rtree(df):
+def connected_components(count, box_1, box_2):
+    """Labels the connected components of the overlap graph with union-find,
+    every pair hooks the larger root under the smaller one and paths are
+    compressed by pointer jumping, one NumPy pass per round
+
+    :param count: number of boxes
+    :type count: Int
+    :param box_1: (P,) positions of the first box of each pair
+    :type box_1: numpy.ndarray
+    :param box_2: (P,) positions of the second box of each pair
+    :type box_2: numpy.ndarray
+    ...
+    :return: (count,) component label of each box, the smallest position in it
+    :rtype: numpy.ndarray
+    """
+    parent = np.arange(count, dtype=np.int64)
+    box_1 = np.asarray(box_1, dtype=np.int64)
+    box_2 = np.asarray(box_2, dtype=np.int64)
+
+    while True:
+        root_1, root_2 = parent[box_1], parent[box_2]
+        unjoined = root_1 != root_2
+        if not unjoined.any():
+            return parent
+        root_1, root_2 = root_1[unjoined], root_2[unjoined]
+        np.minimum.at(
+            parent, np.maximum(root_1, root_2), np.minimum(root_1, root_2)
+        )
+
+        # pointer jumping until every box points straight at its root
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+
+
+def create_rtree(
+    df,
+    ids=None,
+    bulk_load=True,
+    presort=False,
+    leaf_capacity=None,
+    index_capacity=None,
+    fill_factor=None,
+):
     """Takes in a dataframe out returns an rtree
 
-    :param df: must contain bounds and unique_id column
+    By default the tree is bulk loaded from the bounds array (libspatialindex
+    packs it bottom up), which is much faster than inserting one box at a time
+    and gives fuller, less overlapping nodes.
+
+    :param df: must contain bounds and unique_id column, or a (N,6) array of bounds
     :type df: pandas.DataFrame
+    :param ids: ids to use instead of the unique_id column
+    :type ids: List[Int]
+    :param bulk_load: bulk load the tree instead of inserting box by box
+    :type bulk_load: Bool
+    :param presort: feed the boxes to the loader in sort-tile-recursive order
+    :type presort: Bool
+    :param leaf_capacity: max number of boxes in a leaf node
+    :type leaf_capacity: Int
+    :param index_capacity: max number of children of an index node
+    :type index_capacity: Int
+    :param fill_factor: fraction of each node filled by the bulk loader
+    :type fill_factor: Float
     ...
     :return: an rtree index
     :rtype: rtree.Index
     """
+    if isinstance(df, pd.DataFrame):
+        bounds = _as_bounds(df.bounds.tolist())
+        ids = df.unique_id if ids is None else ids
+    else:
+        bounds = _as_bounds(df)
+        ids = np.arange(len(bounds)) if ids is None else ids
+    ids = np.asarray(ids, dtype=np.int64)
+
     # specify 3d space
     p = index.Property()
     p.dimension = 3
+    if leaf_capacity is not None:
+        p.leaf_capacity = leaf_capacity
+    if index_capacity is not None:
+        p.index_capacity = index_capacity
+    if fill_factor is not None:
+        p.fill_factor = fill_factor
+
+    # nothing to load, or box by box inserts were asked for
+    if not bulk_load or len(bounds) == 0:
+        rtree_index = index.Index(properties=p)
+        for unique_id, box in zip(ids.tolist(), bounds.tolist()):
+            rtree_index.insert(unique_id, box)
+        return rtree_index
+
+    if presort:
+        order = str_order(bounds, p.leaf_capacity)
+        bounds, ids = bounds[order], ids[order]
+
+    if RTREE_ARRAYS:
+        try:
+            # libspatialindex >= 2.1 loads straight from the arrays
+            return index.Index(
+                (
+                    ids,
+                    np.ascontiguousarray(bounds[:, :3]),
+                    np.ascontiguousarray(bounds[:, 3:]),
+                ),
+                properties=p,
+            )
+        except NotImplementedError:
+            pass
+    stream = ((i, box, None) for i, box in zip(ids.tolist(), bounds.tolist()))
+    return index.Index(stream, properties=p)
+
+
+def str_order(bounds, leaf_capacity):
+    """sort-tile-recursive order of boxes, slabs along x, strips along y, then t
+
+    :param bounds: (N,6) array of (xmin, ymin, tmin, xmax, ymax, tmax)
+    :type bounds: numpy.ndarray
+    :param leaf_capacity: number of boxes per leaf
+    :type leaf_capacity: Int
+    ...
+    :return: (N,) positions in STR order
+    :rtype: numpy.ndarray
+    """
+    bounds = _as_bounds(bounds)
+    count = len(bounds)
+    centers = (bounds[:, :3] + bounds[:, 3:]) / 2.0
+    leaves = max(int(np.ceil(count / leaf_capacity)), 1)
+    tiles = max(int(np.ceil(leaves ** (1.0 / 3.0))), 1)
+    strip_size = tiles * leaf_capacity
+    slab_size = tiles * strip_size
 
-    # create index object
-    rtree_index = index.Index(properties=p)
+    # slab number from the rank along x
+    slab = np.empty(count, dtype=np.int64)
+    slab[np.argsort(centers[:, 0], kind="stable")] = np.arange(count) // slab_size
 
-    # add boxes to the rtree index
-    [rtree_index.insert(df.unique_id[idx], df.bounds[idx]) for idx in df.index]
+    # strip number from the rank along y inside each slab
+    by_y = np.lexsort((centers[:, 1], slab))
+    strip = np.empty(count, dtype=np.int64)
+    strip[by_y] = (np.arange(count) - slab[by_y] * slab_size) // strip_size
 
-    return rtree_index
+    return np.lexsort((centers[:, 2], strip, slab))
 
 
 def combined_box(box_1, box_2):
@@ -102,17 +322,25 @@ def combined_box(box_1, box_2):
     :return: the new box, (xmin, ymin, tmin, xmax, ymax, tmax)
     :rtype: Tuple
     """
+    return tuple(combined_boxes(_as_bounds(box_1), _as_bounds(box_2))[0].tolist())
 
-    new_box = (
-        min(box_1[0], box_2[0]),
-        min(box_1[1], box_2[1]),
-        min(box_1[2], box_2[2]),
-        max(box_1[3], box_2[3]),
-        max(box_1[4], box_2[4]),
-        max(box_1[5], box_2[5]),
-    )
 
-    return new_box
+def combined_boxes(boxes_1, boxes_2):
+    """Batch version of combined_box, merges the boxes row by row
+
+    :param boxes_1: (N,6) array of (xmin, ymin, tmin, xmax, ymax, tmax)
+    :type boxes_1: numpy.ndarray
+    :param boxes_2: (N,6) array of (xmin, ymin, tmin, xmax, ymax, tmax)
+    :type boxes_2: numpy.ndarray
+    ...
+    :return: (N,6) array of the combined boxes
+    :rtype: numpy.ndarray
+    """
+    boxes_1, boxes_2 = np.broadcast_arrays(_as_bounds(boxes_1), _as_bounds(boxes_2))
+    new_boxes = np.empty(boxes_1.shape, dtype=np.float64)
+    np.minimum(boxes_1[:, :3], boxes_2[:, :3], out=new_boxes[:, :3])
+    np.maximum(boxes_1[:, 3:], boxes_2[:, 3:], out=new_boxes[:, 3:])
+    return new_boxes
 
 
 def delta_c(box_1, box_2, merge_box, coef=0):
@@ -130,7 +358,27 @@ def delta_c(box_1, box_2, merge_box, coef=0):
     :return: delta_c value
     :rtype: Int
     """
-    return box_volume(merge_box) - box_volume(box_1) - box_volume(box_2) - coef
+    return float(delta_cs(box_1, box_2, merge_box, coef=coef)[0])
+
+
+def delta_cs(boxes_1, boxes_2, merge_boxes, coef=0):
+    """Batch version of delta_c
+
+    :param boxes_1: (N,6) array of (xmin, ymin, tmin, xmax, ymax, tmax)
+    :type boxes_1: numpy.ndarray
+    :param boxes_2: (N,6) array of (xmin, ymin, tmin, xmax, ymax, tmax)
+    :type boxes_2: numpy.ndarray
+    :param merge_boxes: (N,6) array of (xmin, ymin, tmin, xmax, ymax, tmax)
+    :type merge_boxes: numpy.ndarray
+    :param coef: algorithm coeficient for padding
+    :type coef: Float
+    ...
+    :return: (N,) array of delta_c values
+    :rtype: numpy.ndarray
+    """
+    return (
+        box_volumes(merge_boxes) - box_volumes(boxes_1) - box_volumes(boxes_2) - coef
+    )
 
 
 def padded_box(bounds, coef=0):
@@ -144,23 +392,34 @@ def padded_box(bounds, coef=0):
     :return: padded bounds
     :rtype: Tuple
     """
+    return tuple(padded_boxes(bounds, coef=coef)[0].tolist())
 
-    Lx = bounds[3] - bounds[0]
-    Ly = bounds[4] - bounds[1]
-    Lt = bounds[5] - bounds[2]
 
-    px = coef / (Ly * Lt)
-    py = coef / (Lx * Lt)
-    pt = coef / (Lx * Ly)
+def padded_boxes(bounds, coef=0):
+    """Batch version of padded_box
 
-    return (
-        bounds[0] - px,
-        bounds[1] - py,
-        bounds[2] - pt,
-        bounds[3] + px,
-        bounds[4] + py,
-        bounds[5] + pt,
-    )
+    :param bounds: (N,6) array of (xmin, ymin, tmin, xmax, ymax, tmax)
+    :type bounds: numpy.ndarray
+    :param coef: algorithm coeficient for padding
+    :type coef: Float
+    ...
+    :return: (N,6) array of padded bounds
+    :rtype: numpy.ndarray
+    """
+    bounds = _as_bounds(bounds)
+    if coef == 0:
+        return bounds.copy()
+
+    Lx = bounds[:, 3] - bounds[:, 0]
+    Ly = bounds[:, 4] - bounds[:, 1]
+    Lt = bounds[:, 5] - bounds[:, 2]
+
+    pad = np.empty((len(bounds), 3), dtype=np.float64)
+    pad[:, 0] = coef / (Ly * Lt)
+    pad[:, 1] = coef / (Lx * Lt)
+    pad[:, 2] = coef / (Lx * Ly)
+
+    return np.hstack([bounds[:, :3] - pad, bounds[:, 3:] + pad])
 
 
 def box_volume(box_tuple):
@@ -172,37 +431,130 @@ def box_volume(box_tuple):
     :return: volume of the prism
     :rtype: Float
     """
+    return float(box_volumes(box_tuple)[0])
+
 
+def box_volumes(boxes):
+    """Batch version of box_volume
+
+    :param boxes: (N,6) array of (xmin, ymin, tmin, xmax, ymax, tmax)
+    :type boxes: numpy.ndarray
+    ...
+    :return: (N,) array of volumes
+    :rtype: numpy.ndarray
+    """
+    boxes = _as_bounds(boxes)
     return (
-        (box_tuple[3] - box_tuple[0])
-        * (box_tuple[4] - box_tuple[1])
-        * (box_tuple[5] - box_tuple[2])
+        (boxes[:, 3] - boxes[:, 0])
+        * (boxes[:, 4] - boxes[:, 1])
+        * (boxes[:, 5] - boxes[:, 2])
     )
 
 
+def _as_bounds(boxes):
+    """views a bounds tuple, list of tuples or array as a (N,6) float array"""
+    return np.asarray(boxes, dtype=np.float64).reshape(-1, 6)
+
+
+class IdAllocator:
+    """Hands out sequential int64 ids, unique for the life of the allocator
+
+    :param start: first id handed out
+    :type start: Int
+    :param step: increment between ids, -1 counts down
+    :type step: Int
+    """
+
+    def __init__(self, start=0, step=1):
+        self.start = start
+        self.step = step
+        self._next = start
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        """returns the next id"""
+        with self._lock:
+            unique_id = self._next
+            self._next += self.step
+        return unique_id
+
+    def reserve(self, count):
+        """reserves a block of count ids at once
+
+        :param count: number of ids
+        :type count: Int
+        ...
+        :return: (count,) ids
+        :rtype: numpy.ndarray
+        """
+        with self._lock:
+            start = self._next
+            self._next += self.step * count
+        return start + self.step * np.arange(count, dtype=np.int64)
+
+    @property
+    def issued(self):
+        """number of ids handed out so far"""
+        return (self._next - self.start) // self.step
+
+
+def _process_ids():
+    """allocator for this process, the base comes from uuid1 so processes get
+    far apart ranges, and leaves 2**62 ids of headroom below the int64 max"""
+    return IdAllocator(start=uuid.uuid1().int >> 66)
+
+
+_ids = _process_ids()
+
+
+def _reseed_ids():
+    global _ids
+    _ids = _process_ids()
+
+
+# forked workers must not hand out the parent's next ids
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reseed_ids)
+
+
 def create_uuid_int64():
     """returns unique id that can be used in rtree index
 
     :return: uuid
     :rtype: int
     """
-    return uuid.uuid1().int >> 65
+    return _ids()
+
+
+def reserve_uuid_int64(count):
+    """returns count unique ids in one call, see create_uuid_int64
+
+    :param count: number of ids
+    :type count: Int
+    ...
+    :return: (count,) ids
+    :rtype: numpy.ndarray
+    """
+    return _ids.reserve(count)
 
 
 def df_for_greedy(in_prisms):
     """converts list of prisms into dataframe
 
-    :param in_prisms: [Prism]
+    :param in_prisms: [Prism] or PrismArray
     :type in_prisms: List(Prism)
     ...
     :return: dataframe
     :rtype: pandas.DataFrame
     """
+    from .prism import PrismArray
+
+    prisms = PrismArray.from_prisms(in_prisms)
 
     df = pd.DataFrame()
-    df["bounds"] = [prism.bounds for prism in in_prisms]
-    df["name"] = [prism.name for prism in in_prisms]
-    df["unique_id"] = [prism.uuid for prism in in_prisms]
-    df["boxes_inside"] = df.apply(lambda x: [], axis=1)
+    df["bounds"] = [tuple(bounds) for bounds in prisms.bounds.tolist()]
+    df["name"] = prisms.names
+    df["unique_id"] = prisms.uuid
+    df["boxes_inside"] = [[] for _ in range(len(prisms))]
 
     return df
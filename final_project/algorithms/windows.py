@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import logging
+
+import numpy as np
+
+from .generator import ll_bounds
+from .incremental import IncrementalGreedy
+from .prism import PrismArray
+from .profiling import get_profiler
+from .projection import transform
+from .utils import df_for_greedy
+
+logger = logging.getLogger(__name__)
+
+
+def windowed_greedy(
+    windows,
+    temporal_buffer,
+    distance_buffer,
+    coef=0,
+    index="rtree",
+    rtree_properties=None,
+    profiler=None,
+):
+    """Greedy over consecutive time windows of points, yielding the queries that
+    are final after every window
+
+    The prisms of each window are merged into an IncrementalGreedy state. A box
+    can only still merge with prisms up to 2 * temporal_buffer (plus the time
+    padding) after it, so the boxes of that band before the newest point stay
+    in the state and are merged with the next window, the rest are final and
+    yielded. Only the current window and the band are held, whatever the
+    length of the data.
+
+    :param windows: dataframes of points with latitude, longitude, timestamp and
+        name columns, in time order, e.g. ingest.SortedRuns.windows
+    :type windows: Iterator[pandas.DataFrame]
+    :param temporal_buffer: time buffer in seconds
+    :type temporal_buffer: Float
+    :param distance_buffer: distance buffer in meters
+    :type distance_buffer: Float
+    :param coef: algorithm coeficient for padding
+    :type coef: Float
+    :param index: spatial index of the boxes, "rtree" or "grid"
+    :type index: str
+    :param rtree_properties: keyword arguments for utils.create_rtree
+    :type rtree_properties: Dict
+    :param profiler: records the phases of every window
+    :type profiler: profiling.Profiler
+    ...
+    :return: generator of (N,6) lat/lon bounds of the queries final after each
+        window, the last one has every query still in the state
+    :rtype: Iterator[numpy.ndarray]
+    """
+    profiler = get_profiler(profiler)
+
+    # the time padding of a prism, merged boxes are larger and padded less
+    pad = 0
+    if coef:
+        pad = coef / (4 * distance_buffer**2) if distance_buffer > 0 else np.inf
+    state = IncrementalGreedy(
+        coef,
+        index,
+        retention=2 * temporal_buffer + pad,
+        rtree_properties=rtree_properties,
+    )
+
+    for number, points in enumerate(windows):
+        if len(points) == 0:
+            continue
+        with profiler.phase("window_prisms"):
+            lons = points.longitude.to_numpy(dtype=np.float64)
+            lats = points.latitude.to_numpy(dtype=np.float64)
+            xs, ys = transform("epsg:4326", "epsg:3857", lons, lats)
+            prisms = PrismArray(
+                x=xs,
+                y=ys,
+                timestamp=points.timestamp.to_numpy(dtype=np.float64),
+                x_buffer=distance_buffer,
+                y_buffer=distance_buffer,
+                temporal_buffer=temporal_buffer,
+                names=points.name.to_numpy(),
+            )
+            df = df_for_greedy(prisms)
+
+        final = state.update(df, profiler=profiler)
+        logger.info(
+            f"window {number}: {len(points)} points, {len(final)} final queries, "
+            f"{len(state)} boxes carried over"
+        )
+        profiler.count("windows")
+        yield _ll_bounds(final)
+
+    yield _ll_bounds(state.evict(np.inf))
+
+
+def _ll_bounds(df):
+    """lat/lon bounds of a results frame"""
+    bounds = np.array(df.bounds.tolist(), dtype=np.float64).reshape(-1, 6)
+    if len(bounds) == 0:
+        return bounds
+    return ll_bounds(bounds, "epsg:3857")
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+ On disk cache of the output bounds, keyed by the input points and parameters
+
+"""
+import os
+import json
+import hashlib
+import logging
+import tempfile
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# bump when a change to the algorithm changes its results for the same inputs
+CACHE_VERSION = 1
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")),
+    "final_project",
+)
+
+
+def cache_key(points, parameters):
+    """hash of the lat, lon, timestamp, name columns and the parameters that
+    change the results, the job name and justification are not part of it
+
+    :param points: dataframe with latitude, longitude, timestamp, name columns
+    :type points: pandas.DataFrame
+    :param parameters: json serializable algorithm parameters
+    :type parameters: Dict
+    ...
+    :return: hex digest
+    :rtype: str
+    """
+    digest = hashlib.sha256()
+    digest.update(
+        json.dumps(
+            {"version": CACHE_VERSION, "rows": len(points), **parameters},
+            sort_keys=True,
+        ).encode()
+    )
+    for column in ["latitude", "longitude", "timestamp"]:
+        values = np.ascontiguousarray(points[column].to_numpy(dtype=np.float64))
+        digest.update(values.tobytes())
+    digest.update("\0".join(points.name.astype(str)).encode())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Directory of (N,6) lat/lon result bounds saved as .npy files named by
+    their cache_key, least recently used files are evicted once the directory
+    is over max_bytes
+
+    :param directory: cache directory, created if missing
+    :type directory: str
+    :param max_bytes: size limit of the cache
+    :type max_bytes: Int
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=1024**3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".npy")
+
+    def get(self, key):
+        """the cached bounds, None on a miss
+
+        :param key: cache_key of the job
+        :type key: str
+        ...
+        :return: (N,6) array of (xmin, ymin, tmin, xmax, ymax, tmax)
+        :rtype: numpy.ndarray
+        """
+        path = self._path(key)
+        try:
+            bounds = np.load(path, allow_pickle=False)
+        except (OSError, ValueError):
+            return None
+        # the modification time is the last use, for the lru eviction, another
+        # run may have evicted the file since it was read
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return bounds
+
+    def put(self, key, bounds):
+        """saves the bounds and evicts the least recently used entries
+
+        :param key: cache_key of the job
+        :type key: str
+        :param bounds: (N,6) array of (xmin, ymin, tmin, xmax, ymax, tmax)
+        :type bounds: numpy.ndarray
+        """
+        bounds = np.asarray(bounds, dtype=np.float64).reshape(-1, 6)
+        # written to a temporary file first so a reader never sees half a file
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, bounds, allow_pickle=False)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self.evict()
+
+    def evict(self):
+        """removes the least recently used entries until the cache fits in max_bytes
+
+        ...
+        :return: number of entries removed
+        :rtype: Int
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npy"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        if removed:
+            logger.info(f"evicted {removed} cached results")
+        return removed
@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+ Loading of the lat, lon, timestamp, name columns from the input file
+
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = ["latitude", "longitude", "timestamp", "name"]
+DTYPES = {"latitude": np.float64, "longitude": np.float64, "name": str}
+
+PARQUET_EXTENSIONS = (".parquet", ".pq")
+ARROW_EXTENSIONS = (".arrow", ".feather", ".ipc")
+EXCEL_EXTENSIONS = (".xls", ".xlsx", ".xlsm", ".ods")
+
+# format="ISO8601" is new in pandas 2.0
+HAS_ISO8601_FORMAT = int(pd.__version__.split(".")[0]) >= 2
+
+
+def read_points(file_path, lat, lon, time, name, chunksize=1_000_000):
+    """Reads only the four needed columns of a csv (optionally gzip or other
+    compressed), parquet, arrow/feather or excel file, chunk by chunk, and
+    parses the timestamps into float epoch seconds
+
+    :param file_path: path of the input file
+    :type file_path: str
+    :param lat: position of the latitude column, 0 is column A in excel
+    :type lat: Int
+    :param lon: position of the longitude column
+    :type lon: Int
+    :param time: position of the timestamp column
+    :type time: Int
+    :param name: position of the name column
+    :type name: Int
+    :param chunksize: number of rows read at once
+    :type chunksize: Int
+    ...
+    :return: dataframe with latitude, longitude, timestamp, name columns, no nans
+    :rtype: pandas.DataFrame
+    """
+    chunks = list(iter_points(file_path, lat, lon, time, name, chunksize))
+    if not chunks:
+        return pd.DataFrame({column: [] for column in COLUMNS})
+    return pd.concat(chunks, ignore_index=True)
+
+
+def iter_points(file_path, lat, lon, time, name, chunksize=1_000_000):
+    """read_points one chunk at a time, so the file never has to be held at once
+
+    :param file_path: path of the input file
+    :type file_path: str
+    :param lat: position of the latitude column, 0 is column A in excel
+    :type lat: Int
+    :param lon: position of the longitude column
+    :type lon: Int
+    :param time: position of the timestamp column
+    :type time: Int
+    :param name: position of the name column
+    :type name: Int
+    :param chunksize: number of rows read at once
+    :type chunksize: Int
+    ...
+    :return: generator of dataframes with latitude, longitude, timestamp, name columns
+    :rtype: Iterator[pandas.DataFrame]
+    """
+    positions = [lat, lon, time, name]
+    if len(set(positions)) != len(positions):
+        raise ValueError(f"lat, lon, time and name must be different columns: {positions}")
+
+    for chunk in iter_chunks(file_path, positions, chunksize):
+        yield _clean(chunk)
+
+
+def sort_points(file_path, lat, lon, time, name, directory, chunksize=1_000_000):
+    """External sort of a file by timestamp, every chunk is sorted and written to
+    directory as a run, see SortedRuns
+
+    :param file_path: path of the input file
+    :type file_path: str
+    :param lat: position of the latitude column, 0 is column A in excel
+    :type lat: Int
+    :param lon: position of the longitude column
+    :type lon: Int
+    :param time: position of the timestamp column
+    :type time: Int
+    :param name: position of the name column
+    :type name: Int
+    :param directory: existing directory for the runs
+    :type directory: str
+    :param chunksize: number of rows read and sorted at once
+    :type chunksize: Int
+    ...
+    :return: the sorted runs
+    :rtype: SortedRuns
+    """
+    runs = SortedRuns(directory)
+    for chunk in iter_points(file_path, lat, lon, time, name, chunksize):
+        runs.add(chunk)
+    return runs
+
+
+class SortedRuns:
+    """Points sorted by timestamp on disk, in runs that are each sorted
+
+    Every run is one .npy file per column. window memory maps the runs and
+    takes the slice of each that falls in the window, so reading a time window
+    only loads the points of that window, whatever the size of the file.
+
+    :param directory: existing directory for the runs
+    :type directory: str
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.runs = []
+        self.tmin = np.inf
+        self.tmax = -np.inf
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def add(self, chunk):
+        """sorts a chunk of points by timestamp and writes it as a run
+
+        :param chunk: dataframe with latitude, longitude, timestamp, name columns
+        :type chunk: pandas.DataFrame
+        """
+        if len(chunk) == 0:
+            return
+        timestamps = chunk.timestamp.to_numpy(dtype=np.float64)
+        order = np.argsort(timestamps, kind="stable")
+        columns = {
+            "latitude": chunk.latitude.to_numpy(dtype=np.float64)[order],
+            "longitude": chunk.longitude.to_numpy(dtype=np.float64)[order],
+            "timestamp": timestamps[order],
+            "name": chunk.name.astype(str).to_numpy(dtype=str)[order],
+        }
+
+        run = {}
+        for column, values in columns.items():
+            path = os.path.join(self.directory, f"run{len(self.runs)}_{column}.npy")
+            np.save(path, values)
+            run[column] = path
+        self.runs.append(run)
+        self.tmin = min(self.tmin, columns["timestamp"][0])
+        self.tmax = max(self.tmax, columns["timestamp"][-1])
+        self._count += len(order)
+
+    def window(self, start, end):
+        """the points with start <= timestamp < end, sorted by timestamp
+
+        :param start: epoch seconds
+        :type start: Float
+        :param end: epoch seconds
+        :type end: Float
+        ...
+        :return: dataframe with latitude, longitude, timestamp, name columns
+        :rtype: pandas.DataFrame
+        """
+        slices = []
+        for run in self.runs:
+            timestamps = np.load(run["timestamp"], mmap_mode="r")
+            first, last = np.searchsorted(timestamps, [start, end])
+            if first < last:
+                slices.append(
+                    {
+                        column: np.array(np.load(path, mmap_mode="r")[first:last])
+                        for column, path in run.items()
+                    }
+                )
+        if not slices:
+            return pd.DataFrame({column: [] for column in COLUMNS})
+
+        df = pd.DataFrame(
+            {
+                column: np.concatenate([s[column] for s in slices])
+                for column in COLUMNS
+            }
+        )
+        df["name"] = df.name.astype(object)
+        return df.sort_values("timestamp", kind="stable", ignore_index=True)
+
+    def windows(self, length):
+        """consecutive windows of length seconds from the first point to the last
+
+        :param length: window length in seconds
+        :type length: Float
+        ...
+        :return: generator of (start, points) with the points of window
+        :rtype: Iterator[Tuple(Float, pandas.DataFrame)]
+        """
+        if length <= 0:
+            raise ValueError(f"window length must be positive: {length}")
+        start = self.tmin
+        while start <= self.tmax:
+            yield start, self.window(start, start + length)
+            start += length
+
+
+def iter_chunks(file_path, positions, chunksize=1_000_000):
+    """yields raw chunks of the selected columns renamed to COLUMNS
+
+    :param file_path: path of the input file
+    :type file_path: str
+    :param positions: positions of the lat, lon, time, name columns
+    :type positions: List[Int]
+    :param chunksize: number of rows read at once
+    :type chunksize: Int
+    ...
+    :return: generator of dataframes
+    :rtype: Iterator[pandas.DataFrame]
+    """
+    extension = _extension(file_path)
+
+    if extension in PARQUET_EXTENSIONS:
+        pq = _import_pyarrow("pyarrow.parquet")
+        parquet_file = pq.ParquetFile(file_path)
+        names = _select(parquet_file.schema_arrow.names, positions)
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=names):
+            yield _rename(batch.to_pandas(), names)
+
+    elif extension in ARROW_EXTENSIONS:
+        feather = _import_pyarrow("pyarrow.feather")
+        table = feather.read_table(file_path, memory_map=True)
+        names = _select(table.column_names, positions)
+        table = table.select(names)
+        for batch in table.to_batches(max_chunksize=chunksize):
+            yield _rename(batch.to_pandas(), names)
+
+    elif extension in EXCEL_EXTENSIONS:
+        # excel has no streaming reader, but only the needed columns are parsed
+        df = pd.read_excel(file_path, usecols=sorted(positions))
+        names = _select(list(df.columns), [sorted(positions).index(p) for p in positions])
+        yield _rename(df, names)
+
+    else:
+        # csv, compression (gzip, bz2, zip, xz, zstd) is inferred from the extension
+        header = pd.read_csv(file_path, nrows=0).columns
+        names = _select(list(header), positions)
+        dtypes = {
+            column: DTYPES[target]
+            for column, target in zip(names, COLUMNS)
+            if target in DTYPES
+        }
+        yield from (
+            _rename(chunk, names)
+            for chunk in pd.read_csv(
+                file_path, usecols=names, dtype=dtypes, chunksize=chunksize
+            )
+        )
+
+
+def parse_timestamps(timestamps):
+    """Vectorized conversion of a timestamp column to float epoch seconds,
+    numbers are taken as epoch seconds already, strings are parsed as ISO 8601
+    (naive times are taken as UTC), other strings raise a ValueError
+
+    :param timestamps: timestamp column
+    :type timestamps: pandas.Series
+    ...
+    :return: float epoch seconds
+    :rtype: pandas.Series
+    """
+    if pd.api.types.is_numeric_dtype(timestamps):
+        return timestamps.astype(np.float64)
+
+    if not pd.api.types.is_datetime64_any_dtype(timestamps):
+        if HAS_ISO8601_FORMAT:
+            timestamps = pd.to_datetime(timestamps, utc=True, format="ISO8601")
+        else:
+            # older pandas has no ISO8601 format, let it infer one for the column
+            timestamps = pd.to_datetime(timestamps, utc=True)
+
+    if timestamps.dt.tz is None:
+        timestamps = timestamps.dt.tz_localize("UTC")
+    return (timestamps - pd.Timestamp(0, tz="UTC")).dt.total_seconds()
+
+
+def _clean(chunk):
+    """drops rows with nans and parses the timestamps"""
+    chunk = chunk.dropna()
+    chunk["timestamp"] = parse_timestamps(chunk["timestamp"])
+    return chunk
+
+
+def _select(names, positions):
+    """column names at the given positions"""
+    try:
+        return [names[position] for position in positions]
+    except IndexError:
+        raise ValueError(
+            f"column positions {positions} out of range, file has {len(names)} columns"
+        )
+
+
+def _rename(df, names):
+    """selected columns in lat, lon, time, name order with the standard names"""
+    df = df[names]
+    df.columns = COLUMNS
+    return df
+
+
+def _extension(file_path):
+    """lower case extension, ignoring a compression suffix"""
+    root, extension = os.path.splitext(str(file_path).lower())
+    if extension in (".gz", ".bz2", ".zip", ".xz", ".zst"):
+        extension = os.path.splitext(root)[1]
+    return extension
+
+
+def _import_pyarrow(module):
+    """pyarrow is only needed for parquet and arrow inputs"""
+    try:
+        return __import__(module, fromlist=["_"])
+    except ImportError:
+        raise ImportError(f"{module} is required to read parquet and arrow files")
@@ -1,5 +1,678 @@
-from unittest import TestCase
+import io
+import os
+import tempfile
+from xml.dom import minidom
+from unittest import TestCase, mock
+
+import numpy as np
+import pandas as pd
+from pyproj import Transformer
+
+from benchmarks.synthetic import synthetic_tracks
+from final_project.ingest import read_points, parse_timestamps, sort_points
+from final_project.ingest import HAS_ISO8601_FORMAT
+from final_project.cache import ResultCache, cache_key
+from final_project.algorithms.candidates import CandidateQueue
+from final_project.algorithms.store import BoxStore
+from final_project.algorithms.greedy import Greedy, greedy, partitioned_greedy
+from final_project.algorithms.greedy import create_index
+from final_project.algorithms.utils import combined_box, combined_boxes, delta_c
+from final_project.algorithms.utils import delta_cs, padded_box, padded_boxes
+from final_project.algorithms.utils import create_rtree, overlapping_pairs
+from final_project.algorithms.utils import connected_components, df_for_greedy
+from final_project.algorithms.utils import IdAllocator, create_uuid_int64
+from final_project.algorithms.prism import Prism, PrismArray
+from final_project.algorithms.generator import create_prisms_by_proj, ll_bounds
+from final_project.algorithms.generator import create_prisms_by_ll
+from final_project.algorithms.generator import prisms_projected_output
+from final_project.algorithms.generator import datestr, datestrs, write_kml
+from final_project.algorithms.projection import get_transformer, transform
+from final_project.algorithms.profiling import Profiler
+from final_project.algorithms.tracks import compress_tracks
+from final_project.algorithms.grid import create_grid
+from final_project.algorithms.incremental import IncrementalGreedy
+from final_project.algorithms.sweep import sweep
+from final_project.algorithms.history import MergeHistory
+from final_project.algorithms.rounds import round_greedy, greedy_matching
+from final_project.algorithms.windows import windowed_greedy
+
 
 class TestFile(TestCase):
     def test_me(self):
-        pass
\ No newline at end of file
+        pass
+
+
+class TestCandidateQueue(TestCase):
+    def test_pops_smallest_delta_and_skips_stale(self):
+        active = {1, 2, 3}
+        queue = CandidateQueue(active)
+        queue.extend([5.0, -1.0], [1, 1], [2, 3])
+        queue.push(-2.0, 2, 3)
+        self.assertEqual(queue.pop(), (-2.0, 2, 3))
+
+        active.difference_update({2, 3})
+        self.assertIsNone(queue.pop())
+        self.assertEqual(len(queue), 0)
+
+    def test_top_k_refills_in_order(self):
+        active = {1, 2, 3, 4}
+        deltas = {(1, 2): -3.0, (1, 3): -2.0, (1, 4): -1.0}
+
+        def refill(box_1):
+            pairs = [pair for pair in deltas if pair[0] == box_1 and pair[1] in active]
+            return [deltas[pair] for pair in pairs], [pair[1] for pair in pairs]
+
+        for compact in [False, True]:
+            queue = CandidateQueue(active, k=1, refill=refill, compact=compact)
+            queue.extend(list(deltas.values()), [1, 1, 1], [2, 3, 4])
+            self.assertEqual(len(queue), 2)
+            self.assertEqual(queue.pop(), (-3.0, 1, 2))
+            # the refill entry at -2.0 brings back the next best candidate
+            active.discard(2)
+            self.assertEqual(queue.pop(max_delta=0), (-2.0, 1, 3))
+            self.assertEqual(queue.refills, 1)
+            self.assertIsNone(queue.pop(max_delta=-1.5))
+            active.add(2)
+
+
+class TestBoxStore(TestCase):
+    def test_add_remove_reuses_slots(self):
+        store = BoxStore(2)
+        box = (0.0, 0.0, 0.0, 1.0, 1.0, 1.0)
+        store.add(10, box, box)
+        slot = store.add(11, box, box, boxes_inside=[1, 2])
+        self.assertEqual(store.get_boxes_inside(11), [1, 2])
+
+        self.assertEqual(store.remove(11), slot)
+        self.assertNotIn(11, store)
+        self.assertEqual(store.add(12, box, box), slot)
+
+        # a third box past the preallocated capacity grows the arrays
+        store.add(13, box, box)
+        self.assertEqual(store.capacity, 4)
+        self.assertEqual(list(store.to_frame().unique_id), [10, 12, 13])
+
+
+class TestBatchKernels(TestCase):
+    def test_batch_matches_scalar(self):
+        boxes_1 = np.array([[0, 0, 0, 1, 1, 1], [0, 0, 0, 2, 3, 4]], dtype=float)
+        boxes_2 = np.array([[0.5, -1, 0, 2, 1, 3], [1, 1, 1, 2, 2, 2]], dtype=float)
+        merged = combined_boxes(boxes_1, boxes_2)
+        deltas = delta_cs(boxes_1, boxes_2, merged, coef=2)
+        padded = padded_boxes(boxes_1, coef=2)
+
+        for i in range(2):
+            b1, b2 = tuple(boxes_1[i]), tuple(boxes_2[i])
+            self.assertEqual(tuple(merged[i]), combined_box(b1, b2))
+            self.assertEqual(deltas[i], delta_c(b1, b2, combined_box(b1, b2), coef=2))
+            self.assertEqual(tuple(padded[i]), padded_box(b1, coef=2))
+
+
+class TestOverlappingPairs(TestCase):
+    def test_each_pair_found_once(self):
+        bounds = np.array(
+            [
+                [0, 0, 0, 2, 2, 2],
+                [1, 1, 1, 3, 3, 3],
+                [2.5, 2.5, 2.5, 4, 4, 4],
+                [10, 10, 10, 11, 11, 11],
+            ],
+            dtype=float,
+        )
+        rtree_index = create_rtree(bounds)
+        box_1, box_2 = overlapping_pairs(bounds, bounds, rtree_index)
+        self.assertEqual(sorted(zip(box_1.tolist(), box_2.tolist())), [(0, 1), (1, 2)])
+
+        for kwargs in [{"bulk_load": False}, {"presort": True, "leaf_capacity": 4}]:
+            rtree_index = create_rtree(bounds, **kwargs)
+            self.assertEqual(sorted(rtree_index.intersection((0, 0, 0, 2, 2, 2))), [0, 1])
+
+        # rtree releases without the array api load from a stream
+        with mock.patch("final_project.algorithms.utils.RTREE_ARRAYS", False):
+            rtree_index = create_rtree(bounds)
+        self.assertEqual(sorted(rtree_index.intersection((0, 0, 0, 2, 2, 2))), [0, 1])
+
+    def test_one_sided_padding(self):
+        # only the larger padding of box 1 reaches box 0
+        bounds = np.array([[0, 0, 0, 1, 1, 1], [2, 0, 0, 3, 1, 1]], dtype=float)
+        padded = bounds.copy()
+        padded[1, 0] = 0.5
+        box_1, box_2 = overlapping_pairs(bounds, padded, create_rtree(bounds))
+        self.assertEqual((box_1.tolist(), box_2.tolist()), ([0], [1]))
+
+
+def random_prisms(count, seed=0):
+    """prisms scattered over a few km and an hour, in a couple of clusters"""
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(0, 5000, size=(4, 2))
+    xy = centers[rng.integers(0, 4, count)] + rng.normal(0, 300, size=(count, 2))
+    ts = rng.uniform(0, 3600, count)
+    return [
+        Prism(
+            lat=0,
+            lon=0,
+            x=x,
+            y=y,
+            timestamp=t,
+            name="test",
+            x_buffer=100,
+            y_buffer=100,
+            temporal_buffer=300,
+            crs="epsg:3857",
+        )
+        for (x, y), t in zip(xy.tolist(), ts.tolist())
+    ]
+
+
+def result_bounds(df):
+    return sorted(tuple(round(v, 6) for v in bounds) for bounds in df.bounds)
+
+
+def covered_ids(results, df):
+    """the input unique_ids in the output boxes, each once per box it is in"""
+    inputs = set(df.unique_id)
+    return sorted(
+        inner
+        for inside, unique_id in zip(results.boxes_inside, results.unique_id)
+        for inner in (inside or [unique_id])
+        if inner in inputs
+    )
+
+
+class TestPartitionedGreedy(TestCase):
+    def test_connected_components(self):
+        labels = connected_components(7, [0, 5, 3, 2], [1, 6, 2, 6])
+        self.assertEqual(labels.tolist(), [0, 0, 2, 2, 4, 2, 2])
+
+    def test_matches_serial(self):
+        df = df_for_greedy(random_prisms(300))
+        for coef in [0, 1e7]:
+            serial = greedy(df, coef)
+            parallel = partitioned_greedy(df, coef, workers=2)
+            self.assertEqual(result_bounds(serial), result_bounds(parallel))
+
+    def test_top_k_matches_all_candidates(self):
+        df = df_for_greedy(random_prisms(300))
+        for coef in [0, 1e8]:
+            expected = result_bounds(greedy(df, coef))
+            for top_k, compact in [(None, True), (1, False), (2, True)]:
+                results = greedy(df, coef, top_k=top_k, compact=compact)
+                self.assertEqual(result_bounds(results), expected)
+
+
+class TestPrismArray(TestCase):
+    def test_matches_prism_objects(self):
+        prisms = random_prisms(50)
+        array = PrismArray.from_prisms(prisms)
+
+        self.assertEqual(len(array), 50)
+        self.assertEqual(array[3], prisms[3])
+        self.assertEqual([tuple(b) for b in array.bounds], [p.bounds for p in prisms])
+        np.testing.assert_array_equal(array.volume, [p.volume for p in prisms])
+        self.assertEqual(len(array[10:20]), 10)
+        self.assertEqual(list(array[10:20].names), ["test"] * 10)
+        self.assertLess(array.nbytes / len(array), 100)
+
+
+class TestIdAllocator(TestCase):
+    def test_sequential_ids(self):
+        ids = IdAllocator(start=-1, step=-1)
+        self.assertEqual([ids(), ids()], [-1, -2])
+        self.assertEqual(ids.reserve(3).tolist(), [-3, -4, -5])
+        self.assertEqual(ids.issued, 5)
+        self.assertLess(create_uuid_int64(), create_uuid_int64())
+
+    def test_greedy_results_have_global_ids(self):
+        df = df_for_greedy(random_prisms(200))
+        results = greedy(df)
+        self.assertTrue((results.unique_id >= 0).all())
+        self.assertEqual(results.unique_id.nunique(), len(results))
+        inside = [i for ids in results.boxes_inside for i in ids]
+        self.assertTrue(all(i >= 0 for i in inside))
+        self.assertTrue(set(df.unique_id) <= set(inside) | set(results.unique_id))
+
+
+class TestGenerator(TestCase):
+    def test_prisms_by_proj_round_trip(self):
+        bounds = np.array([[0, 0, 0, 200, 100, 60], [1000, 1000, 10, 1100, 1300, 20.0]])
+        prisms = create_prisms_by_proj(bounds, ["a", "b"], uuids=[7, 8])
+
+        np.testing.assert_allclose(prisms.bounds, bounds)
+        self.assertEqual(prisms[1].name, "b")
+        self.assertEqual(prisms[1].uuid, 8)
+
+        df, kml = prisms_projected_output(prisms)
+        np.testing.assert_allclose(df.values, ll_bounds(bounds))
+        self.assertEqual(len(kml.features), 2)
+
+
+class TestProjection(TestCase):
+    def test_cached_and_chunked(self):
+        self.assertIs(
+            get_transformer("epsg:4326", "epsg:3857"),
+            get_transformer("epsg:4326", "epsg:3857"),
+        )
+        lons = np.linspace(-77.5, -76.5, 1001)
+        lats = np.linspace(38.5, 39.5, 1001)
+        whole = transform("epsg:4326", "epsg:3857", lons, lats)
+        chunked = transform("epsg:4326", "epsg:3857", lons, lats, chunk_size=100, workers=4)
+        np.testing.assert_array_equal(whole, chunked)
+
+        # the pool and its transformers are reused by the next chunked call
+        with mock.patch.object(
+            Transformer, "from_proj", wraps=Transformer.from_proj
+        ) as from_proj:
+            again = transform(
+                "epsg:4326", "epsg:3857", lons, lats, chunk_size=100, workers=4
+            )
+        self.assertEqual(from_proj.call_count, 0)
+        np.testing.assert_array_equal(whole, again)
+
+
+class TestGreedyLookups(TestCase):
+    def test_inside_lookups_match_scans(self):
+        prisms = random_prisms(200)
+        alg = Greedy()
+        out_prisms = alg.run(prisms, 0)
+
+        inside_bounds = alg.inside_bounds
+        self.assertIs(inside_bounds, alg.inside_bounds)
+        for out_prism, d in zip(out_prisms, inside_bounds):
+            value = alg.inside_uuids[out_prism.uuid]
+            self.assertEqual(d["merged_uuid"], out_prism.uuid)
+            if value:
+                expected = [p.bounds for p in prisms if p.uuid in value]
+                self.assertEqual(d["inner_bounds"], expected)
+            else:
+                self.assertIsNone(d["inner_bounds"])
+
+        table = alg.inside_table
+        self.assertEqual(sorted(table.inner_id), sorted(p.uuid for p in prisms))
+        self.assertEqual(set(table.merged_id), set(alg.out_uuids.tolist()))
+
+
+class TestIngest(TestCase):
+    def test_read_points_csv_and_gzip(self):
+        df = pd.DataFrame(
+            {
+                "extra": [1, 2, 3],
+                "name": ["a", "b", None],
+                "time": ["2021-03-12T19:48:10.500Z", "2021-03-12T19:48:11.000Z", "x"],
+                "lat": [38.8, 38.9, 39.0],
+                "lon": [-77.0, -77.1, -77.2],
+            }
+        )
+        with tempfile.TemporaryDirectory() as tmp:
+            for file_name in ["points.csv", "points.csv.gz"]:
+                path = os.path.join(tmp, file_name)
+                df.to_csv(path, index=False)
+                points = read_points(path, lat=3, lon=4, time=2, name=1, chunksize=2)
+
+                self.assertEqual(
+                    list(points.columns), ["latitude", "longitude", "timestamp", "name"]
+                )
+                self.assertEqual(points.latitude.tolist(), [38.8, 38.9])
+                self.assertEqual(points.timestamp.tolist(), [1615578490.5, 1615578491.0])
+
+    def test_numeric_timestamps_pass_through(self):
+        self.assertEqual(parse_timestamps(pd.Series([1, 2])).tolist(), [1.0, 2.0])
+        if HAS_ISO8601_FORMAT:
+            # ambiguous dates are not guessed
+            with self.assertRaises(ValueError):
+                parse_timestamps(pd.Series(["03/04/2021", "05/06/2021"]))
+
+
+class TestKmlWriter(TestCase):
+    def test_streamed_kml(self):
+        timestamps = [1615577590.0, 1615579390.5]
+        self.assertEqual(datestrs(timestamps).tolist(), [datestr(t) for t in timestamps])
+
+        bounds = np.array([[-77, 38, 0, -76.9, 38.1, 60], [-77, 38, 10, -76, 39, 70.0]])
+        handle = io.StringIO()
+        write_kml(handle, bounds, chunk_size=1)
+        document = minidom.parseString(handle.getvalue())
+
+        self.assertEqual(len(document.getElementsByTagName("Placemark")), 2)
+        begin = document.getElementsByTagName("begin")[1].firstChild.data
+        self.assertEqual(begin, datestr(10))
+
+
+class TestSyntheticTracks(TestCase):
+    def test_deterministic_tracks(self):
+        tracks = synthetic_tracks(1000, entities=7, seed=3)
+        self.assertEqual(len(tracks), 1000)
+        self.assertEqual(tracks.name.nunique(), 7)
+        pd.testing.assert_frame_equal(tracks, synthetic_tracks(1000, entities=7, seed=3))
+        self.assertTrue((tracks.groupby("name").timestamp.diff().dropna() > 0).all())
+
+
+class TestProfiler(TestCase):
+    def test_greedy_counters(self):
+        prisms = PrismArray.from_prisms(random_prisms(300))
+        profiler = Profiler(sample_interval=10)
+        out_prisms = Greedy().run(prisms, 0, profiler=profiler)
+        profile = profiler.to_dict()
+
+        counters = profile["counters"]
+        self.assertEqual(counters["merges"], len(prisms) - len(out_prisms))
+        self.assertEqual(counters["rtree_queries"], len(prisms) + counters["merges"])
+        self.assertGreaterEqual(counters["candidate_pairs"], counters["merges"])
+        self.assertIn("stale_skipped", counters)
+        for phase in ["index_build", "candidate_generation", "greedy_loop"]:
+            self.assertEqual(profile["phases"][phase]["calls"], 1)
+        sizes = profile["series"]["candidate_set_size"]
+        self.assertEqual([s[0] for s in sizes[:3]], [0, 10, 20])
+
+        # workers send their profiles back to the parent's profiler
+        parallel = Profiler()
+        Greedy().run(prisms, 0, workers=2, profiler=parallel)
+        self.assertEqual(parallel.counters["merges"], counters["merges"])
+
+
+class TestTracks(TestCase):
+    def test_compress_tracks(self):
+        # track a moves 10 m a point and collapses, b jumps 500 m and does not
+        prisms = PrismArray(
+            x=[0, 10, 20, 0, 500, 1000],
+            y=[0] * 6,
+            timestamp=[2, 1, 0, 0, 1, 2],
+            x_buffer=100,
+            y_buffer=100,
+            temporal_buffer=60,
+            names=["a", "a", "a", "b", "b", "b"],
+        )
+        df = compress_tracks(prisms)
+        self.assertEqual(list(df.name), ["a", "b", "b", "b"])
+        self.assertEqual(df.bounds[0], (-100.0, -100.0, -60.0, 120.0, 100.0, 62.0))
+        self.assertEqual(sorted(df.boxes_inside[0]), sorted(prisms.uuid[:3].tolist()))
+        self.assertEqual(list(df.unique_id[1:]), prisms.uuid[3:].tolist())
+
+    def test_group_by_name_merges_within_tracks(self):
+        prisms = PrismArray.from_prisms(random_prisms(300))
+        prisms.name_codes = np.arange(len(prisms), dtype=np.int32) % 3
+        prisms.name_categories = np.array(["a", "b", "c"], dtype=object)
+
+        alg = Greedy()
+        alg.run(prisms, 0, group_by_name=True, workers=2, build_prisms=False)
+        table = alg.inside_table
+        in_names = dict(zip(prisms.uuid.tolist(), prisms.names))
+        merged_names = table.inner_id.map(in_names).groupby(table.merged_id).nunique()
+        self.assertTrue((merged_names == 1).all())
+        self.assertEqual(sorted(table.inner_id), sorted(prisms.uuid.tolist()))
+
+
+class TestGridIndex(TestCase):
+    def test_matches_rtree(self):
+        rng = np.random.default_rng(0)
+        mins = rng.uniform(0, 100, (500, 3))
+        bounds = np.hstack([mins, mins + rng.uniform(0.5, 3, (500, 3))])
+        grid, rtree_index = create_grid(bounds), create_rtree(bounds)
+        for i in range(0, 500, 2):
+            grid.delete(i, bounds[i])
+            rtree_index.delete(i, bounds[i].tolist())
+        # a box over many cells and one over the whole space
+        for i, box in [(0, [10, 10, 10, 60, 60, 60]), (2, [-1e9] * 3 + [1e9] * 3)]:
+            grid.insert(i, box)
+            rtree_index.insert(i, box)
+
+        queries = np.hstack([mins - 1, bounds[:, 3:] + 1])
+        for query in queries[:100]:
+            self.assertEqual(
+                sorted(grid.intersection(query)),
+                sorted(rtree_index.intersection(query.tolist())),
+            )
+        hits, counts = grid.intersection_v(queries[:, :3], queries[:, 3:])
+        expected, expected_counts = rtree_index.intersection_v(
+            queries[:, :3], queries[:, 3:]
+        )
+        self.assertEqual(counts.tolist(), expected_counts.tolist())
+        self.assertEqual(
+            [sorted(h) for h in np.split(hits, np.cumsum(counts)[:-1])],
+            [sorted(h) for h in np.split(expected, np.cumsum(counts)[:-1])],
+        )
+
+    def test_greedy_matches_rtree(self):
+        df = df_for_greedy(random_prisms(300))
+        for coef in [0, 1e8]:
+            expected = result_bounds(greedy(df, coef))
+            for top_k in [None, 2]:
+                results = greedy(df, coef, top_k=top_k, index="grid")
+                self.assertEqual(result_bounds(results), expected)
+
+
+class TestResultCache(TestCase):
+    def test_key_and_lru_eviction(self):
+        points = pd.DataFrame(
+            {
+                "latitude": [1.0, 2.0],
+                "longitude": [3.0, 4.0],
+                "timestamp": [5.0, 6.0],
+                "name": ["a", "b"],
+            }
+        )
+        key = cache_key(points, {"coef": 0})
+        self.assertEqual(key, cache_key(points.copy(), {"coef": 0}))
+        self.assertNotEqual(key, cache_key(points, {"coef": 1}))
+        self.assertNotEqual(key, cache_key(points.assign(name=["a", "c"]), {"coef": 0}))
+
+        bounds = np.arange(60, dtype=np.float64).reshape(10, 6)
+        with tempfile.TemporaryDirectory() as tmp:
+            # room for two results
+            cache = ResultCache(tmp, max_bytes=2 * (bounds.nbytes + 128))
+            self.assertIsNone(cache.get("a"))
+            for name in ["a", "b"]:
+                cache.put(name, bounds)
+                os.utime(os.path.join(tmp, name + ".npy"), (0, ord(name)))
+            # reading a makes b the least recently used
+            np.testing.assert_array_equal(cache.get("a"), bounds)
+            cache.put("c", bounds)
+            self.assertIsNone(cache.get("b"))
+            self.assertIsNotNone(cache.get("a"))
+            self.assertIsNotNone(cache.get("c"))
+
+            # evicted by another run between the read and the utime
+            with mock.patch("os.utime", side_effect=FileNotFoundError):
+                np.testing.assert_array_equal(cache.get("c"), bounds)
+
+
+class TestIncrementalGreedy(TestCase):
+    def test_one_update_matches_greedy(self):
+        df = df_for_greedy(random_prisms(300))
+        for coef in [0, 1e8]:
+            state = IncrementalGreedy(coef, index="grid")
+            state.update(df)
+            expected = result_bounds(greedy(df, coef))
+            self.assertEqual(result_bounds(state.results()), expected)
+
+    def test_resume_from_saved_state(self):
+        df = df_for_greedy(random_prisms(300))
+        order = np.argsort([bounds[2] for bounds in df.bounds])
+        first, second = df.iloc[order[:150]], df.iloc[order[150:]]
+
+        state = IncrementalGreedy()
+        state.update(first)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "state.npz")
+            state.save(path)
+            loaded = IncrementalGreedy.load(path)
+        expected = result_bounds(state.results())
+        self.assertEqual(result_bounds(loaded.results()), expected)
+
+        loaded.update(second)
+        results = loaded.results()
+        # every input prism is in exactly one output box
+        self.assertEqual(covered_ids(results, df), sorted(df.unique_id))
+
+        horizon = loaded.latest - 600
+        evicted = loaded.evict(horizon)
+        self.assertTrue((np.array(evicted.bounds.tolist())[:, 5] < horizon).all())
+        self.assertEqual(len(evicted) + len(loaded), len(results))
+
+
+class TestSweep(TestCase):
+    def test_matches_single_runs(self):
+        points = synthetic_tracks(300, entities=3, seed=1)
+        summary, results = sweep(
+            points.longitude,
+            points.latitude,
+            points.timestamp,
+            points.name,
+            coefs=[0, 1e7],
+            temporal_buffers=[600],
+            distance_buffers=[100, 200],
+            workers=1,
+        )
+        self.assertEqual(len(summary), 4)
+        self.assertEqual(list(summary.coef), [0, 0, 1e7, 1e7])
+        self.assertEqual(list(summary.queries), [len(r) for r in results])
+
+        prisms = create_prisms_by_ll(
+            points.longitude,
+            points.latitude,
+            points.timestamp,
+            points.name,
+            temporal_buffer=600,
+            x_buffer=200,
+            y_buffer=200,
+        )
+        expected = greedy(df_for_greedy(prisms), 1e7)
+        self.assertEqual(summary.queries[3], len(expected))
+
+        # the options of Greedy.run apply to every combination
+        summary, _ = sweep(
+            points.longitude,
+            points.latitude,
+            points.timestamp,
+            points.name,
+            coefs=[1e7],
+            temporal_buffers=[600],
+            distance_buffers=[200],
+            workers=1,
+            options={"engine": "rounds"},
+        )
+        expected = round_greedy(df_for_greedy(prisms), 1e7)
+        self.assertEqual(summary.queries[0], len(expected))
+
+        with mock.patch(
+            "final_project.algorithms.greedy.create_index", wraps=create_index
+        ) as spy:
+            sweep(
+                points.longitude,
+                points.latitude,
+                points.timestamp,
+                points.name,
+                coefs=[0],
+                temporal_buffers=[600],
+                distance_buffers=[100],
+                workers=1,
+                options={"index": "grid"},
+            )
+        self.assertTrue(spy.called)
+        self.assertEqual({call.args[2] for call in spy.call_args_list}, {"grid"})
+
+
+class TestMergeHistory(TestCase):
+    def test_replay_matches_greedy(self):
+        df = df_for_greedy(random_prisms(300))
+        history = MergeHistory()
+        results = greedy(df, 0, history=history)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "history.npz")
+            history.save(path)
+            history = MergeHistory.load(path)
+
+        self.assertEqual(result_bounds(history.replay()), result_bounds(results))
+        self.assertEqual(history.prefix(), len(df) - len(results))
+        # a budget below greedy's result replays merges past delta_c 0
+        budget = len(results) - 20
+        self.assertEqual(len(history.replay(max_queries=budget)), budget)
+        self.assertEqual(len(history.replay(max_queries=len(df) + 5)), len(df))
+        loose = history.replay(max_delta=1e12)
+        self.assertEqual(len(loose), len(df) - len(history))
+
+
+class TestAnytimeGreedy(TestCase):
+    def test_stops_with_a_valid_result(self):
+        df = df_for_greedy(random_prisms(300))
+        complete = greedy(df, 0)
+        for kwargs in [{"max_merges": 10}, {"time_budget": 0}]:
+            profiler = Profiler()
+            results = greedy(df, 0, profiler=profiler, **kwargs)
+            self.assertEqual(profiler.counters["stopped_early"], 1)
+            self.assertEqual(len(results), len(df) - kwargs.get("max_merges", 0))
+            self.assertGreater(len(results), len(complete))
+            # every input is still in exactly one output box
+            self.assertEqual(covered_ids(results, df), sorted(df.unique_id))
+
+
+class TestRoundGreedy(TestCase):
+    def test_greedy_matching(self):
+        rng = np.random.default_rng(0)
+        box_1 = rng.integers(0, 50, 400)
+        box_2 = rng.integers(0, 50, 400)
+        deltas = rng.normal(size=400)
+        picked = greedy_matching(box_1, box_2, deltas, 50)
+
+        # the same picks one candidate at a time in delta_c order
+        used, expected = set(), []
+        for i in np.argsort(deltas, kind="stable").tolist():
+            if box_1[i] not in used and box_2[i] not in used:
+                used.update([box_1[i], box_2[i]])
+                expected.append(i)
+        self.assertEqual(picked.tolist(), expected)
+
+    def test_close_to_greedy(self):
+        df = df_for_greedy(random_prisms(300))
+        exact = greedy(df, 0)
+        profiler = Profiler()
+        results = round_greedy(df, 0, profiler=profiler, index="grid")
+        self.assertLess(profiler.counters["rounds"], profiler.counters["merges"])
+        self.assertLess(abs(len(results) - len(exact)), 0.05 * len(exact))
+
+        self.assertEqual(covered_ids(results, df), sorted(df.unique_id))
+        # merged boxes got global ids
+        self.assertTrue((results.unique_id >= 0).all())
+
+
+class TestWindows(TestCase):
+    def test_sorted_windows(self):
+        points = synthetic_tracks(500, entities=5, seed=2)
+        points = points.sample(frac=1, random_state=0)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "points.csv")
+            points.to_csv(path, index=False)
+            runs = sort_points(path, 0, 1, 2, 3, directory=tmp, chunksize=120)
+            self.assertEqual(len(runs.runs), 5)
+            windows = [window for _, window in runs.windows(600)]
+
+        joined = pd.concat(windows, ignore_index=True)
+        self.assertEqual(len(joined), len(points))
+        self.assertTrue(joined.timestamp.is_monotonic_increasing)
+        expected = points.sort_values("timestamp", kind="stable")
+        self.assertEqual(list(joined.name), list(expected.name))
+
+    def test_windowed_greedy(self):
+        points = synthetic_tracks(500, entities=5, seed=2)
+        prisms = create_prisms_by_ll(
+            points.longitude,
+            points.latitude,
+            points.timestamp,
+            points.name,
+            temporal_buffer=300,
+            x_buffer=100,
+            y_buffer=100,
+        )
+        expected = len(greedy(df_for_greedy(prisms), 0))
+
+        # one window is greedy itself, with the boxes final before the end first
+        whole = list(windowed_greedy([points], 300, 100))
+        self.assertEqual(sum(len(b) for b in whole), expected)
+
+        starts = np.arange(points.timestamp.min(), points.timestamp.max() + 1, 1800)
+        windows = [
+            points[(points.timestamp >= start) & (points.timestamp < start + 1800)]
+            for start in starts
+        ]
+        self.assertEqual(sum(len(w) for w in windows), len(points))
+        queries = sum(len(b) for b in windowed_greedy(windows, 300, 100))
+        self.assertLess(abs(queries - expected), 0.1 * expected)